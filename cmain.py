@@ -1,19 +1,11 @@
 #! /usr/bin/env python3
 
-from codeschematics.parsers.c_parser import make_call_dict
-from codeschematics.presentation import Presenter
+# Kept for old habits: this is now just `python -m codeschematics --language c`
 
-from sys import argv
-from os.path import basename
+from codeschematics.cli import main
 
-################################################################################
-
-fname = argv[1]
+from sys import argv, exit
 
-dic, nested = make_call_dict(fname) # Ignore the nested funcs retval
-
-tree = Presenter(dic)
+################################################################################
 
-fname = basename(fname)
-tree = tree.default_filter()
-tree.to_svg(fname)
+exit(main(['--language', 'c'] + argv[1:]))
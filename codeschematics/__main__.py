@@ -0,0 +1,9 @@
+# Note: tab depth is 5, as a personal preference
+
+# So that `python -m codeschematics ...` runs the command line tool
+
+import sys
+
+from codeschematics.cli import main
+
+sys.exit(main())
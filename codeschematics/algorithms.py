@@ -0,0 +1,170 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Plain graph algorithms shared by the rest of the package. They work on any graph
+given as a sequence of nodes and a successors function, and are all iterative, so
+they don't hit the recursion limit on the deep call chains of large projects.'''
+
+
+def strongly_connected_components(nodes, successors):
+     '''Tarjan's algorithm. Returns the list of strongly connected components (each a
+     list of nodes), in reverse topological order: every component comes before any
+     component that calls into it. Linear in the size of the graph.'''
+     index = {}
+     lowlink = {}
+     on_stack = set()
+     stack = []
+     components = []
+     counter = 0
+     for start in nodes:
+          if start in index:
+               continue
+          # Each work item is a node and an iterator over its remaining successors
+          index[start] = lowlink[start] = counter
+          counter += 1
+          stack.append(start)
+          on_stack.add(start)
+          work = [(start, iter(successors(start)))]
+          while work:
+               node, children = work[-1]
+               for child in children:
+                    if child not in index:
+                         index[child] = lowlink[child] = counter
+                         counter += 1
+                         stack.append(child)
+                         on_stack.add(child)
+                         work.append((child, iter(successors(child))))
+                         break
+                    elif child in on_stack:
+                         lowlink[node] = min(lowlink[node], index[child])
+               else: # All children done
+                    work.pop()
+                    if work:
+                         parent = work[-1][0]
+                         lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index[node]:
+                         component = []
+                         while True:
+                              member = stack.pop()
+                              on_stack.discard(member)
+                              component.append(member)
+                              if member == node:
+                                   break
+                         component.reverse()
+                         components.append(component)
+     return components
+
+
+def array_components(offsets, targets):
+     """Tarjan's algorithm again, for a graph of nodes 0 to n-1 in flat arrays (as
+     deadcode.Reachability keeps it): node i's successors are targets[offsets[i]:
+     offsets[i+1]], so offsets has n+1 entries. Working on ints and lists rather than
+     dicts and iterators, it takes about half the time of strongly_connected_components.
+     Returns (component_of, members, starts): the component of each node, the nodes
+     grouped by component, and where each group starts in members (with len(members)
+     last). The components come in the same reverse topological order."""
+     n = len(offsets) - 1
+     index = [-1] * n
+     lowlink = [0] * n
+     component_of = [-1] * n # -1 while the node is on the stack (or unvisited)
+     members = []
+     starts = []
+     stack = []
+     counter = 0
+     for start in range(n):
+          if index[start] >= 0:
+               continue
+          index[start] = lowlink[start] = counter
+          counter += 1
+          stack.append(start)
+          # The work stack is two parallel lists: the nodes, and where each is up to in
+          # its successors
+          work, at = [start], [offsets[start]]
+          while work:
+               node = work[-1]
+               i, end = at[-1], offsets[node + 1]
+               while i < end:
+                    child = targets[i]
+                    i += 1
+                    child_index = index[child]
+                    if child_index < 0:
+                         at[-1] = i
+                         index[child] = lowlink[child] = counter
+                         counter += 1
+                         stack.append(child)
+                         work.append(child)
+                         at.append(offsets[child])
+                         break
+                    if component_of[child] < 0 and child_index < lowlink[node]:
+                         lowlink[node] = child_index
+               else: # All children done
+                    work.pop()
+                    at.pop()
+                    low = lowlink[node]
+                    if work and low < lowlink[work[-1]]:
+                         lowlink[work[-1]] = low
+                    if low == index[node]:
+                         component = len(starts)
+                         starts.append(len(members))
+                         while True:
+                              member = stack.pop()
+                              component_of[member] = component
+                              members.append(member)
+                              if member == node:
+                                   break
+     starts.append(len(members))
+     return component_of, members, starts
+
+
+def longest_path_levels(nodes, successors):
+     '''Returns a dict of each node --> its level: the length of the longest path to
+     it from a node nothing calls. Cycles would make that infinite, so each strongly
+     connected component is treated as a single node, and all its members share a
+     level. Linear in the size of the graph.'''
+     components = strongly_connected_components(nodes, successors)
+     component_of = {}
+     for i, component in enumerate(components):
+          for node in component:
+               component_of[node] = i
+     level = [0] * len(components)
+     # Callers come before their callees in reversed order, so each component's level
+     # is final by the time it's pushed on to its callees
+     for i in reversed(range(len(components))):
+          below = level[i] + 1
+          for node in components[i]:
+               for child in successors(node):
+                    j = component_of[child]
+                    if j != i and level[j] < below:
+                         level[j] = below
+     return {node: level[component_of[node]] for node in component_of}
+
+
+def shortest_path_levels(roots, successors):
+     '''Returns a dict of each node reachable from the roots --> its level: the length
+     of the shortest path to it from any of the roots (which are level 0). A breadth
+     first search, so cycles need no special handling.'''
+     levels = dict.fromkeys(roots, 0)
+     queue = list(levels)
+     for node in queue: # queue grows as we go
+          below = levels[node] + 1
+          for child in successors(node):
+               if child not in levels:
+                    levels[child] = below
+                    queue.append(child)
+     return levels
@@ -0,0 +1,334 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''The batch processing half of the command line tool: expands paths into source
+files, then parses, filters and renders each one, in parallel worker processes if
+asked to. Each file is handled independently, so the work is embarrassingly
+parallel; the only shared state is the (process safe) parse cache.'''
+
+import glob as _glob
+import json as _json
+import os as _os
+import time as _time
+from collections import OrderedDict as _OrderedDict
+
+from codeschematics import instrument as _instrument
+from codeschematics.cache import GraphCache, cached_parse, detect_language
+from codeschematics.filters import FilterPipeline
+from codeschematics.html_output import write_html
+from codeschematics.presentation import Presenter
+from codeschematics.summarize import summarize
+
+
+def expand_paths(patterns):
+     '''Expands the given files, directories and glob patterns into a sorted list of
+     the source files they contain (directories are searched recursively for files
+     with a known parser). Raises ValueError for a pattern that matches nothing.'''
+     out = []
+     for pattern in patterns:
+          matches = sorted(_glob.glob(pattern, recursive=True)) if _glob.has_magic(pattern) else [pattern]
+          if not matches or not all(_os.path.exists(match) for match in matches):
+               raise ValueError('no such file: {}'.format(pattern))
+          for match in matches:
+               if _os.path.isdir(match):
+                    for dirpath, dirnames, filenames in _os.walk(match):
+                         dirnames.sort()
+                         for fname in sorted(filenames):
+                              # JSON and .pyc files are only ever inputs when explicitly
+                              # named (the latter would duplicate their sources)
+                              if detect_language(fname) not in (None, 'json', 'bytecode'):
+                                   out.append(_os.path.join(dirpath, fname))
+               else:
+                    out.append(match)
+     return list(_OrderedDict.fromkeys(out)) # Dedupe, keeping order
+
+
+class Options:
+     '''The (picklable) settings for processing one file. Any of the attributes may be
+     None to mean "the default".'''
+
+     def __init__(self, format='svg', output_dir='.', cache_dir=None, language=None,
+                  roots=None, max_depth=None, filtered=True, parser_args=None, instrument=None,
+                  max_nodes=None, ignore=None, ignore_globs=None, ignore_regexes=None,
+                  exclude_nested=False, min_degree=None, depth_order=None, reuse_layout=False):
+          self.format = format
+          self.output_dir = output_dir
+          self.cache_dir = cache_dir
+          self.language = language
+          self.roots = roots
+          self.max_depth = max_depth
+          self.filtered = filtered
+          self.parser_args = parser_args or {}
+          self.instrument = instrument # None, or the kwargs for instrument.enable() in workers
+          self.max_nodes = max_nodes
+          self.ignore = ignore or []
+          self.ignore_globs = ignore_globs or []
+          self.ignore_regexes = ignore_regexes or []
+          self.exclude_nested = exclude_nested
+          self.min_degree = min_degree
+          self.depth_order = depth_order # None (call order), 'longest' or 'shortest'
+          self.reuse_layout = reuse_layout
+
+     def make_pipeline(self, nested_funcs=()):
+          '''Returns the FilterPipeline for these options'''
+          pipeline = FilterPipeline()
+          if self.filtered:
+               pipeline.undefined()
+          pipeline.ignore(*self.ignore).ignore_glob(*self.ignore_globs).ignore_regex(*self.ignore_regexes)
+          if self.exclude_nested:
+               pipeline.exclude_nested(nested_funcs)
+          if self.min_degree:
+               pipeline.min_degree(self.min_degree)
+          if self.roots or self.max_depth is not None:
+               pipeline.reachable(self.roots or None, self.max_depth)
+          return pipeline
+
+
+def render(presenter, format, basename, depth_order=None, reuse_layout=False):
+     '''Writes the presenter (or Summary) to "{basename}.{format}". Besides the graphviz
+     formats, "txt" is the plain text view, "json" is the call dict and "html" is the
+     interactive page (see html_output). depth_order is passed on to a Presenter's text
+     and graphviz views (as their ranks). With reuse_layout, a Presenter's graphviz
+     layout is kept in "{basename}.layout" and reused by the next render.'''
+     if not isinstance(presenter, Presenter):
+          depth_order = None
+          reuse_layout = False
+     if format == 'txt':
+          with open(basename + '.txt', 'w') as f:
+               text = presenter.to_plain_text(depth_order=depth_order) if depth_order else presenter.to_plain_text()
+               f.write(text + '\n')
+     elif format == 'json':
+          with open(basename + '.json', 'w') as f:
+               _json.dump(presenter.call_dict(), f, indent=1)
+     elif format == 'html':
+          write_html(getattr(presenter, 'presenter', presenter), basename + '.html')
+     elif depth_order or reuse_layout:
+          presenter.graphviz_render(format, basename, ranks=depth_order,
+                                    layout=basename + '.layout' if reuse_layout else None)
+     else:
+          presenter.graphviz_render(format, basename)
+
+
+def process_file(path, options):
+     '''Parses, filters and renders one file. Returns a dict of the output filename (or
+     None if nothing was written) and the time spent in each phase.'''
+     with _instrument.span('file', file=path):
+          return _process_file(path, options)
+
+def _process_file(path, options):
+     timings = _OrderedDict()
+     start = _time.perf_counter()
+     cache = GraphCache(options.cache_dir) if options.cache_dir else None
+     language = options.language or detect_language(path)
+     kwargs = options.parser_args.get(language, {})
+     dic, nested = cached_parse(path, cache, language, **kwargs)
+     timings['parse'] = _time.perf_counter() - start
+
+     start = _time.perf_counter()
+     presenter = Presenter(dic)
+     timings['build'] = _time.perf_counter() - start
+
+     return _present(presenter, nested, options, path, timings)
+
+
+def _present(presenter, nested, options, path, timings):
+     # The filter and render phases, shared by process_file and process_focused
+     start = _time.perf_counter()
+     # All the filters run in a single pass
+     presenter = options.make_pipeline(nested).apply(presenter)
+     output = None
+     if options.roots and not presenter.functions():
+          presenter = None # None of the roots are defined here
+     if presenter is not None and options.max_nodes and len(presenter.functions()) > options.max_nodes:
+          with _instrument.span('summarize', file=path):
+               presenter = summarize(presenter, options.max_nodes)
+     timings['filter'] = _time.perf_counter() - start
+
+     start = _time.perf_counter()
+     if presenter is not None:
+          basename = _os.path.join(options.output_dir, _os.path.basename(path))
+          render(presenter, options.format, basename, options.depth_order, options.reuse_layout)
+          output = basename + '.' + options.format
+     timings['render'] = _time.perf_counter() - start
+     return {'path': path, 'output': output, 'timings': timings}
+
+
+def process_focused(paths, options):
+     '''Treats the paths as one project, and writes a single diagram of the functions
+     below options.roots, named after the roots. Only the files reachable from the
+     roots are parsed, as found through a DefinitionIndex (kept in the cache directory,
+     if any). Returns a dict like process_file's.'''
+     from codeschematics.index import DefinitionIndex, focused_parse
+     name = '+'.join(options.roots)
+     timings = _OrderedDict()
+     with _instrument.span('focused', roots=name):
+          start = _time.perf_counter()
+          index = DefinitionIndex(options.cache_dir)
+          index.update(paths, options.language)
+          timings['index'] = _time.perf_counter() - start
+
+          start = _time.perf_counter()
+          cache = GraphCache(options.cache_dir) if options.cache_dir else None
+          dic, nested = focused_parse(options.roots, index, cache, options.language,
+                                      options.max_depth, options.parser_args)
+          timings['parse'] = _time.perf_counter() - start
+
+          start = _time.perf_counter()
+          presenter = Presenter(dic)
+          timings['build'] = _time.perf_counter() - start
+          return _present(presenter, nested, options, name, timings)
+
+
+def process_linked(paths, options, name):
+     '''Parses the C files among the paths and links them into one program (see
+     linker), writing a single diagram named name. Returns a dict like
+     process_file's. The units are parsed afresh, one after another: the cache holds no
+     static functions for the linker, so options.cache_dir isn't used.'''
+     from codeschematics.linker import link_files
+     timings = _OrderedDict()
+     with _instrument.span('linked', graph=name):
+          start = _time.perf_counter()
+          paths = [path for path in paths if (options.language or detect_language(path)) == 'c']
+          units = [_os.path.relpath(path) for path in paths]
+          dic, nested = link_files(paths, units, **options.parser_args.get('c', {}))
+          timings['parse'] = _time.perf_counter() - start
+
+          start = _time.perf_counter()
+          presenter = Presenter(dic)
+          timings['build'] = _time.perf_counter() - start
+          return _present(presenter, nested, options, name, timings)
+
+
+def process_merged(paths, options, name, jobs=1):
+     """Parses all the paths and merges them into one call graph (see merge), writing a
+     single diagram named name. With more than one job, each worker process parses and
+     merges a share of the files, and then their results are merged. Returns a dict
+     like process_file's."""
+     from codeschematics.merge import merge
+     timings = _OrderedDict()
+     with _instrument.span('merged', graph=name):
+          start = _time.perf_counter()
+          if jobs == 1 or len(paths) <= 1:
+               dic, nested = _parse_and_merge(paths, options)
+          else:
+               from concurrent.futures import ProcessPoolExecutor
+               workers = min(jobs or _os.cpu_count() or 1, len(paths))
+               # Contiguous chunks, so the result is the same as merging in one process
+               size = -(-len(paths) // workers) # Ceiling division
+               chunks = [paths[i:i+size] for i in range(0, len(paths), size)]
+               with ProcessPoolExecutor(workers) as pool:
+                    dic, nested = merge(pool.map(_parse_and_merge, chunks, [options]*len(chunks)))
+          timings['parse'] = _time.perf_counter() - start
+
+          start = _time.perf_counter()
+          presenter = Presenter(dic)
+          timings['build'] = _time.perf_counter() - start
+          return _present(presenter, nested, options, name, timings)
+
+
+def process_progressive(paths, options, name, budget=None, interval=1.0, callback=None):
+     '''Like process_merged, but parses the files nearest options.roots first (see
+     progressive), stopping once budget seconds have passed, and writes the graph
+     parsed so far. callback(presenter, progress), if given, is called with each
+     snapshot along the way. Returns a dict like process_file's, with the final
+     progress.Progress as 'progress'.'''
+     from codeschematics.progressive import analyze
+     timings = _OrderedDict()
+     with _instrument.span('progressive graph', graph=name):
+          index = None
+          if options.roots: # As for process_focused, kept in the cache directory if any
+               from codeschematics.index import DefinitionIndex
+               start = _time.perf_counter()
+               index = DefinitionIndex(options.cache_dir)
+               index.update(paths, options.language)
+               timings['index'] = _time.perf_counter() - start
+               if budget is not None:
+                    budget = max(budget - timings['index'], 0)
+
+          start = _time.perf_counter()
+          cache = GraphCache(options.cache_dir) if options.cache_dir else None
+          presenter, progress = analyze(paths, options.roots or (), index, cache, options.language,
+                                        options.parser_args, budget, interval, callback)
+          timings['parse'] = _time.perf_counter() - start
+          result = _present(presenter, progress.nested_funcs, options, name, timings)
+          result['progress'] = progress
+          return result
+
+
+def _parse_and_merge(paths, options):
+     # The worker half of process_merged
+     from codeschematics.merge import merge
+     cache = GraphCache(options.cache_dir) if options.cache_dir else None
+     def parse(path):
+          language = options.language or detect_language(path)
+          return cached_parse(path, cache, language, **options.parser_args.get(language, {}))
+     return merge(parse(path) for path in paths)
+
+
+def find_dead_code(paths, options):
+     """Parses all the paths as one program, and returns an OrderedDict of each path -->
+     its functions unreachable from options.roots (or by default from main and the top
+     level code; see deadcode)"""
+     from codeschematics.deadcode import unreachable_by_file
+     cache = GraphCache(options.cache_dir) if options.cache_dir else None
+     def parse(path):
+          language = options.language or detect_language(path)
+          return path, cached_parse(path, cache, language, **options.parser_args.get(language, {}))[0]
+     with _instrument.span('dead code', files=len(paths)):
+          return unreachable_by_file((parse(path) for path in paths), options.roots or None)
+
+
+def process_files(paths, options, jobs=1):
+     '''Runs process_file over all the paths, with up to jobs worker processes (jobs=None
+     means one per CPU). Yields the results in the order of the paths. A file that fails
+     to parse yields a result with an 'error' key rather than stopping the batch.'''
+     if jobs == 1 or len(paths) <= 1:
+          for path in paths:
+               yield _safe_process_file(path, options)
+          return
+     from concurrent.futures import ProcessPoolExecutor
+     with ProcessPoolExecutor(jobs) as pool:
+          for result in pool.map(_worker_process_file, paths, [options]*len(paths)):
+               if 'instrument' in result:
+                    _instrument.merge(result.pop('instrument'))
+               yield result
+
+
+def _worker_process_file(path, options):
+     # The workers have their own instrumentation state, which is shipped back to the
+     # parent with each result
+     if options.instrument is None:
+          return _safe_process_file(path, options)
+     _instrument.reset()
+     _instrument.enable(**options.instrument)
+     try:
+          result = _safe_process_file(path, options)
+     finally:
+          _instrument.disable()
+     result['instrument'] = _instrument.export()
+     _instrument.reset()
+     return result
+
+
+def _safe_process_file(path, options):
+     try:
+          return process_file(path, options)
+     except Exception as e: # The parsers raise all sorts of things on bad input
+          return {'path': path, 'output': None, 'timings': {},
+                  'error': '{}: {}'.format(e.__class__.__name__, e)}
@@ -0,0 +1,197 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''This module glues the two halves of the package together: it picks the right
+parser for a source file, and keeps the parsed (function_def_dict, nested_funcs)
+results in an on-disk cache, so that a file need only be parsed again when it
+actually changes.
+
+The call dicts are stored as JSON (as noted in the presentation module, they're
+trivially representable as such), one file per parsed source file.'''
+
+import hashlib as _hashlib
+import json as _json
+import os as _os
+from collections import OrderedDict as _OrderedDict
+
+from codeschematics import instrument as _instrument
+from codeschematics.sites import CallSites
+
+
+################################################################################
+# Parser selection
+
+# File extension --> language name. The parser modules are imported only
+# when needed, so that e.g. Python-only users needn't have pycparser installed
+_LANGUAGES = {'.py':   'python',
+              '.pyw':  'python',
+              '.pyc':  'bytecode',
+              '.c':    'c',
+              '.h':    'c',
+              '.json': 'json',
+             }
+
+def detect_language(filename):
+     '''Returns the name of the language of the given file, as judged from its extension,
+     or None if there's no parser for it'''
+     return _LANGUAGES.get(_os.path.splitext(filename)[1].lower())
+
+
+def load_json(filename):
+     '''Loads a call dict that was dumped to JSON by some other tool. The file should
+     contain a single object mapping function names to lists of called function names.
+     There are no nested functions in such a file.'''
+     with open(filename) as f:
+          dic = _json.load(f, object_pairs_hook=_OrderedDict)
+     return _OrderedDict((func, tuple(calls)) for func, calls in dic.items()), set()
+
+
+def parse(filename, language=None, sites=None, **kwargs):
+     '''Parses the given file with the parser appropriate for its language, returning
+     the parser's (function_def_dict, set_of_nested_funcs) tuple. Any keyword arguments
+     are passed on to the parser's make_call_dict. If a sites.CallSites is given, the
+     calls' locations are recorded in it (JSON call dicts have none to record).'''
+     if language is None:
+          language = detect_language(filename)
+     if language == 'python':
+          from codeschematics.parsers.python_parser import make_call_dict
+     elif language == 'c':
+          from codeschematics.parsers.c_parser import make_call_dict
+     elif language == 'bytecode':
+          from codeschematics.parsers.bytecode_parser import make_call_dict
+     elif language == 'json':
+          make_call_dict = load_json
+     else:
+          raise ValueError("don't know how to parse {} (language {})".format(filename, language))
+     if sites is not None and language != 'json':
+          kwargs['sites'] = sites
+     return make_call_dict(filename, **kwargs)
+
+
+################################################################################
+# The cache proper
+
+class GraphCache:
+     '''A directory of parsed call graphs. Each entry is keyed on the absolute path of
+     its source file, and is only considered valid as long as the source's size and
+     modification time are unchanged.
+
+     The entries are written atomically (to a temp file which is then renamed), so
+     several processes may share one cache directory.'''
+
+     suffix = '.json'
+
+     def __init__(self, directory):
+          self.directory = directory
+          _os.makedirs(directory, exist_ok=True)
+
+     def entry_path(self, source):
+          '''Returns the path of the cache entry for the given source file'''
+          source = _os.path.abspath(source)
+          digest = _hashlib.sha1(source.encode('utf-8', 'surrogateescape')).hexdigest()
+          name = _os.path.basename(source)
+          return _os.path.join(self.directory, '{}-{}{}'.format(name, digest[:16], self.suffix))
+
+     @staticmethod
+     def _stamp(source):
+          st = _os.stat(source)
+          return [st.st_size, st.st_mtime_ns]
+
+     def get(self, source, options=None, sites=None):
+          '''Returns the cached (function_def_dict, set_of_nested_funcs) for the given
+          source file, or None if there's no valid entry. The options are any parser
+          arguments that affect the result; an entry made with different options is
+          invalid. If a sites.CallSites is given, the entry's call sites are added to it,
+          and an entry stored without any is invalid.'''
+          try:
+               entry = self.read_entry(self.entry_path(source))
+               stamp = self._stamp(source)
+          except (OSError, ValueError):
+               return None
+          if entry['stamp'] != stamp or entry.get('options') != options:
+               return None
+          if sites is not None:
+               if entry.get('sites') is None:
+                    return None
+               try:
+                    sites.update(CallSites.from_json(entry['sites']))
+               except (KeyError, TypeError, ValueError):
+                    return None
+          return entry['calls'], entry['nested']
+
+     def put(self, source, dic, nested, options=None, sites=None):
+          '''Stores a parse result for the given source file, with its call sites if
+          given (a sites.CallSites of just this file's calls)'''
+          entry = _OrderedDict()
+          entry['source'] = _os.path.abspath(source)
+          entry['stamp'] = self._stamp(source)
+          entry['options'] = options
+          entry['calls'] = [[func, list(calls)] for func, calls in dic.items()]
+          entry['nested'] = sorted(nested)
+          if sites is not None:
+               entry['sites'] = sites.to_json()
+          path = self.entry_path(source)
+          tmp = '{}.{}.tmp'.format(path, _os.getpid())
+          with open(tmp, 'w') as f:
+               _json.dump(entry, f)
+          _os.replace(tmp, path)
+
+     def entries(self):
+          '''Returns the paths of all the entries currently in the cache'''
+          return sorted(_os.path.join(self.directory, name) for name in _os.listdir(self.directory)
+                        if name.endswith(self.suffix))
+
+     @staticmethod
+     def read_entry(path):
+          '''Reads a cache entry file, returning a dict with (at least) the keys 'source',
+          'stamp', 'calls' and 'nested'. The latter two are in the same form as any
+          parser's make_call_dict result.'''
+          with open(path) as f:
+               entry = _json.load(f)
+          entry['calls'] = _OrderedDict((func, tuple(calls)) for func, calls in entry['calls'])
+          entry['nested'] = set(entry['nested'])
+          return entry
+
+
+def cached_parse(filename, cache=None, language=None, sites=None, **kwargs):
+     '''Like parse(), but consults the given GraphCache first (and updates it after a
+     parse). With cache=None this is exactly parse(). The call sites, if wanted, are
+     cached along with the graph; they aren't a parser option.'''
+     if cache is None:
+          return parse(filename, language, sites, **kwargs)
+     keyed = kwargs
+     if kwargs.get('ignore'):
+          # Keyed on the names ignored rather than the packs named, since a pack file can
+          # change; a digest of them keeps the (hundreds of) names out of every entry
+          from codeschematics.parsers import ignore_packs
+          kwargs = dict(kwargs, ignore=ignore_packs.resolve(kwargs['ignore']))
+          names = '\n'.join(sorted(kwargs['ignore'])).encode('utf-8', 'surrogateescape')
+          keyed = dict(kwargs, ignore=_hashlib.sha1(names).hexdigest())
+     # Sets (e.g. of functions to ignore) are stored sorted, so they compare equal
+     options = _json.loads(_json.dumps(keyed, sort_keys=True, default=sorted)) if keyed else None
+     with _instrument.span('cache lookup', file=filename) as sp:
+          result = cache.get(filename, options, sites)
+          sp.set(hit=result is not None)
+     if result is None:
+          own = None if sites is None else CallSites() # Only this file's sites go in its entry
+          result = parse(filename, language, own, **kwargs)
+          cache.put(filename, result[0], result[1], options, own)
+          if sites is not None:
+               sites.update(own)
+     return result
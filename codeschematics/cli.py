@@ -0,0 +1,215 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''The command line interface to the package, run as `python -m codeschematics`.
+It takes any number of source files, directories and globs, detects each file's
+language, and writes one diagram per file. See --help for the options.'''
+
+import argparse as _argparse
+import re as _re
+import sys as _sys
+import time as _time
+
+from codeschematics import instrument as _instrument
+from codeschematics.parsers import ignore_packs
+from codeschematics.batch import (Options, expand_paths, find_dead_code, process_files, process_focused,
+                                  process_linked, process_merged, process_progressive)
+
+
+def make_arg_parser():
+     parser = _argparse.ArgumentParser(prog='codeschematics',
+                         description='Parse source files and diagram their function call'
+                         ' hierarchies, one diagram per file.')
+     parser.add_argument('paths', nargs='+', metavar='PATH',
+                         help='source files, directories (searched recursively) or globs')
+     parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                         help='parse and render with N worker processes (0 for one per CPU); --focus,'
+                         ' --link and --budget parse in one process, and ignore it')
+     parser.add_argument('-c', '--cache-dir', metavar='DIR',
+                         help='cache parse results in DIR, and reuse them for unchanged files')
+     parser.add_argument('-f', '--format', default='svg',
+                         help='output format: txt, json, html, or any graphviz format (default svg)')
+     parser.add_argument('-o', '--output-dir', default='.', metavar='DIR',
+                         help='where to write the output files (default the current directory)')
+     parser.add_argument('-r', '--roots', action='append', default=[], metavar='FUNC[,FUNC...]',
+                         help='only show these functions and what they call')
+     parser.add_argument('-F', '--focus', action='store_true',
+                         help='treat the paths as one project, parse only the files reachable from'
+                         ' the roots, and write one diagram named after them (in one process: --jobs'
+                         ' is ignored)')
+     parser.add_argument('-L', '--link', metavar='NAME',
+                         help='(C only) link the C files into one program, resolving static functions'
+                         ' per file, and write one diagram named NAME (not cached, and in one process:'
+                         ' --cache-dir and --jobs are ignored)')
+     parser.add_argument('-M', '--merge', metavar='NAME',
+                         help='merge all the files into one call graph, written as NAME.FORMAT')
+     parser.add_argument('-B', '--budget', type=float, metavar='SECONDS',
+                         help='(with --merge or --focus) parse the files nearest the roots first, and stop'
+                         ' after SECONDS, drawing whatever has been parsed by then')
+     parser.add_argument('--dead-code', action='store_true',
+                         help='instead of drawing anything, list the functions in each file that can\'t be '
+                              'reached from the roots (by default main and the top level code)')
+     parser.add_argument('-d', '--max-depth', type=int, metavar='N',
+                         help='only show calls up to N levels below the roots')
+     parser.add_argument('-n', '--max-nodes', type=int, metavar='N',
+                         help='collapse groups of functions into summary nodes until at most N are left')
+     parser.add_argument('--depth-order', choices=['longest', 'shortest'],
+                         help='list calls (txt) or rank nodes (graphviz) by their depth in the graph, '
+                              'by the longest or shortest call chain down to them')
+     parser.add_argument('--reuse-layout', action='store_true',
+                         help='keep each graph\'s layout next to its output, and lay out only what changed '
+                              'on the next run (needs neato)')
+     parser.add_argument('-l', '--language', choices=['python', 'bytecode', 'c', 'json'],
+                         help='parse every file as this language, rather than guessing from the extension')
+     parser.add_argument('--no-filter', action='store_true',
+                         help='keep the functions lacking a definition (the default filter removes them)')
+     parser.add_argument('-i', '--ignore', action='append', default=[], metavar='FUNC[,FUNC...]',
+                         help='remove these functions')
+     parser.add_argument('-g', '--ignore-glob', action='append', default=[], metavar='PATTERN',
+                         help='remove the functions matching this shell style pattern, e.g. "test_*"')
+     parser.add_argument('-x', '--ignore-regex', action='append', default=[], metavar='REGEX',
+                         help='remove the functions whose whole name matches this regular expression')
+     parser.add_argument('--ignore-pack', action='append', default=[], metavar='PACK',
+                         help='leave the calls to a pack of functions out while parsing: one of {}, '
+                              'or a file of names, one per line (the python packs are only used for '
+                              'Python, libc for C, and files for both)'.format(', '.join(ignore_packs.names())))
+     parser.add_argument('--no-nested', action='store_true',
+                         help='remove the functions defined inside other functions')
+     parser.add_argument('--min-degree', type=int, metavar='N',
+                         help='remove the functions with fewer than N calls in and out, in total')
+     parser.add_argument('-I', '--include', action='append', default=[], metavar='DIR',
+                         help='(C only) add DIR to the preprocessor include path')
+     parser.add_argument('-D', '--define', action='append', default=[], metavar='MACRO',
+                         help='(C only) define MACRO for the preprocessor')
+     parser.add_argument('--reuse-headers', action='store_true',
+                         help='(C only) parse the headers common to several files only once')
+     parser.add_argument('-t', '--timings', action='store_true',
+                         help='print the time spent in each phase, per file, to stderr')
+     parser.add_argument('--trace', metavar='FILE',
+                         help='record every phase and write a Chrome trace (chrome://tracing) to FILE')
+     parser.add_argument('--trace-json', metavar='FILE',
+                         help='record every phase and write a JSON summary of the time spent to FILE')
+     parser.add_argument('--trace-memory', action='store_true',
+                         help='also record the peak memory of each phase with tracemalloc (slow)')
+     return parser
+
+
+def main(argv=None):
+     args = make_arg_parser().parse_args(argv)
+     try:
+          paths = expand_paths(args.paths)
+     except ValueError as e:
+          print('codeschematics: {}'.format(e), file=_sys.stderr)
+          return 2
+
+     c_args = {}
+     if args.include:
+          c_args['include_dirs'] = args.include
+     if args.define:
+          c_args['defines'] = args.define
+     if args.reuse_headers:
+          c_args['header_cache'] = True
+     parser_args = {'c': c_args}
+     # Each language gets only its own packs (and the pack files), resolved once here
+     for language in ('python', 'bytecode', 'c'):
+          packs = ignore_packs.for_language(args.ignore_pack, language)
+          if packs:
+               try:
+                    parser_args.setdefault(language, {})['ignore'] = ignore_packs.resolve(packs)
+               except ValueError as e:
+                    print('codeschematics: {}'.format(e), file=_sys.stderr)
+                    return 2
+     roots = [func for arg in args.roots for func in arg.split(',') if func]
+     ignore = [func for arg in args.ignore for func in arg.split(',') if func]
+     for regex in args.ignore_regex:
+          try:
+               _re.compile(regex)
+          except _re.error as e:
+               print('codeschematics: bad --ignore-regex {!r}: {}'.format(regex, e), file=_sys.stderr)
+               return 2
+     instrument = None
+     if args.trace or args.trace_json:
+          instrument = {'memory': args.trace_memory}
+          _instrument.enable(**instrument)
+     options = Options(format=args.format, output_dir=args.output_dir, cache_dir=args.cache_dir,
+                       language=args.language, roots=roots, max_depth=args.max_depth,
+                       filtered=not args.no_filter, parser_args=parser_args,
+                       instrument=instrument, max_nodes=args.max_nodes, ignore=ignore,
+                       ignore_globs=args.ignore_glob, ignore_regexes=args.ignore_regex,
+                       exclude_nested=args.no_nested, min_degree=args.min_degree,
+                       depth_order=args.depth_order, reuse_layout=args.reuse_layout)
+
+     if args.focus and not roots:
+          print('codeschematics: --focus needs --roots', file=_sys.stderr)
+          return 2
+     if args.budget is not None and not (args.merge or args.focus):
+          print('codeschematics: --budget needs --merge or --focus', file=_sys.stderr)
+          return 2
+
+     start = _time.perf_counter()
+     status = 0
+     if args.dead_code:
+          try:
+               dead = find_dead_code(paths, options)
+          except Exception as e:
+               print('codeschematics: {}: {}'.format(e.__class__.__name__, e), file=_sys.stderr)
+               return 1
+          for path, funcs in dead.items():
+               if funcs:
+                    print('{}: {}'.format(path, ', '.join(funcs)))
+          return 0
+     if args.focus or args.link or args.merge:
+          try:
+               if args.link:
+                    results = [process_linked(paths, options, args.link)]
+               elif args.budget is not None and (args.merge or args.focus):
+                    callback = None
+                    if args.timings:
+                         def callback(presenter, progress):
+                              print('progress: {}'.format(progress), file=_sys.stderr)
+                    results = [process_progressive(paths, options, args.merge or '+'.join(roots),
+                                                   args.budget, callback=callback)]
+               elif args.merge:
+                    results = [process_merged(paths, options, args.merge, args.jobs or None)]
+               else:
+                    results = [process_focused(paths, options)]
+          except Exception as e: # As in the batch, report whatever the parsers raise
+               results = [{'path': args.link or args.merge or '+'.join(roots), 'output': None, 'timings': {},
+                           'error': '{}: {}'.format(e.__class__.__name__, e)}]
+     else:
+          results = process_files(paths, options, args.jobs or None)
+     for result in results:
+          if 'error' in result:
+               print('codeschematics: {}: {}'.format(result['path'], result['error']), file=_sys.stderr)
+               status = 1
+          elif result['output'] is None:
+               print('codeschematics: {}: none of the roots are defined here'.format(result['path']),
+                     file=_sys.stderr)
+          if args.timings and result['timings']:
+               phases = '  '.join('{} {:.3f}s'.format(phase, secs) for phase, secs in result['timings'].items())
+               print('{}: {}'.format(result['path'], phases), file=_sys.stderr)
+     if args.timings:
+          print('total: {} files in {:.3f}s'.format(len(paths), _time.perf_counter() - start), file=_sys.stderr)
+     if instrument is not None:
+          _instrument.disable()
+          if args.trace:
+               _instrument.write_chrome_trace(args.trace)
+          if args.trace_json:
+               _instrument.write_json(args.trace_json)
+     return status
@@ -0,0 +1,188 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Finds the defined functions that can't be reached from a set of entry points (by
+default "main" and the top level pseudo functions, "__module__" and "__file__"), i.e.
+the likely dead code.
+
+     reach = Reachability(presenter)
+     dead = reach.unreachable(['main', 'api_init'])
+
+Functions get integer IDs, interned in one pass over the calls, and the calls become
+two flat lists of ints: all the callees' IDs, and where each function's run of them
+starts. The plain yes or no questions are answered by a breadth first sweep from all
+the entry points at once, each level's successors gathered by a single set.update (so
+the per-edge work is done in C, not in Python bytecode). reached_by() says which
+entry points reach which functions: the strongly connected components are condensed
+over the arrays (once, on first use), and then each component gets a bitset (a
+Python int) of the entry points reaching it, in one pass over the condensation in
+topological order, a component's bits being ORed into each component it calls. Both
+are linear in the size of the graph (the latter times the number of entry points
+over the word size, for the ORs).
+
+It's all still Python, mind, and not fast: on a graph of 200,000 functions and a
+million calls, building takes about 1.2s, the first reached_by() 2.4s (mostly the
+condensing; later ones take 0.5s) and unreachable() 1.3s.'''
+
+from collections import OrderedDict as _OrderedDict
+from collections import defaultdict as _defaultdict
+from itertools import accumulate as _accumulate
+from itertools import chain as _chain
+from itertools import count as _count
+
+from codeschematics import instrument as _instrument
+from codeschematics.algorithms import array_components
+from codeschematics.presentation import Presenter
+
+
+ENTRY_POINTS = ('main', '__module__', '__file__')
+
+
+def default_entry_points(funcs):
+     '''Returns the functions among funcs that are entry points by default: those in
+     ENTRY_POINTS, and the top level pseudo functions of linked units ("unit:__file__")'''
+     return [func for func in funcs if func in ENTRY_POINTS or func.rpartition(':')[2] in ENTRY_POINTS[1:]]
+
+
+class Reachability:
+     '''The call graph of a Presenter (or call dict) in integer form, for reachability
+     queries from any set of entry points'''
+
+     def __init__(self, graph):
+          calls = graph.call_dict() if isinstance(graph, Presenter) else graph
+          self._graph = graph
+          with _instrument.span('Reachability.__init__') as sp:
+               # The defined functions first, then the rest in the order they're called:
+               # looking a callee up gives it the next ID if it hasn't one, so interning
+               # and converting the calls are one pass, all in C
+               self.defined = defined = len(calls) # IDs below this are the defined functions
+               ids = _defaultdict(_count(defined).__next__, zip(calls, range(defined)))
+               targets = list(map(ids.__getitem__, _chain.from_iterable(calls.values())))
+               ids.default_factory = None
+               names = list(ids)
+               offsets = [0]
+               offsets.extend(_accumulate(map(len, calls.values())))
+               offsets.extend([len(targets)] * (len(names) - defined)) # Undefined functions call nothing
+               self._ids = ids
+               self._names = names
+               self._offsets = offsets
+               self._targets = targets
+               self._component_of = None # The condensation, made on first use
+               sp.set(functions=len(names))
+
+     def _condense(self):
+          # The component of each function, the functions grouped by component (with
+          # the components in reverse topological order: callees first), and each call
+          # as the callee's component, in the same flat form as the calls themselves
+          if self._component_of is not None:
+               return
+          with _instrument.span('Reachability._condense') as sp:
+               component_of, members, starts = array_components(self._offsets, self._targets)
+               self._ctargets = list(map(component_of.__getitem__, self._targets))
+               self._members = members
+               self._starts = starts
+               self._component_of = component_of
+               sp.set(components=len(starts) - 1)
+
+     def _root_ids(self, roots):
+          if roots is None:
+               roots = default_entry_points(self._names)
+          return [self._ids[root] for root in roots if root in self._ids]
+
+     def _sweep(self, root_ids):
+          # Returns the bitset of the entry points reaching each component
+          self._condense()
+          component_of, members, starts = self._component_of, self._members, self._starts
+          offsets, ctargets = self._offsets, self._ctargets
+          bits = [0] * (len(starts) - 1)
+          for bit, node in enumerate(root_ids):
+               bits[component_of[node]] |= 1 << bit
+          for i in range(len(bits) - 1, -1, -1): # Callers first
+               mask = bits[i]
+               if mask:
+                    for node in members[starts[i]:starts[i+1]]:
+                         for j in ctargets[offsets[node]:offsets[node+1]]:
+                              bits[j] |= mask # Including i itself, harmlessly
+          return bits
+
+     def _reached(self, root_ids):
+          # Returns the set of IDs reachable from the roots, a level at a time
+          offsets, targets = self._offsets, self._targets
+          reached = set(root_ids)
+          level = reached
+          while level:
+               below = set()
+               below.update(*[targets[offsets[node]:offsets[node+1]] for node in level])
+               below -= reached
+               reached |= below
+               level = below
+          return reached
+
+     def reached_by(self, roots=None):
+          '''Returns a dict of each function --> the bitset (an int) of the entry points
+          reaching it, where bit i stands for roots[i] (the default entry points if
+          roots is None; names not in the graph are skipped, and take no bit)'''
+          with _instrument.span('Reachability.reached_by'):
+               bits = self._sweep(self._root_ids(roots))
+               component_of = self._component_of
+               return {name: bits[component_of[node]] for node, name in enumerate(self._names)}
+
+     def reachable(self, roots=None):
+          '''Returns the set of functions (defined or not) reachable from the roots'''
+          with _instrument.span('Reachability.reachable'):
+               names = self._names
+               return {names[node] for node in self._reached(self._root_ids(roots))}
+
+     def unreachable(self, roots=None):
+          '''Returns the defined functions not reachable from the roots, in the order of
+          the call dict'''
+          with _instrument.span('Reachability.unreachable'):
+               reached = self._reached(self._root_ids(roots))
+               return [self._names[node] for node in range(self.defined) if node not in reached]
+
+     def filter(self, roots=None, dead=True):
+          '''Returns a Presenter of just the unreachable functions, with their calls to
+          each other and to undefined functions (or with dead=False, of just the
+          reachable functions)'''
+          dead_funcs = set(self.unreachable(roots))
+          calls = self._graph.call_dict() if isinstance(self._graph, Presenter) else self._graph
+          if dead:
+               data = _OrderedDict((func, tuple(call for call in calls[func]
+                                                 if call in dead_funcs or call not in calls))
+                                   for func in calls if func in dead_funcs)
+          else: # Whatever a reachable function calls is reachable too
+               data = _OrderedDict((func, tuple(calls[func])) for func in calls if func not in dead_funcs)
+          if isinstance(self._graph, Presenter):
+               return self._graph.__class__(data, self._graph._weights, self._graph._costs)
+          return Presenter(data)
+
+
+def unreachable_by_file(results, roots=None):
+     '''Given an iterable of (filename, function_def_dict) pairs, merges the graphs and
+     returns an OrderedDict of each filename --> its defined functions unreachable from
+     the roots (by default, the default entry points of all the files)'''
+     from codeschematics.merge import Merger
+     merger = Merger()
+     defined = _OrderedDict()
+     for filename, dic in results:
+          merger.add(dic)
+          defined[filename] = list(dic)
+     dead = set(Reachability(merger.result()[0]).unreachable(roots))
+     return _OrderedDict((filename, [func for func in funcs if func in dead])
+                         for filename, funcs in defined.items())
@@ -22,6 +22,7 @@ from __future__ import print_function
 import ast
 from collections import defaultdict, OrderedDict
 import json
+import os
 from pprint import pprint
 
 ''' A dirty script to parse and prettily print the function call hierarchy for a
@@ -323,15 +324,26 @@ if __name__ == '__main__':
      else:
           args.function = flatten(args.function)
      
-     if args.ignore:
-          args.ignore = flatten(args.ignore)
+     # A set, since dumps checks it for every call it prints
+     args.ignore = set(flatten(args.ignore))
 
      for func in args.function:
           tree, done = make_call_tree(data, func)
           #pprint(tree)
           print('\n' + '#'*80 + '\n')
           print(dumps(data, func, args.ignore))
-     
+
+     if args.html:
+          # The interactive page is built from the newer presentation module's Presenter
+          from codeschematics.presentation import Presenter
+          from codeschematics.html_output import write_html
+          ignores = args.ignore
+          dic = OrderedDict((func, tuple(call for call in calls if call not in ignores))
+                            for func, calls in data.dict.items() if func not in ignores)
+          presenter = Presenter(dic).subgraph([func for func in args.function if func not in ignores])
+          base = args.output or os.path.basename(args.filename)
+          write_html(presenter, base + '.html')
+
      #data = make_call_dict('design.py')
      #pprint(data.dict)
      #func = find_deepest_call_chain(data.dict)
@@ -345,5 +357,7 @@ if __name__ == '__main__':
 #   - disable the full tree for a function in all places its called
 #   - make flowchart?
 #   - include some optional default funcs to ignore (such as builtins and builtin-type methods)
-#   - change order from ordered-by-call-order to order-by-depth-of-node
+#     (done at parse time by the parsers.ignore_packs module: make_call_dict(ignore=['python']))
+#   - change order from ordered-by-call-order to order-by-depth-of-node (done in the
+#     presentation module: Presenter.to_plain_text(depth_order=...))
      
@@ -0,0 +1,237 @@
+#! /usr/bin/env python3
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Structural diffs between two call graphs, e.g. of two releases of a project.
+
+Every function gets a Merkle style hash, covering its name, whether it's defined,
+and the hashes of what it calls, in order; so two functions have equal hashes exactly
+when everything below them is the same. Mutually recursive functions can't be hashed
+bottom up, so each strongly connected component is hashed as a whole, in a canonical
+(name sorted) order, and its members' hashes derive from that.
+
+The diff then walks both graphs down from their roots, skipping any function whose
+hash is the same in both, so past the (linear) hashing the cost of a diff depends on
+the size of the change rather than the size of the graphs.
+
+Run as a script, it diffs two files (source files, or call dicts as JSON):
+
+     python -m codeschematics.diff old/net_crypto.c new/net_crypto.c'''
+
+import hashlib as _hashlib
+from collections import OrderedDict as _OrderedDict
+
+from codeschematics import dot as _dot
+from codeschematics.algorithms import strongly_connected_components
+from codeschematics.presentation import Presenter
+
+_gv = None # Conditional graphviz import to minimize dependencies
+
+
+def _digest(*parts):
+     # Length prefixed, so that no choice of names can make two part lists collide
+     h = _hashlib.blake2b(digest_size=16)
+     for part in parts:
+          if isinstance(part, str):
+               part = part.encode('utf-8', 'surrogateescape')
+          h.update(len(part).to_bytes(8, 'little'))
+          h.update(part)
+     return h.digest()
+
+
+def merkle_hashes(graph):
+     '''Returns a dict of function --> hash (16 bytes) for every function in the given
+     Presenter or call dict, defined or not'''
+     calls = graph.call_dict() if isinstance(graph, Presenter) else graph
+     funcs = _OrderedDict.fromkeys(calls)
+     for callees in calls.values():
+          funcs.update(_OrderedDict.fromkeys(callees))
+     empty = ()
+     successors = lambda func: calls.get(func, empty)
+
+     hashes = {}
+     # Components come callees first, so everything a component calls is already hashed
+     for component in strongly_connected_components(funcs, successors):
+          func = component[0]
+          if len(component) == 1 and func not in successors(func):
+               defined = b'd' if func in calls else b'u'
+               hashes[func] = _digest(func, defined, *[hashes[call] for call in successors(func)])
+               continue
+          # A cycle: within the component, calls are recorded by name, since the
+          # members' hashes aren't known yet. Sorting makes the result independent of
+          # where the traversal happened to enter the cycle
+          members = set(component)
+          parts = []
+          for member in sorted(component):
+               parts.append(member)
+               parts.extend(b'n' + call.encode('utf-8', 'surrogateescape') if call in members else hashes[call]
+                            for call in successors(member))
+               parts.append(b'/')
+          scc_hash = _digest(b'scc', *parts)
+          for member in component:
+               hashes[member] = _digest(member, scc_hash)
+     return hashes
+
+
+class GraphDiff:
+     '''The differences between two graphs. The attributes are lists, in the order the
+     diff walk found them:
+
+          added_functions, removed_functions
+          added_edges, removed_edges       - (caller, callee) pairs
+          changed                          - functions in both graphs whose subtrees differ'''
+
+     def __init__(self, old, new, old_hashes=None, new_hashes=None, roots=None):
+          '''old and new are Presenters or call dicts. Their hashes may be passed in if
+          already known (e.g. computed once for a release and kept). With roots, only the
+          changes below those functions are found.'''
+          if roots is None:
+               roots = _OrderedDict()
+               for graph in (old, new):
+                    if isinstance(graph, Presenter):
+                         roots.update(_OrderedDict.fromkeys(graph.roots()))
+                    else:
+                         called = {call for calls in graph.values() for call in calls}
+                         roots.update(_OrderedDict.fromkeys(func for func in graph if func not in called))
+               # Then everything else, for the cycles no uncalled function leads to (a
+               # Presenter picks a root for each); anything already visited is skipped
+               for graph in (old, new):
+                    if not isinstance(graph, Presenter):
+                         roots.update(_OrderedDict.fromkeys(graph))
+          self.old = old.call_dict() if isinstance(old, Presenter) else old
+          self.new = new.call_dict() if isinstance(new, Presenter) else new
+          old_hashes = old_hashes if old_hashes is not None else merkle_hashes(self.old)
+          new_hashes = new_hashes if new_hashes is not None else merkle_hashes(self.new)
+          self.added_functions = []
+          self.removed_functions = []
+          self.added_edges = []
+          self.removed_edges = []
+          self.changed = []
+
+          empty = ()
+          visited = set()
+          stack = list(reversed(list(roots)))
+          while stack:
+               func = stack.pop()
+               if func in visited:
+                    continue
+               visited.add(func)
+               in_old, in_new = func in old_hashes, func in new_hashes
+               if in_old and in_new and old_hashes[func] == new_hashes[func]:
+                    continue # Identical subtree
+               old_calls, new_calls = self.old.get(func, empty), self.new.get(func, empty)
+               if not in_old:
+                    self.added_functions.append(func)
+               elif not in_new:
+                    self.removed_functions.append(func)
+               else:
+                    self.changed.append(func)
+               old_set, new_set = set(old_calls), set(new_calls)
+               self.added_edges.extend((func, call) for call in new_calls if call not in old_set)
+               self.removed_edges.extend((func, call) for call in old_calls if call not in new_set)
+               # Children of either side might hold the change
+               children = _OrderedDict.fromkeys(new_calls)
+               children.update(_OrderedDict.fromkeys(old_calls))
+               stack.extend(reversed([child for child in children if child not in visited]))
+
+     def __bool__(self):
+          return bool(self.added_functions or self.removed_functions or self.added_edges
+                      or self.removed_edges or self.changed)
+
+     def to_plain_text(self):
+          '''A diff-like listing: "+"/"-" for added/removed functions and calls, and "~"
+          for functions whose subtree changed'''
+          lines = []
+          lines.extend('+ {}()'.format(func) for func in self.added_functions)
+          lines.extend('- {}()'.format(func) for func in self.removed_functions)
+          lines.extend('+ {}() -> {}()'.format(*edge) for edge in self.added_edges)
+          lines.extend('- {}() -> {}()'.format(*edge) for edge in self.removed_edges)
+          lines.extend('~ {}()'.format(func) for func in self.changed)
+          return '\n'.join(lines)
+
+     __str__ = to_plain_text
+
+     def to_graphviz(self):
+          '''Returns a graphviz Digraph of just the delta: added functions and calls in
+          green, removed ones in red (dashed), and changed subtrees in orange'''
+          global _gv
+          if _gv is None:
+               import graphviz as _gv
+          graph = _gv.Digraph(graph_attr=self._graph_attr, node_attr=self._node_attr)
+          self._fill_graph(graph)
+          return graph
+
+     def write_dot(self, out):
+          '''Writes the graph of to_graphviz as DOT source to the text file object out'''
+          with _dot.DotWriter(out, graph_attr=self._graph_attr, node_attr=self._node_attr) as graph:
+               self._fill_graph(graph)
+
+     _graph_attr = {'labelloc': 't', 'labelfontsize': '20'}
+     _node_attr = {'shape': 'oval', 'style': 'filled', 'fontcolor': 'white'}
+
+     def _fill_graph(self, graph):
+          for func in self.changed:
+               graph.node(func, color='darkorange')
+          for func in self.added_functions:
+               graph.node(func, color='darkgreen')
+          for func in self.removed_functions:
+               graph.node(func, color='red', style='filled,dashed')
+          for caller, callee in self.added_edges:
+               graph.edge(caller, callee, color='darkgreen')
+          for caller, callee in self.removed_edges:
+               graph.edge(caller, callee, color='red', style='dashed')
+
+
+def diff(old, new, roots=None):
+     '''Returns the GraphDiff between two Presenters or call dicts'''
+     return GraphDiff(old, new, roots=roots)
+
+
+################################################################################
+# main()
+
+if __name__ == '__main__':
+     import argparse
+     import sys
+     from codeschematics.cache import GraphCache, cached_parse
+     parser = argparse.ArgumentParser(description='Show how the call graph changed between two versions of a file.')
+     parser.add_argument('old', help='the old version (a source file, or a call dict as JSON)')
+     parser.add_argument('new', help='the new version')
+     parser.add_argument('-f', '--format', choices=['txt', 'dot'], default='txt',
+                         help='print the delta as text (the default) or as graphviz DOT source')
+     parser.add_argument('-r', '--roots', action='append', default=[], metavar='FUNC[,FUNC...]',
+                         help='only look for changes below these functions')
+     parser.add_argument('-c', '--cache-dir', metavar='DIR',
+                         help='cache parse results in DIR, and reuse them for unchanged files')
+     parser.add_argument('--no-filter', action='store_true',
+                         help='keep the functions lacking a definition (the default filter removes them)')
+     args = parser.parse_args()
+
+     cache = GraphCache(args.cache_dir) if args.cache_dir else None
+     graphs = []
+     for fname in (args.old, args.new):
+          presenter = Presenter(cached_parse(fname, cache)[0])
+          graphs.append(presenter if args.no_filter else presenter.default_filter())
+     roots = [func for arg in args.roots for func in arg.split(',') if func] or None
+     delta = diff(graphs[0], graphs[1], roots)
+     if args.format == 'dot':
+          delta.write_dot(sys.stdout)
+     elif delta:
+          print(delta.to_plain_text())
+     sys.exit(1 if delta else 0)
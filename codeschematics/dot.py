@@ -0,0 +1,187 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''A streaming writer of graphviz DOT source, needing nothing but the graphviz
+programs themselves (and not even those, to write the source). Each node, edge and
+attribute statement is written out as it's added, so memory use doesn't grow with
+the graph, and the same calls always write the same bytes (attributes are sorted),
+so the output may be cached or compared.
+
+     with open('calls.gv', 'w') as f:
+          with DotWriter(f, graph_attr={'labelloc': 't'}) as graph:
+               graph.edge('main', 'helper', color='red')
+
+DotWriter has the subset of graphviz.Digraph's interface the views use (node, edge,
+edges, attr and subgraph), so the same code can fill either. render() streams a
+graph straight into a graphviz program's stdin.'''
+
+import io as _io
+import re as _re
+import subprocess as _subprocess
+import tempfile as _tempfile
+from contextlib import contextmanager as _contextmanager
+
+
+# The output formats of graphviz (as of 2.40 or so)
+FORMATS = frozenset('''bmp canon cgimage cmap cmapx cmapx_np dot dot_json eps exr fig gd gd2 gif gtk gv ico
+     imap imap_np ismap jp2 jpe jpeg jpg json json0 pct pdf pic pict plain plain-ext png pov ps ps2 psd sgi
+     svg svgz tga tif tiff tk vml vmlz vrml wbmp webp x11 xdot xdot1.2 xdot1.4 xdot_json xlib'''.split())
+
+
+_ID = _re.compile(r'[^\W\d]\w*\Z')
+_NUMERAL = _re.compile(r'-?(?:\.\d+|\d+(?:\.\d*)?)\Z')
+_KEYWORDS = frozenset(['node', 'edge', 'graph', 'digraph', 'subgraph', 'strict'])
+_MAX_IDS = 1 << 16
+
+def quote(string):
+     '''Returns the string as a DOT ID: as is if it's a plain identifier or number,
+     otherwise in double quotes. Backslashes are left alone, so label escapes such as
+     \\n still work. Note that a colon is quoted rather than taken as a port.'''
+     string = str(string)
+     if (_ID.match(string) or _NUMERAL.match(string)) and string.lower() not in _KEYWORDS:
+          return string
+     string = string.replace('"', '\\"')
+     if (len(string) - len(string.rstrip('\\'))) % 2: # Don't escape the closing quote
+          string += '\\'
+     return '"{}"'.format(string)
+
+
+def _attr_list(label, attrs):
+     items = sorted((key, value) for key, value in attrs.items() if value is not None)
+     if label is not None:
+          items.insert(0, ('label', label))
+     if not items:
+          return ''
+     return ' [{}]'.format(' '.join('{}={}'.format(key, quote(value)) for key, value in items))
+
+
+class DotWriter:
+     '''Writes a graph's DOT source to a text file object as it's built. Call close()
+     (or use it as a context manager) to finish the graph.'''
+
+     def __init__(self, out, name=None, graph_attr=None, node_attr=None, edge_attr=None,
+                  directed=True, strict=False):
+          self._out = out
+          self._ids = {} # A cache of quote(), as most names are written several times
+          self._indent = '\t'
+          self._arrow = ' -> ' if directed else ' -- '
+          head = ('strict ' if strict else '') + ('digraph' if directed else 'graph')
+          out.write('{} {{\n'.format(head + ' ' + quote(name) if name else head))
+          self._attrs(graph_attr, node_attr, edge_attr)
+          self.closed = False
+
+     def _quote(self, name):
+          ids = self._ids
+          try:
+               return ids[name]
+          except KeyError:
+               pass
+          if len(ids) >= _MAX_IDS: # Keep memory use bounded on huge graphs
+               ids.clear()
+          ids[name] = quoted = quote(name)
+          return quoted
+
+     def _attrs(self, graph_attr, node_attr, edge_attr):
+          for kind, attrs in (('graph', graph_attr), ('node', node_attr), ('edge', edge_attr)):
+               if attrs:
+                    self.attr(kind, **attrs)
+
+     def attr(self, kind='graph', **attrs):
+          '''Writes a default attribute statement for the graph, its nodes or its edges'''
+          self._out.write('{}{}{}\n'.format(self._indent, kind, _attr_list(None, attrs)))
+
+     def node(self, name, label=None, **attrs):
+          self._out.write('{}{}{}\n'.format(self._indent, self._quote(name), _attr_list(label, attrs)))
+
+     def edge(self, tail, head, label=None, **attrs):
+          self._out.write('{}{}{}{}{}\n'.format(self._indent, self._quote(tail), self._arrow, self._quote(head),
+                                                _attr_list(label, attrs)))
+
+     def edges(self, tail_heads):
+          write = self._out.write
+          prefix = self._indent
+          arrow = self._arrow
+          ids = self._ids
+          quote = self._quote
+          for tail, head in tail_heads:
+               write(prefix + (ids.get(tail) or quote(tail)) + arrow + (ids.get(head) or quote(head)) + '\n')
+
+     @_contextmanager
+     def subgraph(self, name=None, graph_attr=None, node_attr=None, edge_attr=None):
+          '''A context manager for a subgraph (a cluster, if its name starts with
+          "cluster"), yielding this writer to add its statements with'''
+          self._out.write('{}{{\n'.format(self._indent) if name is None else
+                          '{}subgraph {} {{\n'.format(self._indent, quote(name)))
+          outer = self._indent
+          self._indent += '\t'
+          try:
+               self._attrs(graph_attr, node_attr, edge_attr)
+               yield self
+          finally:
+               self._indent = outer
+               self._out.write('{}}}\n'.format(outer))
+
+     def close(self):
+          if not self.closed:
+               self._out.write('}\n')
+               self.closed = True
+
+     def __enter__(self):
+          return self
+
+     def __exit__(self, *exc):
+          self.close()
+
+
+def source(write, **kwargs):
+     '''Returns the DOT source as a string, where write is a function taking a
+     DotWriter (made with the given keyword arguments) and adding the graph to it'''
+     out = _io.StringIO()
+     with DotWriter(out, **kwargs) as graph:
+          write(graph)
+     return out.getvalue()
+
+
+def render(write, format, filename, engine='dot', outputs=(), **kwargs):
+     '''Runs the graphviz program engine to render the graph into filename in the given
+     format, where write is a function taking a DotWriter (made with the given keyword
+     arguments) and adding the graph to it. The source is streamed to the program as
+     it's written. outputs is a sequence of (format, filename) pairs for any other
+     outputs of the same layout. Raises RuntimeError if the program fails.'''
+     args = [engine]
+     for fmt, fname in [(format, filename)] + list(outputs):
+          args += ['-T' + fmt, '-o', fname]
+     with _tempfile.TemporaryFile() as errors: # Not a pipe, which could fill up and block
+          try:
+               proc = _subprocess.Popen(args, stdin=_subprocess.PIPE,
+                                        stdout=_subprocess.DEVNULL, stderr=errors)
+          except OSError as e:
+               raise RuntimeError('failed to run graphviz ({}): {}'.format(engine, e)) from e
+          try:
+               with _io.TextIOWrapper(proc.stdin, encoding='utf-8') as out:
+                    with DotWriter(out, **kwargs) as graph:
+                         write(graph)
+          except BrokenPipeError:
+               pass # The program died; its status and errors say why
+          finally:
+               status = proc.wait()
+          if status:
+               errors.seek(0)
+               message = errors.read().decode('utf-8', 'replace').strip()
+               raise RuntimeError('{} failed with status {}: {}'.format(engine, status, message))
@@ -0,0 +1,184 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Composable filters. Where each of the Presenter's filter methods copies the whole
+tree, a FilterPipeline collects any number of filters and applies them all in one
+pass over the call structure, building the result only once:
+
+     pipeline = (FilterPipeline().undefined()
+                                 .ignore('print', 'len')
+                                 .ignore_glob('test_*', '_*')
+                                 .ignore_regex(r'.*_(?:get|set)ter$')
+                                 .exclude_nested(nested_funcs)
+                                 .min_degree(2)
+                                 .reachable(['main'], max_depth=4))
+     presenter = pipeline.apply(presenter)
+
+All the name based filters (ignore lists, globs, regexes, nested functions) are
+decided at most once per distinct function name; the globs and regexes are compiled
+together into one regular expression, so ten patterns cost about the same as one.
+(Except for the regexes with groups of their own, which are matched one by one: put
+together, their group names could clash and their backreferences would be
+renumbered.)'''
+
+import re as _re
+from collections import OrderedDict as _OrderedDict
+from fnmatch import translate as _translate
+
+from codeschematics import instrument as _instrument
+from codeschematics.presentation import Presenter
+
+
+class FilterPipeline:
+     '''Collects filters (each method returns the pipeline, so they can be chained) and
+     applies them all at once with apply()'''
+
+     def __init__(self):
+          self._ignored = set()
+          self._patterns = []
+          self._predicates = []
+          self._undefined = False
+          self._min_degree = 0
+          self._roots = None
+          self._max_depth = None
+
+     def undefined(self):
+          '''Removes all functions lacking a definition, like Presenter.default_filter'''
+          self._undefined = True
+          return self
+
+     def ignore(self, *names):
+          '''Removes the given functions'''
+          self._ignored.update(names)
+          return self
+
+     def exclude_nested(self, nested_funcs):
+          '''Removes the nested functions, as returned by the parsers' make_call_dict'''
+          self._ignored.update(nested_funcs)
+          return self
+
+     def ignore_regex(self, *patterns):
+          '''Removes the functions whose whole name matches any of the regexes'''
+          self._patterns.extend(patterns)
+          return self
+
+     def ignore_glob(self, *patterns):
+          '''Removes the functions whose name matches any of the shell style globs'''
+          self._patterns.extend(_translate(pattern) for pattern in patterns)
+          return self
+
+     def ignore_if(self, predicate):
+          '''Removes the functions for which predicate(name) is true'''
+          self._predicates.append(predicate)
+          return self
+
+     def min_degree(self, degree):
+          '''Removes the functions with fewer than degree calls in and out, in total.
+          The degrees are those of the whole graph given to apply(), before any of the
+          other filters remove anything.'''
+          self._min_degree = degree
+          return self
+
+     def reachable(self, roots=None, max_depth=None):
+          '''Keeps only what's reachable from the given roots (by default, the original
+          graph's roots), at most max_depth calls below them'''
+          self._roots = roots
+          self._max_depth = max_depth
+          return self
+
+     ###########################################################################
+
+     def _compile(self):
+          # Returns a function of a name --> whether any pattern matches all of it
+          if not self._patterns:
+               return None
+          regexes = [_re.compile(pattern) for pattern in self._patterns] # Any bad pattern raises here
+          matchers = [regex.fullmatch for regex in regexes if regex.groups]
+          plain = [pattern for pattern, regex in zip(self._patterns, regexes) if not regex.groups]
+          if plain:
+               # One alternation of all the patterns without groups, anchored at both ends.
+               # Some still can't be put together (e.g. inline flags must come first), and
+               # are matched one by one too
+               try:
+                    matchers.insert(0, _re.compile('(?:{})\\Z'.format('|'.join('(?:{})'.format(pattern)
+                                                                            for pattern in plain))).match)
+               except _re.error:
+                    matchers[:0] = [regex.fullmatch for regex in regexes if not regex.groups]
+          if len(matchers) == 1:
+               return matchers[0]
+          return lambda name: any(match(name) for match in matchers)
+
+     def apply(self, presenter):
+          '''Returns a new Presenter with all the filters applied (to a Presenter, or
+          anything with the same query methods)'''
+          with _instrument.span('FilterPipeline.apply') as sp:
+               out = self._apply(presenter)
+               sp.set(functions_in=len(presenter.functions()), functions_out=len(out.functions()))
+          return out
+
+     def _apply(self, presenter):
+          calls = presenter.call_dict()
+          matches = self._compile()
+          ignored, predicates, undefined = self._ignored, self._predicates, self._undefined
+
+          degree = None
+          if self._min_degree:
+               degree = {}
+               for func, callees in calls.items():
+                    degree[func] = degree.get(func, 0) + len(callees)
+                    for call in callees:
+                         degree[call] = degree.get(call, 0) + 1
+
+          verdicts = {}
+          def keep(func):
+               try:
+                    return verdicts[func]
+               except KeyError:
+                    pass
+               ok = not (func in ignored or (undefined and func not in calls)
+                         or (degree is not None and degree.get(func, 0) < self._min_degree)
+                         or (matches is not None and matches(func))
+                         or any(predicate(func) for predicate in predicates))
+               verdicts[func] = ok
+               return ok
+
+          # Without a depth limit, every kept function keeps its kept calls. With one, a
+          # breadth first walk from the roots finds what's in range
+          if self._roots is None and self._max_depth is None:
+               in_range = None
+          else:
+               roots = self._roots if self._roots is not None else presenter.roots()
+               depth = _OrderedDict((root, 0) for root in roots if keep(root))
+               queue = list(depth)
+               for func in queue:
+                    if self._max_depth is not None and depth[func] >= self._max_depth:
+                         continue
+                    for call in calls.get(func, ()):
+                         if call not in depth and keep(call):
+                              depth[call] = depth[func] + 1
+                              queue.append(call)
+               in_range = {func for func, d in depth.items() if self._max_depth is None or d < self._max_depth}
+
+          data = _OrderedDict()
+          for func, callees in calls.items():
+               if keep(func) and (in_range is None or func in in_range):
+                    data[func] = tuple(call for call in callees if keep(call))
+          # Anything Presenter-like (e.g. a store.StoredGraph) filters to a Presenter
+          cls = presenter.__class__ if isinstance(presenter, Presenter) else Presenter
+          return cls(data, presenter._weights, presenter._costs)
@@ -0,0 +1,240 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Interactive HTML output. Rather than one giant image, this writes a small page
+showing the top level functions, which expands a function's calls when clicked. The
+call data is split into shards of a few hundred functions each, in depth first order
+so that a subtree tends to be in one shard, and the page only loads a shard when a
+function in it is expanded (each entry says which of its callees are defined, so
+drawing them needs nothing more). Searching goes through a prebuilt name index, itself split by
+the first two letters of the names. So the page opens instantly and stays responsive
+however big the project is.
+
+     write_html(presenter, 'project.html')
+
+writes project.html, plus its data in the directory project_files/. Each data file
+is a JSON object wrapped in a single function call, so that the page also works when
+opened straight from the disk (browsers refuse to fetch() local files).'''
+
+import json as _json
+import os as _os
+from collections import OrderedDict as _OrderedDict
+
+from codeschematics import instrument as _instrument
+
+
+def _preorder(presenter):
+     # Depth first from each root in turn, then anything unreachable (which can only
+     # be the result of filtering)
+     seen = _OrderedDict()
+     for root in presenter.roots():
+          stack = [root]
+          while stack:
+               func = stack.pop()
+               if func in seen:
+                    continue
+               seen[func] = None
+               stack.extend(reversed(presenter.callees(func)))
+     for func in presenter.functions():
+          seen.setdefault(func, None)
+     return list(seen)
+
+
+_ALNUM = frozenset('abcdefghijklmnopqrstuvwxyz0123456789')
+
+def _bucket(name):
+     # Names are bucketed on their first two (ASCII) alphanumeric characters, lowercased
+     key = ''.join(c for c in name.lower() if c in _ALNUM)[:2]
+     return key if len(key) == 2 else '_'
+
+
+def _write_data(path, data):
+     with open(path, 'w') as f:
+          f.write('codeschematics.load({});\n'.format(_json.dumps(data, separators=(',', ':'))))
+
+
+def write_html(presenter, filename, shard_size=500, title=None):
+     '''Writes the interactive page for the presenter to filename, with its data files
+     in the directory beside it named after it (e.g. foo.html --> foo_files/).'''
+     base = _os.path.splitext(filename)[0]
+     data_dir = base + '_files'
+     rel_dir = _os.path.basename(data_dir)
+     _os.makedirs(data_dir, exist_ok=True)
+     if title is None:
+          title = _os.path.basename(base)
+
+     with _instrument.span('write_html', file=filename):
+          calls = presenter.call_dict()
+          order = _preorder(presenter)
+          shard_of = {func: i // shard_size for i, func in enumerate(order)}
+
+          # The call shards: {func: [defined, [callee, ...], [callee's shard, ...],
+          # [callee defined (1 or 0), ...]]}
+          for number in range(0, len(order), shard_size):
+               shard = _OrderedDict()
+               for func in order[number:number+shard_size]:
+                    callees = calls.get(func, ())
+                    shard[func] = [func in calls, list(callees), [shard_of[call] for call in callees],
+                                   [int(call in calls) for call in callees]]
+               _write_data(_os.path.join(data_dir, 'shard{}.js'.format(number // shard_size)),
+                           {'kind': 'shard', 'id': number // shard_size, 'funcs': shard})
+
+          # The name index: {bucket: [[func, shard, defined (1 or 0)], ...]}
+          buckets = {}
+          for func in order:
+               buckets.setdefault(_bucket(func), []).append(func)
+          for key, funcs in buckets.items():
+               funcs.sort(key=str.lower)
+               _write_data(_os.path.join(data_dir, 'names_{}.js'.format(key)),
+                           {'kind': 'names', 'id': key,
+                            'names': [[func, shard_of[func], int(func in calls)] for func in funcs]})
+
+          roots = [[root, shard_of[root], int(root in calls)] for root in presenter.roots()]
+          page = _PAGE.replace('@TITLE@', _html_escape(title)).replace('@DIR@', _script_json(rel_dir)) \
+                      .replace('@ROOTS@', _script_json(roots)).replace('@COUNT@', str(len(order)))
+          with open(filename, 'w') as f:
+               f.write(page)
+
+
+def _html_escape(text):
+     return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+def _script_json(value):
+     # JSON to go inside the page's <script>: a name containing "</script>" mustn't end
+     # it early, and U+2028 and U+2029 aren't allowed in JavaScript strings everywhere
+     return _json.dumps(value).replace('</', '<\\/').replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+
+# The page itself. It's deliberately plain: no libraries, no build step
+_PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>@TITLE@</title>
+<style>
+body { font-family: sans-serif; margin: 1em 2em; }
+ul { list-style: none; padding-left: 1.5em; margin: 0; }
+#tree > ul { padding-left: 0; }
+.func { cursor: pointer; font-family: monospace; }
+.func.defined::before { content: "\\25B8  "; color: purple; }
+.func.defined.open::before { content: "\\25BE  "; }
+.func.undefined { color: gray; cursor: default; }
+.func.recursive::after { content: "  \\21BB"; color: gray; }
+#search { width: 30em; font-size: 1em; }
+#results li { cursor: pointer; font-family: monospace; }
+#status { color: gray; font-size: 0.9em; }
+</style>
+</head>
+<body>
+<h2>@TITLE@</h2>
+<p><input id="search" placeholder="search functions (at least two characters)" autocomplete="off">
+<span id="status">@COUNT@ functions</span></p>
+<ul id="results"></ul>
+<div id="tree"></div>
+<script>
+var codeschematics = (function() {
+     var dir = @DIR@, roots = @ROOTS@;
+     var shards = {}, names = {}, waiting = {};
+
+     // Data files are loaded as scripts, each calling codeschematics.load(data)
+     function fetch(kind, id, callback) {
+          var store = kind === 'shard' ? shards : names;
+          if (store[id]) { callback(store[id]); return; }
+          var key = kind + ':' + id;
+          if (waiting[key]) { waiting[key].push(callback); return; }
+          waiting[key] = [callback];
+          var script = document.createElement('script');
+          script.src = dir + '/' + (kind === 'shard' ? 'shard' + id : 'names_' + id) + '.js';
+          script.onerror = function() { delete waiting[key]; store[id] = {}; callback({}); };
+          document.head.appendChild(script);
+     }
+     function load(data) {
+          var key = data.kind + ':' + data.id;
+          var value = data.kind === 'shard' ? data.funcs : data.names;
+          (data.kind === 'shard' ? shards : names)[data.id] = value;
+          var callbacks = waiting[key] || [];
+          delete waiting[key];
+          callbacks.forEach(function(callback) { callback(value); });
+     }
+
+     // Whether a function is defined comes with it (from its caller's shard entry, the
+     // roots or the name index), so its shard is only fetched when it's expanded
+     function node(name, shard, defined, chain) {
+          var li = document.createElement('li'), span = document.createElement('span');
+          span.textContent = name + '()';
+          span.className = 'func';
+          li.appendChild(span);
+          if (chain.indexOf(name) >= 0) { span.className += ' recursive'; return li; }
+          if (!defined) { span.className += ' undefined'; return li; }
+          span.className += ' defined';
+          var children = null;
+          span.onclick = function() {
+               if (children) {
+                    children.style.display = children.style.display === 'none' ? '' : 'none';
+                    span.classList.toggle('open', children.style.display !== 'none');
+                    return;
+               }
+               children = document.createElement('ul');
+               li.appendChild(children);
+               span.classList.add('open');
+               fetch('shard', shard, function(funcs) {
+                    var entry = funcs[name];
+                    if (!entry) return;
+                    var inner = chain.concat([name]);
+                    entry[1].forEach(function(callee, i) {
+                         children.appendChild(node(callee, entry[2][i], entry[3][i], inner));
+                    });
+               });
+          };
+          return li;
+     }
+     function show(list, container) {
+          var ul = document.createElement('ul');
+          list.forEach(function(item) { ul.appendChild(node(item[0], item[1], item[2], [])); });
+          container.innerHTML = '';
+          container.appendChild(ul);
+     }
+     function normalize(text) { return text.toLowerCase().replace(/[^a-z0-9]/g, ''); }
+     function bucket(text) {
+          var key = normalize(text).slice(0, 2);
+          return key.length === 2 ? key : '_';
+     }
+
+     var input = document.getElementById('search'), results = document.getElementById('results');
+     input.oninput = function() {
+          var text = input.value.toLowerCase();
+          if (text.length < 2) { results.innerHTML = ''; return; }
+          fetch('names', bucket(text), function(list) {
+               if (input.value.toLowerCase() !== text) return; // Stale
+               // Match on the name either as is or sans punctuation, e.g. "init" finds __init__
+               var found = [], bare = normalize(text);
+               for (var i = 0; i < list.length && found.length < 50; i++)
+                    if (list[i][0].toLowerCase().indexOf(text) === 0 ||
+                        (bare && normalize(list[i][0]).indexOf(bare) === 0)) found.push(list[i]);
+               show(found, results);
+          });
+     };
+     show(roots, document.getElementById('tree'));
+     return {load: load};
+})();
+</script>
+</body>
+</html>
+'''
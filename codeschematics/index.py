@@ -0,0 +1,258 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''An index of which files define which functions, for parsing only what a focused
+view needs. Building the index doesn't parse anything: Python files are scanned with
+the tokenize module for "def NAME", and C files with a small lexer for a name and a
+parenthesized list followed by a "{" at the top level (skipping comments, strings and
+preprocessor directives). Both scans are many times faster than a parse, and may
+find the odd false positive, which at worst costs an unneeded parse.
+
+     index = DefinitionIndex(cache_dir)
+     index.update(paths)
+     dic, nested = focused_parse(['main'], index, cache)
+
+focused_parse starts at the roots, parses the files defining them, then the files
+defining whatever those call, and so on, so only the files reachable from the roots
+are ever parsed. The index is kept in the cache directory (as definitions.index) and
+only stale files are rescanned.'''
+
+import json as _json
+import os as _os
+import re as _re
+import tokenize as _tokenize
+from collections import OrderedDict as _OrderedDict, deque as _deque
+
+from codeschematics import instrument as _instrument
+from codeschematics.cache import GraphCache, cached_parse, detect_language
+
+
+################################################################################
+# The scanners
+
+def scan_python(filename):
+     '''Returns the names of the functions (and methods) defined in a Python file'''
+     names = []
+     with open(filename, 'rb') as f:
+          after_def = False
+          try:
+               for token in _tokenize.tokenize(f.readline):
+                    if token.type == _tokenize.NAME:
+                         if after_def:
+                              names.append(token.string)
+                         after_def = token.string == 'def'
+                    elif token.type not in (_tokenize.NL, _tokenize.COMMENT):
+                         after_def = False
+          except (_tokenize.TokenError, SyntaxError):
+               pass # Keep what was found before the bad part
+     return names
+
+
+_C_TOKEN = _re.compile(r'''
+     (?P<skip>  \s+ | /\*.*?\*/ | //[^\n]* | "(?:[^"\\\n]|\\.)*" | '(?:[^'\\\n]|\\.)*'
+              | \#(?:[^\n\\]|\\.)* )         # Preprocessor directives, with continuations
+   | (?P<ident> [A-Za-z_]\w* )
+   | (?P<punct> . )''', _re.S | _re.X)
+
+# Names that look like functions at the top level but aren't
+_C_NOT_FUNCS = frozenset(['__attribute__', '__attribute', '__declspec', '__asm__', '__asm', 'asm',
+                          '__typeof__', 'typeof', 'sizeof', '_Alignas', '_Static_assert'])
+
+def scan_c(filename):
+     '''Returns the names of the functions defined in a C file, i.e. of each name and
+     parenthesized list followed by a "{" at the top level. Definitions produced by
+     macros aren't found.'''
+     with open(filename, errors='replace') as f:
+          text = f.read()
+     names = []
+     braces = parens = 0
+     prev = None # The previous token, if an identifier
+     candidate = None # The name before the current top level (...)
+     pending = None # A candidate whose (...) has closed
+     for match in _C_TOKEN.finditer(text):
+          kind = match.lastgroup
+          if kind == 'skip':
+               continue
+          token = match.group()
+          if kind == 'ident':
+               prev = token
+               continue
+          if braces == 0:
+               if token == '(':
+                    if parens == 0:
+                         candidate = prev if prev not in _C_NOT_FUNCS else None
+                    parens += 1
+               elif token == ')':
+                    parens = max(parens - 1, 0)
+                    if parens == 0 and candidate is not None:
+                         pending, candidate = candidate, None
+               elif token == '{' and parens == 0:
+                    if pending is not None:
+                         names.append(pending)
+                    pending = None
+               elif token in ';=,' and parens == 0:
+                    pending = None
+          if token == '{':
+               braces += 1
+          elif token == '}':
+               braces = max(braces - 1, 0)
+          prev = None
+     return names
+
+
+def scan(filename, language=None):
+     '''Returns the names of the functions defined in the file, or an empty list for a
+     language without a scanner'''
+     language = language or detect_language(filename)
+     if language == 'python':
+          return scan_python(filename)
+     elif language == 'c':
+          return scan_c(filename)
+     return []
+
+
+################################################################################
+# The index
+
+class DefinitionIndex:
+     '''Function name --> the files defining it. With a directory, the index is loaded
+     from and saved to the file "definitions.index" there (usually the GraphCache
+     directory); files are only rescanned when their size or modification time
+     changes.'''
+
+     filename = 'definitions.index'
+
+     def __init__(self, directory=None):
+          self.directory = directory
+          self._files = _OrderedDict() # Absolute path --> (stamp, names)
+          self._by_name = None
+          if directory is not None:
+               self._load()
+
+     def _path(self):
+          return _os.path.join(self.directory, self.filename)
+
+     def _load(self):
+          try:
+               with open(self._path()) as f:
+                    data = _json.load(f)
+          except (OSError, ValueError):
+               return
+          for path, stamp, names in data.get('files', ()):
+               self._files[path] = (stamp, names)
+
+     def save(self):
+          '''Writes the index to its directory (atomically); a no-op without one'''
+          if self.directory is None:
+               return
+          _os.makedirs(self.directory, exist_ok=True)
+          path = self._path()
+          tmp = '{}.{}.tmp'.format(path, _os.getpid())
+          with open(tmp, 'w') as f:
+               _json.dump({'files': [[path, stamp, names] for path, (stamp, names) in self._files.items()]}, f)
+          _os.replace(tmp, path)
+
+     def update(self, paths, language=None):
+          '''Makes the index one of just the given files: scans any that are new or
+          changed since they were last scanned, and drops the files that weren't given
+          (from an earlier run on other paths, say) or no longer exist, so that files()
+          only ever returns the given files. Saves the index if anything changed.
+          Returns the number of files scanned.'''
+          scanned = 0
+          files = _OrderedDict()
+          with _instrument.span('index update', files=len(paths)) as sp:
+               for path in paths:
+                    path = _os.path.abspath(path)
+                    try:
+                         stamp = GraphCache._stamp(path)
+                    except OSError: # Gone
+                         continue
+                    old = self._files.get(path)
+                    if old is not None and old[0] == stamp:
+                         files[path] = old
+                         continue
+                    files[path] = (stamp, scan(path, language))
+                    scanned += 1
+               sp.set(scanned=scanned, dropped=len(set(self._files) - set(files)))
+          changed = scanned or list(files) != list(self._files)
+          self._files = files
+          if changed:
+               self._by_name = None
+               self.save()
+          return scanned
+
+     def files(self, name):
+          '''Returns the (absolute) paths of the files defining the given function'''
+          if self._by_name is None:
+               by_name = {}
+               for path, (stamp, names) in self._files.items():
+                    for func in names:
+                         paths = by_name.setdefault(func, [])
+                         if not paths or paths[-1] != path:
+                              paths.append(path)
+               self._by_name = by_name
+          return self._by_name.get(name, [])
+
+     def paths(self):
+          '''Returns all the indexed files'''
+          return list(self._files)
+
+
+def _merge_into(merged, dic):
+     # Combines the calls of functions defined in several files (including the top
+     # level pseudo functions), keeping the order they were found in
+     for func, calls in dic.items():
+          if func in merged:
+               merged[func] = tuple(_OrderedDict.fromkeys(merged[func] + tuple(calls)))
+          else:
+               merged[func] = tuple(calls)
+
+
+def focused_parse(roots, index, cache=None, language=None, max_depth=None, parser_args=None):
+     '''Parses just the files needed for the call graph below the given roots: the
+     files defining the roots, then those defining their callees, and so on (down to
+     max_depth calls, if given). Returns the combined (function_def_dict,
+     set_of_nested_funcs) of the files parsed, in the same form as any parser's
+     make_call_dict. parser_args maps a language to the keyword arguments for its
+     parser, as in batch.Options.'''
+     parser_args = parser_args or {}
+     merged = _OrderedDict()
+     nested = set()
+     parsed = set()
+     seen = set(roots)
+     queue = _deque((root, 0) for root in roots)
+     with _instrument.span('focused parse', roots=len(roots)) as sp:
+          while queue:
+               func, depth = queue.popleft()
+               for path in index.files(func):
+                    if path in parsed:
+                         continue
+                    parsed.add(path)
+                    lang = language or detect_language(path)
+                    dic, file_nested = cached_parse(path, cache, lang, **parser_args.get(lang, {}))
+                    _merge_into(merged, dic)
+                    nested.update(file_nested)
+               if func not in merged or (max_depth is not None and depth >= max_depth):
+                    continue
+               for call in merged[func]:
+                    if call not in seen:
+                         seen.add(call)
+                         queue.append((call, depth + 1))
+          sp.set(files=len(parsed))
+     return merged, nested
@@ -0,0 +1,230 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Lightweight instrumentation for finding out where a run spends its time. The rest
+of the package wraps each phase of its work in a span:
+
+     with instrument.span('cpp', file=filename) as sp:
+          ...
+          sp.set(lines=n)
+
+and bumps counters with instrument.count('edges', n). Nothing is recorded until
+enable() is called; while disabled, span() returns a shared do-nothing object and
+count() returns immediately, so the instrumentation costs (next to) nothing.
+
+The recorded data can be written as a plain JSON summary (write_json) or in the
+Chrome Trace Event format (write_chrome_trace), for viewing in chrome://tracing or
+Perfetto. With memory=True, each span also records the peak traced memory during
+it, via tracemalloc (which slows everything down considerably).'''
+
+import json as _json
+import os as _os
+import threading as _threading
+import time as _time
+from collections import OrderedDict as _OrderedDict
+
+_enabled = False
+_memory = False
+_started_tracemalloc = False # Whether enable() started it (and so disable() should stop it)
+_events = []
+_counters = _OrderedDict()
+_lock = _threading.Lock()
+_local = _threading.local() # Per thread stacks of open spans, for the memory peaks
+
+
+def enabled():
+     return _enabled
+
+
+def enable(memory=False):
+     '''Starts recording. With memory=True, also starts tracemalloc (if it isn't
+     already tracing) and records peak memory per span.'''
+     global _enabled, _memory, _started_tracemalloc
+     _enabled = True
+     _memory = memory
+     if memory:
+          import tracemalloc
+          if not tracemalloc.is_tracing():
+               tracemalloc.start()
+               _started_tracemalloc = True
+
+
+def disable():
+     '''Stops recording. The data recorded so far is kept until reset(). tracemalloc is
+     only stopped if enable() started it, not if the program was already tracing.'''
+     global _enabled, _memory, _started_tracemalloc
+     if _started_tracemalloc:
+          import tracemalloc
+          tracemalloc.stop()
+          _started_tracemalloc = False
+     _enabled = _memory = False
+
+
+def reset():
+     '''Discards everything recorded so far'''
+     with _lock:
+          del _events[:]
+          _counters.clear()
+
+
+################################################################################
+# Recording
+
+class _NullSpan:
+     '''What span() returns when disabled'''
+     __slots__ = ()
+     def __enter__(self):
+          return self
+     def __exit__(self, *exc):
+          return False
+     def set(self, **args):
+          pass
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+     __slots__ = ('name', 'cat', 'args', 'start', 'child_peak')
+
+     def __init__(self, name, cat, args):
+          self.name = name
+          self.cat = cat
+          self.args = args
+
+     def set(self, **args):
+          '''Adds (or replaces) arguments of this span, e.g. the number of nodes processed'''
+          self.args.update(args)
+
+     def __enter__(self):
+          if _memory:
+               _memory_enter(self)
+          self.start = _time.perf_counter()
+          return self
+
+     def __exit__(self, *exc):
+          end = _time.perf_counter()
+          if _memory:
+               self.args['peak_bytes'] = _memory_exit(self)
+          event = {'name': self.name, 'cat': self.cat, 'ph': 'X',
+                   'ts': self.start * 1e6, 'dur': (end - self.start) * 1e6,
+                   'pid': _os.getpid(), 'tid': _threading.get_ident(), 'args': self.args}
+          with _lock:
+               _events.append(event)
+          return False
+
+
+def span(name, cat='codeschematics', **args):
+     '''Returns a context manager timing the enclosed block as the named phase. The
+     keyword args are recorded with the span (e.g. the file being worked on).'''
+     if not _enabled:
+          return _NULL_SPAN
+     return _Span(name, cat, args)
+
+
+def count(name, n=1):
+     '''Adds n to the named counter'''
+     if not _enabled:
+          return
+     with _lock:
+          _counters[name] = _counters.get(name, 0) + n
+
+
+# tracemalloc has only one global peak, so nested spans juggle it: entering a span
+# folds the peak so far into the enclosing span and resets it, and exiting folds the
+# span's own peak back into its parent. (Threads share the one peak, so with several
+# threads working at once the peaks are only approximate.)
+
+def _memory_enter(span):
+     import tracemalloc
+     stack = getattr(_local, 'stack', None)
+     if stack is None:
+          stack = _local.stack = []
+     peak = tracemalloc.get_traced_memory()[1]
+     if stack:
+          stack[-1].child_peak = max(stack[-1].child_peak, peak)
+     span.child_peak = 0
+     stack.append(span)
+     if hasattr(tracemalloc, 'reset_peak'): # 3.9+
+          tracemalloc.reset_peak()
+
+def _memory_exit(span):
+     import tracemalloc
+     stack = _local.stack
+     peak = max(tracemalloc.get_traced_memory()[1], span.child_peak)
+     stack.pop()
+     if stack:
+          stack[-1].child_peak = max(stack[-1].child_peak, peak)
+     if hasattr(tracemalloc, 'reset_peak'):
+          tracemalloc.reset_peak()
+     return peak
+
+
+################################################################################
+# Exporting
+
+def export():
+     '''Returns everything recorded so far as a plain (picklable, JSON-able) dict, e.g. to
+     ship it from a worker process back to the parent, which can merge() it'''
+     with _lock:
+          return {'events': list(_events), 'counters': dict(_counters)}
+
+
+def merge(data):
+     '''Adds data from another process's export() to this process's records'''
+     with _lock:
+          _events.extend(data['events'])
+          for name, n in data['counters'].items():
+               _counters[name] = _counters.get(name, 0) + n
+
+
+def summary():
+     '''Returns the total time, number of occurences and maximum memory peak of each
+     phase, plus the counters'''
+     phases = _OrderedDict()
+     with _lock:
+          for event in sorted(_events, key=lambda event: event['ts']):
+               phase = phases.setdefault(event['name'], {'count': 0, 'seconds': 0.0})
+               phase['count'] += 1
+               phase['seconds'] += event['dur'] / 1e6
+               if 'peak_bytes' in event['args']:
+                    phase['peak_bytes'] = max(phase.get('peak_bytes', 0), event['args']['peak_bytes'])
+          return {'phases': phases, 'counters': dict(_counters)}
+
+
+def write_json(filename):
+     '''Writes the summary, and every individual span (with its arguments, such as
+     the file it's for), as JSON'''
+     data = summary()
+     with _lock:
+          data['spans'] = [{'name': event['name'], 'start': event['ts'] / 1e6,
+                            'seconds': event['dur'] / 1e6, 'pid': event['pid'],
+                            'tid': event['tid'], 'args': event['args']}
+                           for event in sorted(_events, key=lambda event: event['ts'])]
+     with open(filename, 'w') as f:
+          _json.dump(data, f, indent=1, default=str)
+
+
+def write_chrome_trace(filename):
+     '''Writes the spans in the Chrome Trace Event format, with the counters as metadata'''
+     with _lock:
+          data = {'traceEvents': sorted(_events, key=lambda event: event['ts']),
+                  'displayTimeUnit': 'ms',
+                  'otherData': {'counters': dict(_counters)}}
+     with open(filename, 'w') as f:
+          _json.dump(data, f, default=str)
@@ -0,0 +1,152 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Reuses the layout of a previous render of a graph, so that regenerating the diagram
+of slightly changed code is quick, and the diagram stays recognizably the same.
+
+     presenter.graphviz_render('svg', 'calls', layout='calls.layout')
+
+The first render is an ordinary dot layout, which also writes the node positions
+(from a -Tdot output) to the layout file, along with what each node calls. Later
+renders pin every node whose calls haven't changed at its old position, and run neato
+to place only the new and changed nodes (starting the changed ones at their old
+positions) and route the edges. The positions can also be read from any -Tdot, -Txdot
+or -Tjson output with read_positions.'''
+
+import json as _json
+import os as _os
+import re as _re
+import tempfile as _tempfile
+
+from codeschematics import dot as _dot
+from codeschematics import instrument as _instrument
+
+
+_POINTS_PER_INCH = 72 # -Tdot positions are in points, but neato reads input ones in inches
+
+# A node statement in -Tdot output: the node's ID and its attribute list, which may
+# span several lines
+_NODE_STATEMENT = _re.compile(r'''^\t(?P<id>"(?:[^"\\]|\\.)*"|[^\s"\[\]{};=-][^\s\[\]{};=]*)\s*
+                                  \[(?P<attrs>(?:[^\]"]|"(?:[^"\\]|\\.)*")*)\]''', _re.M | _re.X)
+_POS = _re.compile(r'(?:^|[\s,])pos="?([-+\d.e]+),([-+\d.e]+)')
+
+
+def _unquote(id):
+     if id.startswith('"'):
+          return id[1:-1].replace('\\"', '"')
+     return id
+
+
+def parse_positions(text):
+     '''Returns a dict of each node name --> its (x, y) position in points, from graphviz
+     -Tdot/-Txdot or -Tjson output'''
+     positions = {}
+     if text.lstrip().startswith('{'): # JSON
+          for obj in _json.loads(text).get('objects', ()):
+               if 'pos' in obj and 'nodes' not in obj: # Not a subgraph
+                    x, y = obj['pos'].split(',')[:2]
+                    positions[obj['name']] = (float(x), float(y))
+          return positions
+     text = text.replace('\\\n', '') # Line continuations
+     for match in _NODE_STATEMENT.finditer(text):
+          name = _unquote(match.group('id'))
+          pos = _POS.search(match.group('attrs'))
+          if pos and name not in ('graph', 'node', 'edge'):
+               positions[name] = (float(pos.group(1)), float(pos.group(2)))
+     return positions
+
+
+def read_positions(filename):
+     '''Returns the node positions from a file of graphviz -Tdot/-Txdot or -Tjson output'''
+     with open(filename, encoding='utf-8') as f:
+          return parse_positions(f.read())
+
+
+class Layout:
+     '''The saved positions of a graph's nodes (in points), and what each node called
+     when they were saved'''
+
+     def __init__(self, positions=None, calls=None):
+          self.positions = positions or {}
+          self.calls = calls or {}
+
+     @classmethod
+     def load(cls, filename):
+          '''Returns the saved Layout, or None if the file doesn't exist or is unreadable'''
+          try:
+               with open(filename) as f:
+                    data = _json.load(f)
+               nodes = data['nodes']
+          except (OSError, ValueError, KeyError, TypeError):
+               return None
+          return cls({name: tuple(node['pos']) for name, node in nodes.items()},
+                     {name: node['calls'] for name, node in nodes.items()})
+
+     def save(self, filename):
+          tmp = '{}.{}.tmp'.format(filename, _os.getpid())
+          with open(tmp, 'w') as f:
+               _json.dump({'nodes': {name: {'pos': list(pos), 'calls': list(self.calls.get(name, ()))}
+                                     for name, pos in sorted(self.positions.items())}}, f)
+          _os.replace(tmp, filename)
+
+     def pins(self, calls):
+          '''Returns (pinned, moved): dicts of the given graph's nodes (a dict of node -->
+          its calls) that have a saved position --> that position, for the nodes whose
+          calls are unchanged and for those whose calls changed'''
+          pinned = {}
+          moved = {}
+          for name, callees in calls.items():
+               pos = self.positions.get(name)
+               if pos is not None:
+                    (pinned if list(callees) == list(self.calls.get(name, ())) else moved)[name] = pos
+          return pinned, moved
+
+
+def render(fill, calls, format, filename, layout_file, **kwargs):
+     '''Renders a graph into filename in the given format, reusing the layout saved in
+     layout_file if there is one, and saving the new layout there. fill is a function
+     taking a graph (a DotWriter) and adding the nodes and edges to it, calls is a dict
+     of each node --> the nodes it calls, and the keyword arguments are passed on to
+     DotWriter.'''
+     layout = Layout.load(layout_file)
+     fd, dot_file = _tempfile.mkstemp(suffix='.gv', dir=_os.path.dirname(_os.path.abspath(layout_file)))
+     _os.close(fd)
+     try:
+          if layout is None:
+               with _instrument.span('layout.render', reuse=False, file=filename):
+                    _dot.render(fill, format, filename, outputs=[('dot', dot_file)], **kwargs)
+          else:
+               pinned, moved = layout.pins(calls)
+               def write(graph):
+                    # Statements before the graph's own add the positions to its nodes
+                    for name, (x, y) in pinned.items():
+                         graph.node(name, pos='{:.2f},{:.2f}!'.format(x / _POINTS_PER_INCH, y / _POINTS_PER_INCH))
+                    for name, (x, y) in moved.items():
+                         graph.node(name, pos='{:.2f},{:.2f}'.format(x / _POINTS_PER_INCH, y / _POINTS_PER_INCH))
+                    fill(graph)
+               graph_attr = dict(kwargs.pop('graph_attr', None) or {}, splines='true')
+               with _instrument.span('layout.render', reuse=True, file=filename, pinned=len(pinned),
+                                     moved=len(moved), new=len(calls) - len(pinned) - len(moved)):
+                    _dot.render(write, format, filename, engine='neato', outputs=[('dot', dot_file)],
+                                graph_attr=graph_attr, **kwargs)
+          positions = read_positions(dot_file)
+     finally:
+          _os.remove(dot_file)
+     Layout({name: positions[name] for name in calls if name in positions},
+            {name: calls[name] for name in calls if name in positions}).save(layout_file)
@@ -0,0 +1,113 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Links the call graphs of several C translation units into one, the way a linker
+would. Each function defined "static" is local to its translation unit, so it's
+renamed "unit:name" (e.g. "rho.c:init"), and calls to it from within that unit are
+resolved to it; every other definition is global, and calls to it from any unit
+resolve to it. Calls to functions defined nowhere (e.g. the C library) keep their
+names. Each unit's top level pseudo function is local to it too.
+
+     dic, nested = link_files(['a.c', 'b.c'], include_dirs=['include'])
+
+If two units define the same global function, the first definition keeps the name
+and later ones are named as duplicate definitions within a file are ("foo.1", ...),
+and listed in SymbolTable.duplicates. Everything takes time and memory linear in the
+total size of the units' graphs.'''
+
+from collections import OrderedDict as _OrderedDict
+
+from codeschematics import instrument as _instrument
+
+
+class SymbolTable:
+     '''The global and per unit symbols of a set of translation units. Add each unit
+     with add(), then call link() for the combined call graph.'''
+
+     def __init__(self):
+          self._units = [] # (unit, dic, nested, statics)
+          self._globals = {} # Function name --> unit defining it
+          self._suffixes = {}
+          self._renames = {} # (unit, name) --> linked name, for renamed globals
+          self.duplicates = [] # (name, unit, linked name)
+
+     @staticmethod
+     def local_name(unit, name):
+          '''The linked name of a function local to the given unit'''
+          return '{}:{}'.format(unit, name)
+
+     def add(self, unit, dic, nested=(), statics=()):
+          '''Adds a translation unit (named e.g. after its file), with its call dict,
+          nested functions and static functions as returned by c_parser.make_unit'''
+          statics = set(statics)
+          dic = _OrderedDict(dic)
+          top_level = next(iter(dic), None)
+          for func in dic:
+               if func in statics or func == top_level:
+                    continue
+               if func not in self._globals:
+                    self._globals[func] = unit
+                    continue
+               # A second global definition: a link error in a real program, but
+               # likely enough here (e.g. several programs in one tree)
+               i = self._suffixes.get(func, 0) + 1
+               while '{}.{}'.format(func, i) in self._globals:
+                    i += 1
+               self._suffixes[func] = i
+               linked = '{}.{}'.format(func, i)
+               self._globals[linked] = unit
+               self._renames[unit, func] = linked
+               self.duplicates.append((func, unit, linked))
+          self._units.append((unit, dic, set(nested), statics, top_level))
+
+     def resolve(self, unit, name, statics=()):
+          '''Returns the linked name of the function a call to name in the given unit
+          refers to'''
+          if name in statics:
+               return self.local_name(unit, name)
+          return self._renames.get((unit, name), name)
+
+     def link(self):
+          '''Returns the combined (function_def_dict, set_of_nested_funcs) of all the
+          units, in the same form as a parser's make_call_dict'''
+          linked = _OrderedDict()
+          nested = set()
+          with _instrument.span('link', units=len(self._units)) as sp:
+               for unit, dic, unit_nested, statics, top_level in self._units:
+                    local = statics | {top_level}
+                    for func, calls in dic.items():
+                         name = self.resolve(unit, func, local)
+                         linked[name] = tuple(_OrderedDict.fromkeys(self.resolve(unit, call, statics)
+                                                                    for call in calls))
+                         if func in unit_nested:
+                              nested.add(name)
+               sp.set(functions=len(linked))
+          return linked, nested
+
+
+def link_files(filenames, units=None, **kwargs):
+     '''Parses each of the C files (passing the keyword arguments on to
+     c_parser.make_unit) and links them. The units are named after the files unless
+     a list of names is given. Returns (function_def_dict, set_of_nested_funcs).'''
+     from codeschematics.parsers.c_parser import make_unit
+     table = SymbolTable()
+     for i, filename in enumerate(filenames):
+          dic, nested, statics = make_unit(filename, **kwargs)
+          table.add(units[i] if units else filename, dic, nested, statics)
+     return table.link()
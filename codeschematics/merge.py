@@ -0,0 +1,148 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Combines many partial call graphs (e.g. one per file or per directory) into one.
+A function defined in several parts calls the union of what it calls in each, in
+the order first seen, and edge weights (calls, seconds) are summed.
+
+     merger = Merger()
+     for dic, nested in results:
+          merger.add(dic, nested)
+     dic, nested = merger.result()
+
+Merging takes time linear in the total size of the parts: each function's calls are
+collected in a dict, so duplicate edges are dropped by hashing rather than by
+searching a tuple, and the functions nothing calls are tracked as edges are added,
+so that presenter() hands them to the Presenter rather than having it work them out
+again (it still walks the tree once, for any loops they don't lead to). Mergers can
+themselves be merged, so parts can be combined
+tree-wise, e.g. one Merger per worker process parsing a share of the files, and
+then one over the workers' results (as batch.process_merged does).'''
+
+from collections import OrderedDict as _OrderedDict
+
+from codeschematics import instrument as _instrument
+
+
+class Merger:
+     '''Accumulates call dicts (and optionally their nested functions, weights and
+     costs) into one call graph'''
+
+     def __init__(self):
+          self._calls = _OrderedDict() # Function --> OrderedDict of its calls (to None)
+          self._nested = set()
+          self._weights = None
+          self._costs = None
+          self._uncalled = _OrderedDict() # The defined functions nothing calls (yet), to None
+          self._called = set()
+          self.sites = None # The parts' call sites, if any had them
+
+     def add(self, dic, nested=(), weights=None, costs=None, sites=None):
+          '''Merges in one call dict, in the same form as any parser's make_call_dict
+          result, and its nested functions and any performance data (as taken by the
+          Presenter constructor) and call sites (a sites.CallSites). Returns self, for
+          chaining.'''
+          merged = self._calls
+          called = self._called
+          uncalled = self._uncalled
+          for func, calls in dic.items():
+               try:
+                    mine = merged[func]
+               except KeyError:
+                    mine = merged[func] = _OrderedDict()
+                    if func not in called:
+                         uncalled[func] = None
+               for call in calls:
+                    if call not in mine:
+                         mine[call] = None
+                         if call not in called:
+                              called.add(call)
+                              uncalled.pop(call, None)
+          self._nested.update(nested)
+          if weights is not None:
+               if self._weights is None:
+                    self._weights = {}
+               for edge, (count, seconds) in weights.items():
+                    old = self._weights.get(edge, (0, 0))
+                    self._weights[edge] = (old[0] + count, old[1] + seconds)
+          if costs is not None:
+               if self._costs is None:
+                    self._costs = {}
+               for func, seconds in costs.items():
+                    self._costs[func] = self._costs.get(func, 0) + seconds
+          if sites is not None:
+               if self.sites is None:
+                    from codeschematics.sites import CallSites
+                    self.sites = CallSites()
+               self.sites.update(sites)
+          return self
+
+     def add_presenter(self, presenter):
+          '''Merges in a Presenter's (possibly filtered) call structure and performance
+          data. Returns self.'''
+          return self.add(presenter.call_dict(), (), presenter._weights, presenter._costs)
+
+     def update(self, other):
+          '''Merges in everything another Merger has accumulated. Returns self.'''
+          return self.add(other._calls, other._nested, other._weights, other._costs, other.sites)
+
+     def roots(self):
+          '''Returns the defined functions nothing calls, in the order they were first
+          added. A loop of calls that nothing else calls has no such function; the
+          Presenter picks a root for it when it's built.'''
+          return tuple(self._uncalled)
+
+     def result(self):
+          '''Returns the merged (function_def_dict, set_of_nested_funcs)'''
+          return (_OrderedDict((func, tuple(calls)) for func, calls in self._calls.items()),
+                  set(self._nested))
+
+     def presenter(self, cls=None):
+          '''Returns a Presenter (or instance of the given subclass) of the merged graph'''
+          if cls is None:
+               from codeschematics.presentation import Presenter as cls
+          dic = self.result()[0]
+          # Costs given with the parts are summed; otherwise the Presenter derives them
+          # from the summed weights
+          return cls(dic, self._weights, self._costs, self.roots())
+
+
+def merge(results):
+     '''Merges an iterable of (function_def_dict, set_of_nested_funcs) pairs, as returned
+     by the parsers, into one such pair'''
+     merger = Merger()
+     with _instrument.span('merge') as sp:
+          parts = 0
+          for dic, nested in results:
+               merger.add(dic, nested)
+               parts += 1
+          sp.set(parts=parts, functions=len(merger._calls))
+     return merger.result()
+
+
+def merge_presenters(presenters):
+     '''Merges an iterable of Presenters into a new one, of the first one's class'''
+     merger = Merger()
+     cls = None
+     with _instrument.span('merge presenters'):
+          for presenter in presenters:
+               cls = cls or presenter.__class__
+               merger.add_presenter(presenter)
+          return merger.presenter(cls)
+
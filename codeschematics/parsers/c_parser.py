@@ -25,8 +25,14 @@ to the codeschematics.presentation module.'''
 
 from __future__ import print_function
 
-from pycparser import c_ast, preprocess_file, parse_file as _parse_file
+import hashlib as _hashlib
+import re as _re
+from collections import OrderedDict as _OrderedDict
+
+from pycparser import c_ast, c_parser, preprocess_file, parse_file as _parse_file
 from codeschematics.parsers.parser_data import ParserData
+from codeschematics.parsers import ignore_packs
+from codeschematics import instrument as _instrument
 
 try:
      from pycparserext.ext_c_parser import GnuCParser
@@ -34,6 +40,7 @@ except ImportError:
      import warnings
      warnings.warn("pycparserext not found, falling back to pycparser (likely to fail)", ImportWarning)
      parse_file = _parse_file
+     parser = c_parser.CParser()
 else:
      from functools import partial as _partial
      parser = GnuCParser()
@@ -45,18 +52,21 @@ class CTraverser(c_ast.NodeVisitor):
 
      top_level = '__file__' # The fake name for containing-function of 
                             # top level function calls
-     def __init__(self):
-          self._data = ParserData(self.top_level)
+     def __init__(self, sites=None, ignore=frozenset()):
+          self._data = ParserData(self.top_level, sites, ignore=ignore)
+          self.static_funcs = set() # The functions with internal linkage
 
      def visit_FuncDef(self, node):
           # For now, we assume that function name is unique (i.e. no overloading),
           # so ignore param types and return type
-          self._data.parse_func(node.decl.name, self.generic_visit, node)
+          name = self._data.parse_func(node.decl.name, self.generic_visit, node)
+          if 'static' in (node.decl.storage or ()):
+               self.static_funcs.add(name)
 
      def visit_FuncCall(self, node):
           name = node.name
           if isinstance(name, c_ast.ID):
-               self._data.func_called(node.name.name)
+               self._data.func_called(node.name.name, *self._where(node))
           else:
                # The next most common case is struct reference, as e.g. for a stored callback.
                # So isinstance(name, c_ast.StructRef) == True, and `name` has two c_ast.ID
@@ -74,10 +84,17 @@ class CTraverser(c_ast.NodeVisitor):
                retval = self._find_furthest_node(name, c_ast.ID)
                if retval is None:
                     raise ValueError('Got a function call with no ID node')
-               self._data.func_called(retval.name)
+               self._data.func_called(retval.name, *self._where(node))
 
           self.generic_visit(node)
 
+     def _where(self, node):
+          # The call's location, if the sites are wanted
+          coord = node.coord
+          if self._data.sites is None or coord is None:
+               return ()
+          return coord.line, coord.column or 0, coord.file
+
      def _find_furthest_node(self, startnode, cls):
           for attr, value in reversed(startnode.children()):
                if isinstance(value, cls):
@@ -94,7 +111,117 @@ class CTraverser(c_ast.NodeVisitor):
 from codeschematics.parsers.fake_libc_include import find_fake_libc_include
 # http://eli.thegreenplace.net/2015/on-parsing-c-type-declarations-and-fake-headers/
 
-def make_call_dict(filename, include_dirs=None, defines=None, *, nostdinc=False):
+################################################################################
+# Header reuse. Typically most of a preprocessed translation unit is its headers, and
+# most of pycparser's time goes into their declarations, which are of no interest to
+# a call graph. In header reuse mode, the header text before the file's own code is
+# split into one chunk per top level #include, and each chunk is parsed only once per
+# HeaderCache. All that's kept of a chunk is what later parsing needs: the typedef
+# names (pycparser can't parse a declaration without knowing which names are types)
+# and any function definitions (e.g. static inline ones), to be traversed as usual.
+# The file's own code is then parsed after a one line stand-in for its headers, e.g.
+#
+#      typedef int size_t, FILE, uint32_t;
+#
+# which is all pycparser needs to get the structure right (the actual types don't
+# matter here). Chunks are keyed on their text and all the chunks before them, so two
+# files that start by including the same headers in the same order share the work.
+
+_LINEMARKER = _re.compile(r'#\s*(?:line\s+)?\d+\s+"((?:[^"\\]|\\.)*)"(.*)$')
+
+def _split_headers(text):
+     # Returns (chunks, rest): the header text in chunks, one per top level #include,
+     # and the rest of the file from its first line of its own code, linemarker first
+     lines = text.splitlines(True)
+     main = None
+     chunks = []
+     start = 0 # Start of the current chunk
+     marker = None # Index of the latest linemarker back into the main file
+     in_main = False
+     for i, line in enumerate(lines):
+          match = _LINEMARKER.match(line)
+          if match:
+               name, flags = match.group(1), match.group(2).split()
+               if main is None:
+                    main = name
+               if name == main and '1' not in flags:
+                    in_main, marker = True, i
+               elif in_main and '1' in flags:
+                    # A top level #include starts
+                    if i > start:
+                         chunks.append(''.join(lines[start:i]))
+                    start, in_main = i, False
+               continue
+          if in_main and line.strip() and not line.lstrip().startswith('#'):
+               # The file's own code starts here
+               if marker is not None and marker > start:
+                    chunks.append(''.join(lines[start:marker]))
+               return chunks, ''.join(lines[marker:] if marker is not None else lines[i:])
+     return chunks, ''
+
+
+class HeaderCache:
+     '''Parsed header chunks, in memory, for make_call_dict(header_cache=...). One
+     instance should be shared by all the files of a project; it holds at most
+     max_entries chunks, dropping the least recently used.'''
+
+     def __init__(self, max_entries=256):
+          self.max_entries = max_entries
+          self._entries = _OrderedDict()
+          self.hits = self.misses = 0
+
+     def get(self, key):
+          entry = self._entries.get(key)
+          if entry is not None:
+               self._entries.move_to_end(key)
+               self.hits += 1
+          else:
+               self.misses += 1
+          return entry
+
+     def put(self, key, entry):
+          self._entries[key] = entry
+          while len(self._entries) > self.max_entries:
+               self._entries.popitem(last=False)
+
+     def clear(self):
+          self._entries.clear()
+
+_default_header_cache = HeaderCache()
+
+
+def _stand_in(typedefs):
+     return 'typedef int {};\n'.format(', '.join(typedefs)) if typedefs else ''
+
+
+def _parse_reusing_headers(text, filename, cache):
+     # Returns (funcdefs from the headers, AST of the rest), or None if the text can't
+     # be parsed this way (in which case the caller should parse it whole)
+     chunks, rest = _split_headers(text)
+     if not rest:
+          return None
+     key = b''
+     typedefs, funcdefs = (), ()
+     for chunk in chunks:
+          key = _hashlib.sha1(key + chunk.encode('utf-8', 'surrogateescape')).digest()
+          entry = cache.get(key)
+          if entry is None:
+               with _instrument.span('pycparser header', file=filename, bytes=len(chunk)):
+                    tree = parser.parse(_stand_in(typedefs) + chunk, filename)
+               new_typedefs = _OrderedDict.fromkeys(typedefs)
+               new_typedefs.update((ext.name, None) for ext in tree.ext if isinstance(ext, c_ast.Typedef))
+               entry = (tuple(new_typedefs), funcdefs + tuple(ext for ext in tree.ext
+                                                              if isinstance(ext, c_ast.FuncDef)))
+               cache.put(key, entry)
+          typedefs, funcdefs = entry
+     _instrument.count('header chunks', len(chunks))
+     # The stand-in is on the line before the rest's leading linemarker, so the
+     # coordinates in the rest are unchanged
+     return funcdefs, parser.parse(_stand_in(typedefs) + rest, filename)
+
+
+def make_call_dict(filename, include_dirs=None, defines=None, *, nostdinc=False, header_cache=None,
+                   sites=None, ignore=None):
      '''This parses the given file into an AST, then traverses the AST to create
      the function definition list. The return value is a tuple of
      (function_def_dict, set_of_nested_funcs), where the latter is the set of
@@ -106,7 +233,28 @@ def make_call_dict(filename, include_dirs=None, defines=None, *, nostdinc=False)
 
      Additionally, if the package can't locate pycparser's fake_libc_include
      files on your system, you will have to pass them to include_dirs, as well
-     as set the keyword 'nostdinc' to True.'''
+     as set the keyword 'nostdinc' to True.
+
+     With a HeaderCache for header_cache (or True, for a module wide one), headers
+     are only parsed the first time they're seen, and then reused for other files
+     including them in the same order. If that fails for a file, it's parsed whole.
+
+     If a sites.CallSites is given, the location of each call is recorded in it (calls
+     in headers under the header's name). Calls to the functions in the ignore packs
+     (see ignore_packs.resolve, e.g. ['libc']) are left out.'''
+     return _traverse(filename, include_dirs, defines, nostdinc, header_cache, sites, ignore).result()
+
+
+def make_unit(filename, include_dirs=None, defines=None, *, nostdinc=False, header_cache=None,
+              sites=None, ignore=None):
+     '''Like make_call_dict, but for linking several translation units together (see
+     codeschematics.linker): returns (function_def_dict, set_of_nested_funcs,
+     set_of_static_funcs), the last being the functions with internal linkage.'''
+     visitor = _traverse(filename, include_dirs, defines, nostdinc, header_cache, sites, ignore)
+     return visitor.result() + (visitor.static_funcs,)
+
+
+def _traverse(filename, include_dirs, defines, nostdinc, header_cache, sites=None, ignore=None):
      cpp_args = []
      dname = find_fake_libc_include()
      if dname:
@@ -117,8 +265,27 @@ def make_call_dict(filename, include_dirs=None, defines=None, *, nostdinc=False)
           cpp_args += ["-I{}".format(idir) for idir in include_dirs]
      if defines:
           cpp_args += ["-D{}".format(define) for define in defines]
-     tree = parse_file(filename, use_cpp=True, cpp_args=cpp_args if cpp_args else '')
-     visitor = CTraverser()
-     #print('starting traversal')
-     visitor.visit(tree)
-     return visitor.result()
+     if header_cache is True:
+          header_cache = _default_header_cache
+     # This is what parse_file does, but split up so the two halves can be timed separately
+     with _instrument.span('cpp', file=filename) as sp:
+          text = preprocess_file(filename, cpp_args=cpp_args if cpp_args else '')
+          sp.set(bytes=len(text))
+     with _instrument.span('pycparser', file=filename):
+          reused = None
+          if header_cache is not None:
+               try:
+                    reused = _parse_reusing_headers(text, filename, header_cache)
+               except Exception: # Whatever the reason, the whole parse is the fallback
+                    reused = None
+          if reused is None:
+               funcdefs, tree = (), parser.parse(text, filename)
+          else:
+               funcdefs, tree = reused
+     with _instrument.span('traverse', file=filename):
+          visitor = CTraverser(sites, ignore_packs.resolve(ignore))
+          #print('starting traversal')
+          for funcdef in funcdefs:
+               visitor.visit(funcdef)
+          visitor.visit(tree)
+          return visitor
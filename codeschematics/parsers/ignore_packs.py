@@ -0,0 +1,156 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Sets of function names to leave out of the graph while parsing, rather than
+filtering them out afterwards: calls to print, len, .append, .format, memcpy, printf
+and so on are usually most of a graph's edges, and say nothing about the program's
+structure.
+
+     dic, nested = python_parser.make_call_dict('rho.py', ignore=['python'])
+
+The packs are:
+
+     python-builtins   the builtin functions and exceptions (of the running Python)
+     python-methods    the public methods of the builtin types (str, list, dict...)
+     python            both of the above
+     libc              the C standard library (and a few common POSIX functions)
+
+The python packs are for the python and bytecode parsers, and libc for the C parser;
+for_language() picks the packs meant for a language out of a list. A pack may also
+be a file of names, one per line (with # comments), and more packs can be added with
+register(); these are for every language unless told otherwise. Since the names are
+matched alone, a call to a function of the program that happens to share a name with
+an ignored one (a method named "update", say) is left out too.'''
+
+import builtins as _builtins
+
+
+_PYTHON_BUILTINS = frozenset(name for name in dir(_builtins)
+                             if not name.startswith('_') and callable(getattr(_builtins, name)))
+
+_PYTHON_TYPES = (object, str, bytes, bytearray, memoryview, int, float, complex, bool,
+                 list, tuple, range, dict, set, frozenset, slice)
+_PYTHON_METHODS = frozenset(name for cls in _PYTHON_TYPES for name in dir(cls)
+                            if not name.startswith('_'))
+
+_LIBC = frozenset('''
+     abort abs atexit at_quick_exit atof atoi atol atoll bsearch calloc div exit _Exit free
+     getenv labs ldiv llabs lldiv malloc mblen mbstowcs mbtowc qsort quick_exit rand realloc
+     srand strtod strtof strtol strtold strtoll strtoul strtoull system wcstombs wctomb
+     aligned_alloc posix_memalign
+
+     clearerr fclose feof ferror fflush fgetc fgetpos fgets fopen fprintf fputc fputs fread
+     freopen fscanf fseek fsetpos ftell fwrite getc getchar gets perror printf putc putchar
+     puts remove rename rewind scanf setbuf setvbuf snprintf sprintf sscanf tmpfile tmpnam
+     ungetc vfprintf vfscanf vprintf vscanf vsnprintf vsprintf vsscanf fileno fdopen popen
+     pclose getline getdelim
+
+     memchr memcmp memcpy memmove memset strcat strchr strcmp strcoll strcpy strcspn strerror
+     strlen strncat strncmp strncpy strpbrk strrchr strspn strstr strtok strxfrm strdup
+     strndup strnlen strtok_r strcasecmp strncasecmp
+
+     isalnum isalpha isblank iscntrl isdigit isgraph islower isprint ispunct isspace isupper
+     isxdigit tolower toupper
+
+     acos asin atan atan2 cbrt ceil cos cosh exp exp2 expm1 fabs floor fma fmax fmin fmod
+     frexp hypot ldexp log log10 log1p log2 lround modf nan pow round sin sinh sqrt tan tanh
+     trunc acosf asinf atanf atan2f ceilf cosf expf fabsf floorf fmodf logf powf roundf sinf
+     sqrtf tanf
+
+     asctime clock ctime difftime gmtime localtime mktime strftime time timespec_get
+     localtime_r gmtime_r
+
+     assert __assert_fail raise signal longjmp setjmp localeconv setlocale errno
+     __errno_location va_arg va_copy va_end va_start
+
+     btowc fgetwc fgetws fputwc fputws fwprintf fwscanf getwc getwchar mbrlen mbrtowc
+     mbsinit mbsrtowcs putwc putwchar swprintf swscanf ungetwc wcrtomb wcscat wcschr wcscmp
+     wcscpy wcslen wcsncmp wcsncpy wcsrtombs wcstod wcstol wcstoul wmemchr wmemcmp wmemcpy
+     wmemmove wmemset wprintf wscanf
+
+     close open read write lseek unlink access dup dup2 pipe fork execv execvp waitpid
+     getpid sleep usleep nanosleep mmap munmap stat fstat lstat
+'''.split())
+
+_PACKS = {'python-builtins': _PYTHON_BUILTINS,
+          'python-methods':  _PYTHON_METHODS,
+          'python':          _PYTHON_BUILTINS | _PYTHON_METHODS,
+          'libc':            _LIBC,
+         }
+
+# Pack --> the languages it's for (a pack not listed is for all of them)
+_PACK_LANGUAGES = {'python-builtins': ('python', 'bytecode'),
+                   'python-methods':  ('python', 'bytecode'),
+                   'python':          ('python', 'bytecode'),
+                   'libc':            ('c',),
+                  }
+
+
+def names():
+     '''Returns the names of the known packs'''
+     return sorted(_PACKS)
+
+
+def register(name, funcs, languages=None):
+     '''Adds (or replaces) a pack of the given function names, for the given languages
+     (by default all of them)'''
+     _PACKS[name] = frozenset(funcs)
+     if languages is None:
+          _PACK_LANGUAGES.pop(name, None)
+     else:
+          _PACK_LANGUAGES[name] = tuple(languages)
+
+
+def for_language(packs, language):
+     '''Returns the list of those of the given packs (names or filenames, as resolve
+     takes them) that are for the given language'''
+     if isinstance(packs, str):
+          packs = [packs]
+     return [pack for pack in packs if language in _PACK_LANGUAGES.get(pack, (language,))]
+
+
+def load(filename):
+     '''Returns the frozenset of names in a pack file: one per line, with blank lines
+     and anything after a # ignored'''
+     with open(filename) as f:
+          return frozenset(name for name in (line.partition('#')[0].strip() for line in f) if name)
+
+
+def resolve(packs):
+     '''Returns the frozenset of all the function names in the given packs, each of
+     which may be the name of a known pack or the filename of a pack file. A single
+     string is one pack; None or empty is none at all; a set (or frozenset) is taken
+     as the function names themselves. Raises ValueError for a pack that's neither.'''
+     if not packs:
+          return frozenset()
+     if isinstance(packs, (set, frozenset)):
+          return frozenset(packs)
+     if isinstance(packs, str):
+          packs = [packs]
+     funcs = set()
+     for pack in packs:
+          if pack in _PACKS:
+               funcs |= _PACKS[pack]
+          else:
+               try:
+                    funcs |= load(pack)
+               except OSError as e:
+                    raise ValueError('unknown ignore pack {!r} (not one of {}, nor a readable file: {})'
+                                     .format(pack, ', '.join(names()), e.strerror)) from e
+     return frozenset(funcs)
@@ -27,6 +27,7 @@ internally.'''
 
 from __future__ import print_function
 from collections import OrderedDict
+from codeschematics import instrument as _instrument
 
 
 # An incomplete implementation that only does what I need it to, namely append
@@ -63,38 +64,49 @@ class ParserData(OrderedDict):
      to it by the parser.)
 
      2) When a function call node is encounted, merely call
-     ParserData.func_called(funcname)
+     ParserData.func_called(funcname) (with its line and column, if the parser knows
+     them, for recording the call sites)
 
      3) When the parser finishes, have it call ParserData.result() to get the
      function->subcalls dictionary (and the set of which functions aren't top level,
      if any)
      '''
 
-     def __init__(self, top_level):
-          '''The only argument is the name of the top-level pseudo-function (e.g.
-          I used "__module__" as the fake top level name in the Python parser)'''
+     def __init__(self, top_level, sites=None, filename=None, ignore=frozenset()):
+          '''The first argument is the name of the top-level pseudo-function (e.g.
+          I used "__module__" as the fake top level name in the Python parser).
+          Optionally, the call sites are recorded in the given sites.CallSites, under
+          the given filename unless func_called is told otherwise. Calls to the
+          functions in ignore (a frozenset, see ignore_packs) aren't recorded at all.'''
           super(self.__class__, self).__init__()
           self.top_level = top_level
+          self.sites = sites
+          self.filename = filename
+          self.ignore = ignore
           self[top_level] = _OrderedSet()
           self.nested_funcs = set()
           self.current_func = top_level
+          self._suffixes = {}
 
      def _uniquify(self, name):
           '''If 'name' already exists, append a period '.' and an integer to the
           func name, which for any language where periods aren't allowed in func
           names, guarantees a unique name (nop for names that don't exist)'''
-          out = name
+          if name not in self:
+               return name
+          # Count on from the last suffix used for this name, so that n definitions
+          # of one name take O(n) time rather than O(n^2)
           template = name + ".{}"
-          i = 0
-          while out in self.keys():
+          i = self._suffixes.get(name, 0) + 1
+          while template.format(i) in self:
                i += 1
-               out = template.format(i)
-          return out
+          self._suffixes[name] = i
+          return template.format(i)
 
      def parse_func(self, funcname, visitor, *visargs, **kwargs):
           '''When a function definition is encountered, pass this function's name
           and the next function to continue traversing the tree (and said func's
-          args).'''
+          args). Returns the name the function was recorded under.'''
           name = self._uniquify(funcname)
           self[name] = _OrderedSet()
           if self.current_func != self.top_level:
@@ -104,14 +116,22 @@ class ParserData(OrderedDict):
           self.current_func = name
           visitor(*visargs, **kwargs)
           self.current_func = old
+          return name
 
-     def func_called(self, funcname):
+     def func_called(self, funcname, line=None, col=None, filename=None):
           '''Call this whenever a function call is encountered'''
+          if funcname in self.ignore:
+               return
           self[self.current_func].add(funcname)
+          if self.sites is not None and line is not None:
+               self.sites.add(self.current_func, funcname, filename or self.filename, line, col)
 
      def result(self):
           '''Returns a tuple of (this object as a regular OrderedDict, the set of
           functions whose definitions were not top level)'''
           # Convert the OrderedSet nonsense into a tuple
           dic = OrderedDict( (func, tuple(subcalls)) for func, subcalls in self.items() )
+          if _instrument.enabled():
+               _instrument.count('functions defined', len(dic))
+               _instrument.count('calls recorded', sum(len(subcalls) for subcalls in dic.values()))
           return dic, self.nested_funcs
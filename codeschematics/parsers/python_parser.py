@@ -30,6 +30,8 @@ class, which encapsulates the logic required for this package.'''
 from __future__ import print_function
 import ast
 from codeschematics.parsers.parser_data import ParserData
+from codeschematics.parsers import ignore_packs
+from codeschematics import instrument as _instrument
 
 # Note: Add class name to methods, and also catch attribute calls
 # Note2: Make the former configurable
@@ -37,8 +39,8 @@ class PythonTraverser(ast.NodeVisitor):
 
      top_level = '__module__' # The fake name for containing-function of 
                             # top level function calls
-     def __init__(self):
-          self._data = ParserData(self.top_level)
+     def __init__(self, filename=None, sites=None, ignore=frozenset()):
+          self._data = ParserData(self.top_level, sites, filename, ignore)
 
      def _generic_visit(self, thing): 
           # Like super's visit, except also accepts the list "nodes" as well
@@ -63,10 +65,10 @@ class PythonTraverser(ast.NodeVisitor):
           # For now, if this is the case, then ignore this node
           #print('visiting call node inside function', self.current_func)
           if isinstance(node.func, ast.Name): # simple call by identifier
-               self._data.func_called(node.func.id)
+               self._data.func_called(node.func.id, node.lineno, node.col_offset + 1)
                #print(self.current_func, node.func.id)
           elif isinstance(node.func, ast.Attribute): # call by attribute
-               self._data.func_called(node.func.attr)
+               self._data.func_called(node.func.attr, node.lineno, node.col_offset + 1)
                # For now, we ignore whatever object(s) whose attr is the func
                # ignore(node.func.value)            
           self.generic_visit(node)
@@ -83,13 +85,19 @@ def parse_file(filename):
           return ast.parse(f.read(), filename)
 
 
-def make_call_dict(filename):
+def make_call_dict(filename, sites=None, ignore=None):
      '''This parses the given file into an AST, then traverses the AST to create
      the function definition list. The return value is a tuple of
      (function_def_dict, set_of_nested_funcs), where the latter is the set of
-     functions that aren't defined at top level in the module.'''
-     tree = parse_file(filename)
-     visitor = PythonTraverser()
-     #print('starting traversal')
-     visitor.visit(tree)
-     return visitor.result()
+     functions that aren't defined at top level in the module.
+
+     If a sites.CallSites is given, the location of each call is recorded in it.
+     Calls to the functions in the ignore packs (see ignore_packs.resolve) are left
+     out.'''
+     with _instrument.span('ast.parse', file=filename):
+          tree = parse_file(filename)
+     with _instrument.span('traverse', file=filename):
+          visitor = PythonTraverser(filename, sites, ignore_packs.resolve(ignore))
+          #print('starting traversal')
+          visitor.visit(tree)
+          return visitor.result()
@@ -33,6 +33,10 @@
 
 from collections import OrderedDict as _OrderedDict
 from copy import deepcopy as _deepcopy
+from types import MappingProxyType as _MappingProxy
+from codeschematics import dot as _dot
+from codeschematics import instrument as _instrument
+from codeschematics.algorithms import longest_path_levels, shortest_path_levels
 _gv = None # Conditional graphviz import to minimize dependencies
 
 
@@ -50,7 +54,10 @@ class _Tree(_OrderedDict): # The auto-vivifaction was cool, but explicit > impli
      def __setitem__(self, key, value):
           if not isinstance(value, self.__class__):
                raise TypeError("{0} child values can only be other instances of {0}".format(self.__class__))
-          super().__setitem__(key, value)
+          self._link(key, value)
+
+     def _link(self, key, value):
+          _OrderedDict.__setitem__(self, key, value)
           value._parents[self._name] = self
 
      def __reduce_ex__(self, protocol):
@@ -76,11 +83,17 @@ class _Tree(_OrderedDict): # The auto-vivifaction was cool, but explicit > impli
           '''Depth first unique traversal of the tree. The starting node isn't yielded'''
           if visited is None:
                visited = set()
-          for child in self.values():
-               if child not in visited:
-                    visited.add(child)
-                    yield child
-                    yield from child.tree_iter(visited)
+          # Iterative rather than recursive, since call chains can be thousands deep
+          stack = [iter(self.values())]
+          while stack:
+               for child in stack[-1]:
+                    if child not in visited:
+                         visited.add(child)
+                         yield child
+                         stack.append(iter(child.values()))
+                         break
+               else:
+                    stack.pop()
 
      def destroy(self):
           # Destroy our childrens' references to us
@@ -93,6 +106,31 @@ class _Tree(_OrderedDict): # The auto-vivifaction was cool, but explicit > impli
           self.clear()
 
 
+class _FrozenTree(_Tree):
+     '''A _Tree node that can't be changed once built (see FrozenPresenter)'''
+
+     def _immutable(self, *args, **kwargs):
+          raise TypeError('the call tree of a FrozenPresenter is immutable')
+
+     __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = move_to_end = _immutable
+     destroy = _immutable
+
+
+def _clone_tree(tree, cls):
+     # Copies a call tree (from its root node) into all-new nodes of the given _Tree
+     # class, returning (the new root, dict of each function --> its new node).
+     # Iterative, unlike deepcopy, so deep call chains are no problem
+     nodes = {node.name: cls(node.name) for node in tree.tree_iter()}
+     for node in tree.tree_iter():
+          copy = nodes[node.name]
+          for call in node:
+               copy._link(call, nodes[call])
+     root = cls(tree.name)
+     for func in tree:
+          root._link(func, nodes[func])
+     return root, nodes
+
+
 ################################################################################
 # Now the public interface
 
@@ -103,12 +141,15 @@ class Presenter:
         
         This class is effectively immutable. The filter methods distill the call
         structure to its more essential forms, as defined by the programmer; they return
-        a new Presenter whose underlying data has been suitably pared down.
+        a new Presenter whose underlying data has been suitably pared down. (It does
+        cache things on itself, though, such as to_graphviz's graph; freeze() makes a
+        snapshot that is truly immutable, for sharing between threads.)
         
         These filtered Presenters have all the same "view" methods as the "full" original,
         and calling them will produce the requested view."""
 
-     # Current data attributes: _data, _tree, and _func_to_node
+     # Current data attributes: _data, _tree, _func_to_node, _weights and _costs, and
+     # _levels, a cache of the levels() results (which the in place filters must clear)
 
      ###########################################################################
      # Used for creating copies for the filter methods
@@ -116,6 +157,12 @@ class Presenter:
      # _copy copies from other to self. This should really only be called during construction/initialization
      def _copy(self, other):
           self._data = other._data.copy()
+          self._weights = other._weights # Never modified, so may be shared
+          self._costs = other._costs
+          self._levels = {}
+          if isinstance(other, FrozenPresenter): # Its nodes can't be deep copied (nor need checking)
+               self._tree, self._func_to_node = _clone_tree(other._tree, _Tree)
+               return
           self._tree = _deepcopy(other._tree)
           self._func_to_node = {}
           self._recreate_func_to_node(self._tree)
@@ -140,7 +187,13 @@ class Presenter:
 
      ###########################################################################
 
-     def __init__(self, data):
+     def __init__(self, data, weights=None, costs=None, roots=None):
+          '''data is the function call dictionary. Optionally, for graphs with performance
+          data (such as from the tracer or profiles modules), weights maps (caller, callee)
+          edges to (calls, seconds) pairs, and costs maps functions to their inclusive
+          time in seconds (if not given, it's derived from the weights). If the defined
+          functions nothing calls are already known (say, from a merge.Merger), they may
+          be given as roots, in the order of data, and aren't worked out again.'''
           if isinstance(data, self.__class__):
                self._copy(data)
                return
@@ -156,10 +209,21 @@ class Presenter:
                          raise ValueError("function {} has duplicate entries for {}".format(func, call))
 
           self._data = data
-          self._make_tree()
-
-
-     def _make_tree(self):
+          self._weights = weights
+          if costs is None and weights is not None:
+               costs = self._derive_costs(data, weights)
+          self._costs = costs
+          self._levels = {}
+          with _instrument.span('Presenter._make_tree') as sp:
+               self._make_tree(roots)
+               if _instrument.enabled():
+                    edges = sum(len(node) for node in self._func_to_node.values())
+                    sp.set(nodes=len(self._func_to_node), edges=edges)
+                    _instrument.count('tree nodes', len(self._func_to_node))
+                    _instrument.count('tree edges', edges)
+
+
+     def _make_tree(self, roots=None):
           self._tree = None
           # "tree" is a very loosely used term here. The data may contain multiple disconnected
           # trees, or a tree with more than one unique root node (i.e. node with no parents),
@@ -170,7 +234,10 @@ class Presenter:
           # dictionary to map each function to its corresponding node, since we don't yet know
           # the structure of the tree
           func_to_node = {}
-          parentless = set() # A temp dict to figure out what's top level
+          # A temp dict to figure out what's top level. Ordered, as is everything below, so
+          # that the roots (and so every view, e.g. the DOT source) come out the same from
+          # run to run rather than in set iteration order
+          parentless = _OrderedDict()
 
           # We process child function calls by 1) adding them to the tree (by merely accessing
           # node[child], since Tree default constructs nodes) and 2) adding the newly created
@@ -180,14 +247,16 @@ class Presenter:
                if func in func_to_node:       # This function already has a node (i.e. is
                     node = func_to_node[func] # a child of some other function)
                else: # This function doesn't yet exist in the tree
-                    parentless.add(func)
+                    if roots is None:
+                         parentless[func] = None
                     func_to_node[func] = node = _Tree(func)
 
                for call in calls:
                     # add call as a child of node
                     if call in func_to_node:
                          node[call] = func_to_node[call]
-                         parentless.discard(call) # Silent if call not in parentless
+                         if roots is None:
+                              parentless.pop(call, None) # Silent if call not in parentless
                          # If this call is part of a standalone loop, the entire loop will
                          # eventually be marked as parented, and thus not accessible from
                          # the root node. Fixed below
@@ -196,60 +265,147 @@ class Presenter:
 
           # We use a root node to host all top level parents
           self._tree = _Tree(None) # Empty name
-          for func in parentless:
+          for func in (parentless if roots is None else roots):
                self._tree[func] = func_to_node[func]
 
           # As noted above, standalone loops would be marked as parented yet won't be accessible
           # Manually verify now, by traversing everything and seeing what's missing
-          visited = set(self._tree.tree_iter()) | set(self._tree)
-          missing = set(func_to_node.values()) - visited
+          visited = set(self._tree.tree_iter()) | set(self._tree.values())
+          missing = [node for node in func_to_node.values() if node not in visited]
           # The hard part is figuring how many standalone loops there are in missing, and
-          # which nodes should be the highest level parents
-          while missing:
-               new_top_level = self._find_parent(missing.pop()) # set.pop() returns an arbitrary element
-               self._tree[new_top_level.name] = new_top_level
-               newly_in_tree = set(new_top_level.tree_iter())
-               missing -= newly_in_tree
+          # which nodes should be the highest level parents. They're settled in the order
+          # the functions were first seen, skipping those an earlier loop already reached
+          with _instrument.span('Presenter._find_parent loops', missing=len(missing)):
+               for node in missing:
+                    if node in visited:
+                         continue
+                    new_top_level = self._find_parent(node)
+                    self._tree[new_top_level.name] = new_top_level
+                    visited.add(new_top_level)
+                    visited.update(new_top_level.tree_iter(visited))
 
           self._func_to_node = func_to_node
 
 
+     @staticmethod
+     def _derive_costs(data, weights):
+          # A function's inclusive time is the time spent in it from all its callers,
+          # excluding recursive calls (already counted in the outer call). Functions with
+          # no callers have no incoming time, so use the time of what they call instead.
+          costs = {}
+          for (caller, callee), (calls, seconds) in weights.items():
+               if caller != callee:
+                    costs[callee] = costs.get(callee, 0) + seconds
+          for func, calls in data.items():
+               if func not in costs:
+                    costs[func] = sum(weights.get((func, call), (0, 0))[1] for call in calls if call != func)
+          return costs
+
+
      # Now some _make_tree helper methods
 
-     def _find_parent(self, node):
+     @staticmethod
+     def _find_parent(node):
           # _make_tree helper method: for a given node, finds its "farthest parent"
           # The given node is assumed to be (as yet) independent of self._tree, as part
           # of a standalone loop
           # Since said loop may have children though, we can't assume that every node in
           # the loop would make a suitable parent
-          self._max = 0
-          self._node = node
-          self._find_parent_(node)
-          node = self._node
-          del self._node
-          del self._max
-          return node
-
-     def _find_parent_(self, node, visited=None, cur=0):
-          # _find_parent recursive method: for a given node, finds its "farthest parent"
-          # We assume that if visited is not None, then the current node is already in it
-          if visited is None:
-               visited = set(node)
-          if cur > self._max:
-               self._max = cur
-               self._node = node
-          for _, parent in node.parents():
-               if parent not in visited:
-                    visited.add(parent)
-                    self._find_parent_(parent, visited, cur+1)
+          # A depth first search up the parents, the farthest being the one found at the
+          # greatest depth. Iterative, and with the best so far in locals rather than on
+          # self, so it neither overflows the stack nor mutates the Presenter
+          best, best_depth = node, 0
+          visited = set()
+          stack = [(iter(node.parents()), 0)]
+          while stack:
+               parents, depth = stack[-1]
+               for _, parent in parents:
+                    if parent not in visited:
+                         visited.add(parent)
+                         if depth + 1 > best_depth:
+                              best, best_depth = parent, depth + 1
+                         stack.append((iter(parent.parents()), depth + 1))
+                         break
+               else:
+                    stack.pop()
+          return best
+
+
+     ###########################################################################
+     # Simple queries on the call structure
+
+     def functions(self):
+          '''Returns the names of all functions in the tree, defined or not'''
+          return self._func_to_node.keys()
+
+     def roots(self):
+          '''Returns the names of the top level functions, i.e. those the views start from'''
+          return tuple(self._tree)
+
+     def call_dict(self):
+          '''Returns the (possibly filtered) call structure in the same form the constructor
+          takes: an OrderedDict of each defined function --> tuple of the functions it calls'''
+          return _OrderedDict((func, tuple(self._func_to_node[func]))
+                              for func in self._data if func in self._func_to_node)
+
+     def callees(self, func):
+          '''Returns the functions called by func, in call order'''
+          return tuple(self._func_to_node[func])
+
+     def callers(self, func):
+          '''Returns the functions that call func (in no particular order)'''
+          # The root node is a parent of every top level function, but it's not a caller
+          return tuple(name for name, _ in self._func_to_node[func].parents() if name is not None)
+
+     def weight(self, caller, callee):
+          '''Returns the (calls, seconds) weight of the given edge, or None if this
+          Presenter has no performance data (or none for that edge)'''
+          if self._weights is None:
+               return None
+          return self._weights.get((caller, callee))
+
+     def cost(self, func):
+          '''Returns the inclusive time in seconds of the given function, or None if this
+          Presenter has no performance data (or none for that function)'''
+          if self._costs is None:
+               return None
+          return self._costs.get(func)
+
+     def levels(self, mode='longest'):
+          '''Returns a dict of each function --> its level, i.e. its depth in the call
+          structure. With mode 'longest', that's the longest call chain down to it from a
+          function nothing calls (the members of a cycle of calls share a level); with
+          'shortest', the shortest call chain from one of the roots. Either takes linear
+          time, and the result is cached.'''
+          try:
+               return self._levels[mode]
+          except KeyError:
+               pass
+          levels = self._compute_levels(mode)
+          self._levels[mode] = levels
+          return levels
+
+     def _compute_levels(self, mode):
+          successors = lambda func: self._func_to_node[func].keys()
+          with _instrument.span('Presenter.levels', mode=mode):
+               if mode == 'longest':
+                    return longest_path_levels(self._func_to_node, successors)
+               elif mode == 'shortest':
+                    return shortest_path_levels(self._tree, successors)
+               raise ValueError("mode should be 'longest' or 'shortest' (got {!r})".format(mode))
+
+     def _by_level(self, funcs, levels):
+          # The functions shallowest first, keeping call order among those on one level
+          return sorted(funcs, key=levels.__getitem__) if levels is not None else funcs
 
 
      ###########################################################################
      # The view methods. For now, we only have a plain text representation.
 
-     def _to_plain_text(self, func, chain=None, prefix='', indent='      '):
+     def _to_plain_text(self, func, chain=None, prefix='', indent='      ', levels=None):
           # A simple recursive depth first traversal of the tree. Chain records
-          # the call chain for duplicate/recursion detection.
+          # the call chain for duplicate/recursion detection. With levels, each
+          # function's calls are listed by level rather than in call order
           if chain is None:
                chain = []
           if func not in self._data.keys():
@@ -257,76 +413,164 @@ class Presenter:
           # else:
           out = prefix + func + '():\n'
           strs = []
-          for call in self._func_to_node[func]:
+          for call in self._by_level(self._func_to_node[func], levels):
                if call in chain:
                     # Allow exactly one duplicate as the tail of the chain
                     strs.append(prefix + indent + call + '()')
                else: # no duplicates, continue recursing
                     chain.append(call)
-                    s = self._to_plain_text(call, chain, prefix+indent)
+                    s = self._to_plain_text(call, chain, prefix+indent, indent, levels)
                     if s: # Don't add an entry (i.e. extra newline) for leaf nodes
                          strs.append(s)
                     chain.pop()
           return out + '\n'.join(strs)
 
 
-     def to_plain_text(self, indent='      '):
+     def to_plain_text(self, indent='      ', depth_order=None):
           """This renders the Presenter object in a simple plain text tree,
-             with suitable indentation. It's essentially a "pretty printer"."""
+             with suitable indentation. It's essentially a "pretty printer".
 
+             By default each function's calls are listed in call order; with
+             depth_order 'longest' or 'shortest', they're listed shallowest first
+             by that mode of levels()."""
+
+          levels = self.levels(depth_order) if depth_order else None
           # The helper method starts with a parent node and traverses the tree depth first
-          return '\n'.join(self._to_plain_text(call, indent=indent) for call in self._tree)
+          return '\n'.join(self._to_plain_text(call, indent=indent, levels=levels)
+                           for call in self._by_level(self._tree, levels))
 
 
      __str__ = to_plain_text
 
 
-     def to_graphviz(self):
+     def to_graphviz(self, cost=None, ranks=None):
           '''This converts the tree to a format usable by the graphviz library to produce images.
           Call the graphviz_render or its related aliases to actually create the image.
           You needn't call this function first, graphviz_render will do that for you.
 
+          If cost is true (the default when this Presenter has performance data), nodes
+          are coloured from blue to red and labeled by their share of the total time, and
+          edges are drawn thicker the more time they account for.
+
+          With ranks 'longest' or 'shortest', the functions on each level (by that mode
+          of levels()) are drawn in a row, and edges are added shallowest callee first.
+          Besides making deep graphs easier to read, the fixed ranks save dot much of
+          its layout work on large graphs.
+
           The result is cached on the object in the 'graphviz' attribute.'''
+          graph = self._make_graphviz(cost, ranks)
+          self.graphviz = graph
+          return graph
+
+     def _make_graphviz(self, cost, ranks):
           global _gv
           if _gv is None:
                import graphviz as _gv
-          graph = _gv.Digraph(graph_attr={'labelloc': 't', 'labelfontsize': '20'},
-                              node_attr={'shape': 'oval', 'color': 'purple', 'style': 'filled',
-                                         'fontcolor': 'white'})
-          for node in self._tree.tree_iter():
-               if node.keys():
-                    graph.edges((node.name, func) for func in node)
-               else:
-                    graph.node(node.name)
-          self.graphviz = graph
+          with _instrument.span('Presenter.to_graphviz'):
+               graph = _gv.Digraph(graph_attr=self._graph_attr, node_attr=self._node_attr)
+               self._fill_graph(graph, cost, ranks)
           return graph
 
-     def graphviz_render(self, format, filename):
-          '''Renders the tree via graphviz, writing to "{filename}.{format}"'''
-          try:
-               graph = self.graphviz
-          except AttributeError:
-               graph = self.to_graphviz()
+     def write_dot(self, out, cost=None, ranks=None):
+          '''Writes the same graph as to_graphviz as DOT source to the text file object
+          out, as it goes (see the dot module). This doesn't need the graphviz package,
+          and takes memory independent of the size of the graph.'''
+          with _instrument.span('Presenter.write_dot'):
+               with _dot.DotWriter(out, graph_attr=self._graph_attr, node_attr=self._node_attr) as graph:
+                    self._fill_graph(graph, cost, ranks)
+
+     _graph_attr = {'labelloc': 't', 'labelfontsize': '20'}
+     _node_attr = {'shape': 'oval', 'color': 'purple', 'style': 'filled', 'fontcolor': 'white'}
+
+     def _fill_graph(self, graph, cost, ranks):
+          # Adds the nodes and edges to a graphviz Digraph or a DotWriter
+          if cost is None:
+               cost = self._costs is not None
+          levels = self.levels(ranks) if ranks else None
+          if cost:
+               self._add_costs_to_graphviz(graph, levels)
+          else:
+               for node in self._tree.tree_iter():
+                    if node.keys():
+                         graph.edges((node.name, func) for func in self._by_level(node, levels))
+                    else:
+                         graph.node(node.name)
+          if levels is not None:
+               self._add_ranks_to_graphviz(graph, levels)
 
+     def _add_ranks_to_graphviz(self, graph, levels):
+          rows = {}
+          for node in self._tree.tree_iter():
+               rows.setdefault(levels[node.name], []).append(node.name)
+          for level in sorted(rows):
+               with graph.subgraph(graph_attr={'rank': 'same'}) as row:
+                    for func in rows[level]:
+                         row.node(func)
+
+     def _add_costs_to_graphviz(self, graph, levels=None):
+          costs = self._costs or {}
+          weights = self._weights or {}
+          total = max([costs.get(func, 0) for func in self._tree] + [0]) or 1
+          for node in self._tree.tree_iter():
+               share = min(costs.get(node.name, 0) / total, 1)
+               # Hue runs from 0.66 (blue, cold) to 0 (red, hot)
+               graph.node(node.name, label='{}\\n{:.3g}s ({:.1%})'.format(node.name, costs.get(node.name, 0), share),
+                          fillcolor='{:.3f} 0.85 0.85'.format(0.66 * (1 - share)), color='black',
+                          fontsize=str(round(14 + 10 * share)))
+               for func in self._by_level(node, levels):
+                    calls, seconds = weights.get((node.name, func), (0, 0))
+                    graph.edge(node.name, func, label=str(calls) if calls else '',
+                               penwidth='{:.2f}'.format(1 + 7 * min(seconds / total, 1)))
+
+     def graphviz_render(self, format, filename, cost=None, ranks=None, layout=None):
+          '''Renders the tree via graphviz, writing to "{filename}.{format}". If
+          to_graphviz has been called, its cached graph is rendered; otherwise the DOT
+          source is streamed straight into the dot program (with the given cost and ranks
+          options, as for to_graphviz), which doesn't need the graphviz package.
+
+          With a layout filename, the node positions are saved there, and the next
+          render given the same file keeps the unchanged nodes where they were and lays
+          out only the rest (see the layout module).'''
           fname = filename + '.' + format
+          if layout is not None:
+               from codeschematics.layout import render
+               calls = {func: tuple(node) for func, node in self._func_to_node.items()}
+               render(lambda out: self._fill_graph(out, cost, ranks), calls, format, fname, layout,
+                      graph_attr=self._graph_attr, node_attr=self._node_attr)
+               return
+          graph = getattr(self, 'graphviz', None)
+          if graph is None:
+               with _instrument.span('dot.render', format=format, file=fname):
+                    _dot.render(lambda out: self._fill_graph(out, cost, ranks), format, fname,
+                                graph_attr=self._graph_attr, node_attr=self._node_attr)
+               return
+
+          with _instrument.span('graphviz.pipe', format=format, file=fname):
+               data = graph.pipe(format)
           with open(fname, 'wb') as f:
-               f.write(graph.pipe(format))
+               f.write(data)
 
      # A handy dandy helper to to create shorthand methods for all formats known to graphviz
-     # This is a nop if graphviz can't be imported
-     try:
-          from graphviz.files import FORMATS as _FORMATS
-     except ImportError:
-          pass
-     else:
-          for format in _FORMATS:
-               format = format.replace('.', '_').replace('-', '_') # Some formats would be syntactically invalid
-               exec(
-            '''def to_{format}(self, filename):                            \n'''
-            '''     " == graphviz_render('{format}', filename)"         \n'''
-            '''     return self.graphviz_render('{format}', filename)   \n'''
-               .format(format=format) # Kappa
-               )
+     for format in sorted(_dot.FORMATS):
+          method = format.replace('.', '_').replace('-', '_') # Some formats would be syntactically invalid
+          exec(
+       '''def to_{method}(self, filename):                            \n'''
+       '''     " == graphviz_render('{format}', filename)"         \n'''
+       '''     return self.graphviz_render('{format}', filename)   \n'''
+          .format(method=method, format=format) # Kappa
+          )
+     del format, method
+
+     def freeze(self):
+          '''Returns an immutable snapshot of this Presenter (see FrozenPresenter), which
+          any number of threads may query and render at once'''
+          return FrozenPresenter(self)
+
+     def merge(self, *others):
+          '''Returns a new Presenter of the union of this one's call structure and the
+          others' (see the merge module), leaving them all intact'''
+          from codeschematics.merge import merge_presenters
+          return merge_presenters((self,) + others)
 
      ###########################################################################
      # Now the filter methods. They return new Presenter instances, suitably
@@ -338,8 +582,10 @@ class Presenter:
      def default_filter(self):
           """This creates a copy of this Presenter instance, except all functions
              lacking a "definition" are deleted from the call tree."""
-          out = self.deepcopy()
-          out._default_filter()
+          with _instrument.span('Presenter.deepcopy'):
+               out = self.deepcopy()
+          with _instrument.span('Presenter._default_filter'):
+               out._default_filter()
           return out
 
      def _default_filter(self):
@@ -354,4 +600,176 @@ class Presenter:
                     pass
                else:
                     node.destroy()
+          self._levels.clear()
+
+
+     def subgraph(self, roots, max_depth=None):
+          """This creates a new Presenter containing only the given root functions and
+             whatever they (transitively) call, optionally limited to max_depth levels
+             of calls below the roots."""
+          # A breadth first traversal, so that each function is reached at its shallowest
+          # depth. Functions at the depth limit are kept, but only as leaves
+          depth = _OrderedDict()
+          for func in roots:
+               if func not in self._func_to_node:
+                    raise KeyError('function {} is not in the call tree'.format(func))
+               depth.setdefault(func, 0)
+          queue = list(depth)
+          for func in queue: # queue grows as we go
+               if max_depth is not None and depth[func] >= max_depth:
+                    continue
+               for call in self._func_to_node[func]:
+                    if call not in depth:
+                         depth[call] = depth[func] + 1
+                         queue.append(call)
+
+          data = _OrderedDict()
+          for func, d in depth.items():
+               if func in self._data and (max_depth is None or d < max_depth):
+                    data[func] = tuple(self._func_to_node[func])
+          return self.__class__(data, self._weights, self._costs)
+
+     def hot_filter(self, top_k=None, fraction=None):
+          """For Presenters with performance data, this creates a new Presenter with only
+             the heaviest call paths: the top_k functions by inclusive time, and/or the
+             functions (and calls) taking at least the given fraction of the total time."""
+          if self._costs is None:
+               raise ValueError('hot_filter needs a Presenter with performance data (weights or costs)')
+          if top_k is None and fraction is None:
+               raise ValueError('give at least one of top_k and fraction')
+          costs = self._costs
+          funcs = [func for func in self._func_to_node if func in costs]
+          if top_k is not None:
+               funcs.sort(key=lambda func: costs[func], reverse=True)
+               funcs = funcs[:top_k]
+          # A caller's inclusive time is at least that of its heaviest callee, so the
+          # heaviest functions form paths down from the roots
+          min_seconds = 0
+          if fraction is not None:
+               total = max(costs.get(func, 0) for func in self._tree) if self._tree else 0
+               min_seconds = fraction * total
+               funcs = [func for func in funcs if costs[func] >= min_seconds]
+          keep = set(funcs)
+
+          data = _OrderedDict()
+          for func in self._func_to_node:
+               if func in keep and func in self._data:
+                    weights = self._weights or {}
+                    data[func] = tuple(call for call in self._func_to_node[func] if call in keep and
+                                         weights.get((func, call), (0, min_seconds))[1] >= min_seconds)
+          return self.__class__(data, self._weights, self._costs)
+
+
+class FrozenPresenter(Presenter):
+     """An immutable snapshot of a Presenter, made by Presenter.freeze (or by passing
+        a call dict or a Presenter to the constructor). Nothing about it can change
+        after construction: its attributes can't be set, its call tree nodes refuse
+        changes, and it owns copies of everything it was made from. So one snapshot
+        may be shared by any number of threads (say, those of a web service) without
+        copies or locks.
+
+        The queries are answered from indexes built at construction (the roots and
+        each function's callers and callees), and the text and DOT views are memoized
+        once rendered, as are levels(). Those memos are filled without locking: racing
+        threads may each render a view, but they store the same immutable result.
+
+        Its filter methods return new FrozenPresenters; thaw() returns an ordinary,
+        independent Presenter."""
+
+     def __init__(self, data, weights=None, costs=None, roots=None):
+          source = data if isinstance(data, Presenter) else Presenter(data, weights, costs, roots)
+          init = lambda name, value: object.__setattr__(self, name, value)
+          with _instrument.span('Presenter.freeze') as sp:
+               tree, func_to_node = _clone_tree(source._tree, _FrozenTree)
+               init('_data', _OrderedDict((func, tuple(calls)) for func, calls in source._data.items()))
+               init('_weights', dict(source._weights) if source._weights is not None else None)
+               init('_costs', dict(source._costs) if source._costs is not None else None)
+               init('_tree', tree)
+               init('_func_to_node', func_to_node)
+               init('_roots', tuple(tree))
+               init('_callees', {func: tuple(node) for func, node in func_to_node.items()})
+               init('_callers', {func: tuple(name for name, _ in node.parents() if name is not None)
+                                 for func, node in func_to_node.items()})
+               init('_call_dict', tuple((func, self._callees[func]) for func in self._data
+                                        if func in func_to_node))
+               init('_levels', {}) # The memos
+               init('_views', {})
+               sp.set(nodes=len(func_to_node))
+
+     def __setattr__(self, name, value):
+          raise AttributeError('{} is immutable'.format(self.__class__.__name__))
+
+     def __delattr__(self, name):
+          raise AttributeError('{} is immutable'.format(self.__class__.__name__))
+
+     def __reduce__(self):
+          return (self.__class__, (self.thaw(),))
+
+     def freeze(self):
+          return self
+
+     def thaw(self):
+          '''Returns an ordinary (mutable, in the in place filters' sense) Presenter of
+          the same call structure'''
+          return Presenter(self)
+
+     def deepcopy(self):
+          return self # Being immutable, it may be shared
+
+     def roots(self):
+          return self._roots
 
+     def call_dict(self):
+          return _OrderedDict(self._call_dict)
+
+     def callees(self, func):
+          return self._callees[func]
+
+     def callers(self, func):
+          return self._callers[func]
+
+     def levels(self, mode='longest'):
+          try:
+               return self._levels[mode]
+          except KeyError:
+               pass
+          levels = _MappingProxy(self._compute_levels(mode)) # Read only, as it's shared
+          self._levels[mode] = levels
+          return levels
+
+     def _view(self, key, render):
+          try:
+               return self._views[key]
+          except KeyError:
+               pass
+          view = render()
+          self._views[key] = view
+          return view
+
+     def to_plain_text(self, indent='      ', depth_order=None):
+          return self._view(('text', indent, depth_order),
+                            lambda: Presenter.to_plain_text(self, indent, depth_order))
+
+     __str__ = to_plain_text
+
+     def dot_source(self, cost=None, ranks=None):
+          '''Returns the DOT source that write_dot writes (memoized)'''
+          return self._view(('dot', cost, ranks),
+                            lambda: _dot.source(lambda graph: self._fill_graph(graph, cost, ranks),
+                                                graph_attr=self._graph_attr, node_attr=self._node_attr))
+
+     def write_dot(self, out, cost=None, ranks=None):
+          out.write(self.dot_source(cost, ranks))
+
+     def to_graphviz(self, cost=None, ranks=None):
+          '''Returns a new graphviz Digraph, as Presenter.to_graphviz does, except that
+          it isn't cached on the object (a Digraph being mutable); graphviz_render
+          streams the source instead'''
+          return self._make_graphviz(cost, ranks)
+
+     def default_filter(self):
+          with _instrument.span('Presenter.deepcopy'):
+               out = self.thaw()
+          with _instrument.span('Presenter._default_filter'):
+               out._default_filter()
+          return self.__class__(out)
@@ -0,0 +1,162 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Importers for existing profiles, producing weighted call graphs: cProfile/profile
+dumps (as read by the pstats module), and "collapsed stack" files as used by
+flamegraph.pl, py-spy, perf script | stackcollapse-perf.pl and many others.
+
+Each importer returns (call dict, weights, costs), where weights maps (caller, callee)
+edges to (calls, seconds) and costs maps each function to its inclusive seconds;
+pass all three to the Presenter, or use the load_* shorthands. Combined with
+Presenter.hot_filter, this shows the performance critical structure of a program:
+
+     presenter = load_pstats('service.prof').hot_filter(fraction=0.05)
+     presenter.to_svg('hot')
+
+Callees are ordered by decreasing time, since profiles don't record call order.'''
+
+import re as _re
+from collections import OrderedDict as _OrderedDict
+
+from codeschematics.presentation import Presenter
+
+
+def _sorted_call_dict(calls, weights):
+     # calls is func --> set of callees; order each by decreasing time, ties by name
+     return _OrderedDict((func, tuple(sorted(callees, key=lambda callee: (-weights[func, callee][1], callee))))
+                         for func, callees in calls.items())
+
+
+################################################################################
+# pstats
+
+_BUILTIN = _re.compile(r"^<built-in method (?:builtins\.)?(.+)>$|^<method '(.+)' of '.+' objects>$")
+
+def _pstats_name(key, names):
+     filename, line, funcname = key
+     if names == 'full':
+          return '{}:{}({})'.format(filename, line, funcname)
+     if funcname == '<module>':
+          return '__module__'
+     match = _BUILTIN.match(funcname)
+     if match:
+          return match.group(1) or match.group(2)
+     return funcname
+
+
+def pstats_call_dict(profile, names='name'):
+     '''Reads a profile (a filename, or anything pstats.Stats accepts, including a
+     cProfile.Profile) into (call dict, weights, costs). names='name' uses bare function
+     names, like the static parsers (merging same-named functions); names='full'
+     keeps them apart as "file:line(name)".'''
+     import pstats
+     stats = profile if isinstance(profile, pstats.Stats) else pstats.Stats(profile)
+     calls = _OrderedDict()
+     weights = {}
+     costs = {}
+     # stats.stats is {callee: (primitive calls, calls, own time, cumulative time, callers)}
+     # where callers is {caller: (primitive calls, calls, own time, cumulative time)} for
+     # that edge alone
+     for key, (cc, nc, tt, ct, callers) in stats.stats.items():
+          callee = _pstats_name(key, names)
+          calls.setdefault(callee, set())
+          costs[callee] = costs.get(callee, 0) + ct
+          for caller_key, edge in callers.items():
+               caller = _pstats_name(caller_key, names)
+               calls.setdefault(caller, set()).add(callee)
+               # Older pstats stored just the call count per caller
+               enc, ect = (edge[1], edge[3]) if isinstance(edge, tuple) else (edge, 0)
+               count, seconds = weights.get((caller, callee), (0, 0))
+               weights[caller, callee] = (count + enc, seconds + ect)
+     return _sorted_call_dict(calls, weights), weights, costs
+
+
+def load_pstats(profile, names='name'):
+     '''Returns a Presenter of the given profile; see pstats_call_dict'''
+     return Presenter(*pstats_call_dict(profile, names))
+
+
+################################################################################
+# Collapsed stacks
+
+# py-spy appends " (file.py:123)" to each frame, perf appends "_[k]" and the like
+_FRAME_SUFFIX = _re.compile(r' \([^()]*\)$|_\[[a-z]\]$')
+
+def _sample_count(text):
+     # The count ending a collapsed stack line, or None if it isn't a number
+     try:
+          return int(text)
+     except ValueError:
+          pass
+     try:
+          return float(text)
+     except ValueError:
+          return None
+
+
+def collapsed_call_dict(lines, sample_seconds=None, strip=True):
+     '''Reads collapsed stacks (an iterable of lines, such as an open file, or a
+     filename): each line is "root;caller;...;leaf COUNT". Lines are processed one at a
+     time, so files of any size can be read.
+
+     Counts are numbers of samples; if sample_seconds is given (the sampling interval),
+     times are samples * sample_seconds, otherwise the "seconds" are just the sample
+     counts. The calls count of an edge is the number of samples it appeared in. With
+     strip, per-frame decorations such as py-spy's " (file:line)" are removed. Blank
+     lines are skipped; a line without a number for its count raises ValueError, giving
+     its line number.'''
+     if isinstance(lines, str):
+          with open(lines) as f:
+               return collapsed_call_dict(f, sample_seconds, strip)
+     scale = 1 if sample_seconds is None else sample_seconds
+     calls = _OrderedDict()
+     samples = {} # edge --> samples
+     costs = {}
+     for number, line in enumerate(lines, 1):
+          line = line.rstrip('\n')
+          if not line.strip():
+               continue
+          stack, _, count = line.rpartition(' ')
+          count = _sample_count(count) if stack else None
+          if count is None:
+               where = '{}, '.format(lines.name) if hasattr(lines, 'name') else ''
+               raise ValueError('{}line {}: expected "stack COUNT", got {!r}'.format(where, number, line))
+          frames = stack.split(';')
+          if strip:
+               frames = [_FRAME_SUFFIX.sub('', frame) for frame in frames]
+          # Count each function and edge once per stack, however deep the recursion
+          seen = set()
+          for i, frame in enumerate(frames):
+               if frame not in seen:
+                    seen.add(frame)
+                    costs[frame] = costs.get(frame, 0) + count * scale
+                    calls.setdefault(frame, set())
+               if i:
+                    edge = (frames[i-1], frame)
+                    if edge not in seen:
+                         seen.add(edge)
+                         calls[edge[0]].add(frame)
+                         samples[edge] = samples.get(edge, 0) + count
+     weights = {edge: (n, n * scale) for edge, n in samples.items()}
+     return _sorted_call_dict(calls, weights), weights, costs
+
+
+def load_collapsed(lines, sample_seconds=None, strip=True):
+     '''Returns a Presenter of the given collapsed stacks; see collapsed_call_dict'''
+     return Presenter(*collapsed_call_dict(lines, sample_seconds, strip))
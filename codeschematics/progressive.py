@@ -0,0 +1,176 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Parses a big tree a file at a time, handing out the graph so far every so often,
+so that something useful is there within seconds rather than at the very end, and
+stopping whenever a time budget runs out.
+
+     for presenter, progress in snapshots(paths, roots=['main'], budget=30):
+          print(progress)
+          show(presenter)
+
+The most useful files are parsed first: with roots, the files defining the roots,
+then those defining what they call, and so on (found with an index.DefinitionIndex,
+which is built if not given), nearest the roots first; then all the rest, smallest
+first, so the graph grows as quickly as it can. The parts are combined with a
+merge.Merger as they come, and a snapshot Presenter is only built every interval
+seconds (and at the end), which keeps the cost of the snapshots down.'''
+
+import copy as _copy
+import heapq as _heapq
+import os as _os
+import time as _time
+
+from codeschematics import instrument as _instrument
+from codeschematics.cache import cached_parse, detect_language
+from codeschematics.merge import Merger
+
+
+_FAR = float('inf') # The priority of the files no root leads to
+
+
+class Progress:
+     '''How far an analysis has got. complete is set once every file has been tried,
+     and stopped if the time budget ran out first. nested_funcs is the set of nested
+     functions found so far, as the parsers return it.'''
+
+     def __init__(self, files_total):
+          self.files_total = files_total
+          self.files_parsed = 0
+          self.files_failed = 0
+          self.functions = 0
+          self.calls = 0
+          self.elapsed = 0.0
+          self.complete = False
+          self.stopped = False
+          self.nested_funcs = set()
+
+     def __repr__(self):
+          return ('<Progress {} of {} files ({} failed), {} functions, {} calls, {:.2f}s{}>'
+                  .format(self.files_parsed, self.files_total, self.files_failed, self.functions,
+                          self.calls, self.elapsed,
+                          ', complete' if self.complete else ', stopped' if self.stopped else ''))
+
+
+class _FileQueue:
+     # The files left to parse, by priority: (distance from the roots, size)
+
+     def __init__(self, paths):
+          self._heap = []
+          self._paths = {} # Absolute path --> the path as given
+          self._done = set()
+          for path in paths:
+               self._paths.setdefault(_os.path.abspath(path), path)
+          for key in self._paths:
+               self.push(key, _FAR)
+
+     def push(self, key, distance):
+          if key in self._paths and key not in self._done:
+               try:
+                    size = _os.path.getsize(key)
+               except OSError:
+                    size = 0
+               _heapq.heappush(self._heap, (distance, size, key))
+
+     def pop(self):
+          '''Returns the given path of the next file to parse, or None when there are none'''
+          heap = self._heap
+          while heap:
+               key = _heapq.heappop(heap)[2]
+               if key not in self._done: # Files may be queued more than once
+                    self._done.add(key)
+                    return self._paths[key]
+          return None
+
+
+def snapshots(paths, roots=(), index=None, cache=None, language=None, parser_args=None,
+              budget=None, interval=1.0):
+     '''Parses the paths in priority order (see above), yielding a (Presenter,
+     Progress) pair of the graph so far at least every interval seconds, and once more
+     at the end. With a budget (in seconds), stops after the first file finishing past
+     it. A file that fails to parse is counted and skipped. cache is a GraphCache, and
+     parser_args maps a language to the keyword arguments for its parser, as in
+     batch.Options.'''
+     start = _time.perf_counter()
+     parser_args = parser_args or {}
+     progress = Progress(len(set(map(_os.path.abspath, paths))))
+     queue = _FileQueue(paths)
+     merger = Merger()
+     distance = {}
+
+     def reach(funcs, d):
+          for func in funcs:
+               if func not in distance:
+                    distance[func] = d
+                    for key in index.files(func):
+                         queue.push(key, d)
+
+     def snapshot():
+          presenter = merger.presenter()
+          progress.functions = len(merger._calls)
+          progress.calls = sum(map(len, merger._calls.values()))
+          progress.elapsed = _time.perf_counter() - start
+          progress.nested_funcs = set(merger._nested)
+          return presenter, _copy.copy(progress) # So earlier snapshots keep their numbers
+
+     with _instrument.span('progressive', files=progress.files_total) as sp:
+          if roots:
+               if index is None:
+                    from codeschematics.index import DefinitionIndex
+                    index = DefinitionIndex()
+                    index.update(paths, language)
+               reach(roots, 0)
+          last = start
+          while True:
+               path = queue.pop()
+               if path is None:
+                    progress.complete = True
+                    break
+               lang = language or detect_language(path)
+               try:
+                    dic, nested = cached_parse(path, cache, lang, **parser_args.get(lang, {}))
+               except Exception: # As in the batch, one bad file doesn't stop the rest
+                    progress.files_failed += 1
+               else:
+                    progress.files_parsed += 1
+                    merger.add(dic, nested)
+                    if roots:
+                         for func, calls in dic.items():
+                              if func in distance:
+                                   reach(calls, distance[func] + 1)
+               now = _time.perf_counter()
+               if budget is not None and now - start >= budget:
+                    progress.stopped = True
+                    break
+               if now - last >= interval:
+                    yield snapshot()
+                    last = _time.perf_counter()
+          sp.set(parsed=progress.files_parsed, complete=progress.complete)
+          yield snapshot()
+
+
+def analyze(paths, roots=(), index=None, cache=None, language=None, parser_args=None,
+            budget=None, interval=1.0, callback=None):
+     '''Runs snapshots() to the end (or the budget), calling callback(presenter, progress)
+     with each snapshot if given, and returns the last (Presenter, Progress)'''
+     result = None
+     for result in snapshots(paths, roots, index, cache, language, parser_args, budget, interval):
+          if callback is not None:
+               callback(*result)
+     return result
@@ -0,0 +1,354 @@
+#! /usr/bin/env python3
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''A long lived query server. It parses (or loads from the cache) one or more call
+graphs once, keeps the Presenters in memory, and answers queries about them over
+localhost HTTP or a Unix socket, so that editor plugins and the like needn't pay the
+parse cost on every query.
+
+The protocol is plain JSON. A request is an object with an "op" key, and whatever
+arguments that op takes:
+
+     {"op": "graphs"}
+     {"op": "callees",  "graph": NAME, "func": FUNC}
+     {"op": "callers",  "graph": NAME, "func": FUNC}
+     {"op": "subgraph", "graph": NAME, "roots": [FUNC, ...], "max_depth": N}
+     {"op": "text",     "graph": NAME, ["roots": [...], "max_depth": N]}
+     {"op": "dot",      "graph": NAME, ["roots": [...], "max_depth": N]}
+     {"op": "reload"}
+
+and the reply is {"ok": true, "result": ...} or {"ok": false, "error": MESSAGE}.
+Over HTTP, POST the request as the body (to any path), or GET /OP?graph=NAME&func=FUNC
+(with roots comma separated). Over a Unix socket, send one request per line; each
+reply is likewise one line.
+
+Graphs are reloaded whenever the file they were loaded from changes, so a batch job
+that refreshes the cache is picked up without restarting the server.'''
+
+import io as _io
+import json as _json
+import os as _os
+import socketserver as _socketserver
+import threading as _threading
+from collections import OrderedDict as _OrderedDict
+from http.server import BaseHTTPRequestHandler as _BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer as _ThreadingHTTPServer
+from urllib.parse import urlsplit as _urlsplit, parse_qs as _parse_qs
+
+from codeschematics.cache import GraphCache, cached_parse
+from codeschematics.presentation import Presenter
+
+
+################################################################################
+# The in-memory graphs
+
+class _Graph:
+     '''One loaded graph: the Presenter, where it came from, and a memo of rendered
+     views. Never modified after construction, except for the memo (whose entries are
+     idempotent, so racing writers are harmless).'''
+
+     _memo_size = 256
+
+     def __init__(self, name, path, stamp, presenter):
+          self.name = name
+          self.path = path
+          self.stamp = stamp
+          self.presenter = presenter
+          self._memo = {}
+
+     def view(self, kind, roots, max_depth):
+          key = (kind, roots, max_depth)
+          try:
+               return self._memo[key]
+          except KeyError:
+               pass
+          presenter = self.presenter
+          if roots:
+               presenter = presenter.subgraph(roots, max_depth)
+          if kind == 'text':
+               out = presenter.to_plain_text()
+          elif kind == 'dot':
+               buf = _io.StringIO()
+               presenter.write_dot(buf)
+               out = buf.getvalue()
+          else: # subgraph
+               out = {'roots': list(presenter.roots()),
+                      'calls': [[func, list(calls)] for func, calls in presenter.call_dict().items()]}
+          if len(self._memo) >= self._memo_size:
+               self._memo.clear()
+          self._memo[key] = out
+          return out
+
+
+def _stamp(path):
+     st = _os.stat(path)
+     return (st.st_size, st.st_mtime_ns)
+
+
+class GraphRegistry:
+     '''The set of graphs served. Each graph is loaded either from a source file (via
+     the cache, if any) or directly from a cache entry file. Readers never lock: a
+     reload builds the new graphs off to the side, then swaps in a new dict.'''
+
+     def __init__(self, cache=None, filtered=True):
+          self.cache = cache
+          self.filtered = filtered
+          self._graphs = _OrderedDict()
+          self._lock = _threading.Lock() # Serializes the writers only
+
+     def _load(self, name, path):
+          stamp = _stamp(path)
+          if self.cache is not None and _os.path.dirname(_os.path.abspath(path)) == \
+                                        _os.path.abspath(self.cache.directory):
+               dic = GraphCache.read_entry(path)['calls']
+          else:
+               dic, nested = cached_parse(path, self.cache)
+          presenter = Presenter(dic)
+          if self.filtered:
+               presenter = presenter.default_filter()
+          return _Graph(name, path, stamp, presenter.freeze()) # Shared by all the handler threads
+
+     def add(self, path, name=None):
+          '''Loads the given source or cache entry file, and serves it as name (by default
+          the file's basename, sans any cache entry suffix)'''
+          if name is None:
+               name = _os.path.basename(path)
+               if name.endswith(GraphCache.suffix) and self.cache is not None:
+                    name = GraphCache.read_entry(path)['source']
+                    name = _os.path.basename(name)
+          graph = self._load(name, path)
+          with self._lock:
+               graphs = self._graphs.copy()
+               graphs[name] = graph
+               self._graphs = graphs
+          return name
+
+     def add_cache(self):
+          '''Serves every entry currently in the cache'''
+          for path in self.cache.entries():
+               self.add(path)
+
+     def names(self):
+          return list(self._graphs)
+
+     def get(self, name):
+          try:
+               return self._graphs[name]
+          except KeyError:
+               raise KeyError('no graph named {}'.format(name)) from None
+
+     def reload(self, force=False):
+          '''Reloads any graph whose file has changed since it was loaded (or every graph,
+          if force). Returns the names of the reloaded graphs.'''
+          with self._lock:
+               graphs = self._graphs.copy()
+               reloaded = []
+               for name, graph in graphs.items():
+                    try:
+                         changed = force or _stamp(graph.path) != graph.stamp
+                         if changed:
+                              graphs[name] = self._load(name, graph.path)
+                              reloaded.append(name)
+                    except (OSError, ValueError):
+                         # A half written or deleted file; keep serving the old graph
+                         pass
+               self._graphs = graphs
+          return reloaded
+
+     def watch(self, interval=1.0):
+          '''Starts a daemon thread that polls for changed files every interval seconds'''
+          stop = _threading.Event()
+          def poll():
+               while not stop.wait(interval):
+                    self.reload()
+          thread = _threading.Thread(target=poll, name='graph-watcher', daemon=True)
+          thread.start()
+          return stop
+
+
+################################################################################
+# The protocol
+
+class Query:
+     '''Answers JSON protocol requests against a GraphRegistry'''
+
+     def __init__(self, registry):
+          self.registry = registry
+
+     def __call__(self, request):
+          '''Takes a request dict, returns a reply dict. Never raises for a bad request.'''
+          try:
+               op = request['op']
+               method = getattr(self, 'op_' + op, None)
+               if method is None:
+                    raise ValueError('unknown op {!r}'.format(op))
+               return {'ok': True, 'result': method(request)}
+          except (KeyError, ValueError, TypeError) as e:
+               return {'ok': False, 'error': '{}: {}'.format(e.__class__.__name__, e)}
+
+     @staticmethod
+     def _roots(request):
+          roots = request.get('roots')
+          if isinstance(roots, str):
+               roots = [roots]
+          max_depth = request.get('max_depth')
+          return tuple(roots) if roots else None, int(max_depth) if max_depth is not None else None
+
+     def op_ping(self, request):
+          return 'pong'
+
+     def op_graphs(self, request):
+          return [{'name': name, 'path': self.registry.get(name).path,
+                   'functions': len(self.registry.get(name).presenter.functions())}
+                  for name in self.registry.names()]
+
+     def op_callees(self, request):
+          return list(self.registry.get(request['graph']).presenter.callees(request['func']))
+
+     def op_callers(self, request):
+          return list(self.registry.get(request['graph']).presenter.callers(request['func']))
+
+     def op_subgraph(self, request):
+          roots, max_depth = self._roots(request)
+          return self.registry.get(request['graph']).view('subgraph', roots, max_depth)
+
+     def op_text(self, request):
+          roots, max_depth = self._roots(request)
+          return self.registry.get(request['graph']).view('text', roots, max_depth)
+
+     def op_dot(self, request):
+          roots, max_depth = self._roots(request)
+          return self.registry.get(request['graph']).view('dot', roots, max_depth)
+
+     def op_reload(self, request):
+          return self.registry.reload(force=request.get('force', False))
+
+
+################################################################################
+# The transports
+
+class _HTTPHandler(_BaseHTTPRequestHandler):
+
+     query = None # Set on the server's subclass
+     protocol_version = 'HTTP/1.1' # Keep-alive, so clients needn't reconnect per query
+
+     def _reply(self, reply):
+          body = _json.dumps(reply).encode('utf-8')
+          self.send_response(200 if reply['ok'] else 400)
+          self.send_header('Content-Type', 'application/json')
+          self.send_header('Content-Length', str(len(body)))
+          self.end_headers()
+          self.wfile.write(body)
+
+     def do_POST(self):
+          length = int(self.headers.get('Content-Length', 0))
+          try:
+               request = _json.loads(self.rfile.read(length).decode('utf-8'))
+          except ValueError as e:
+               self._reply({'ok': False, 'error': 'bad JSON: {}'.format(e)})
+          else:
+               self._reply(self.server.query(request))
+
+     def do_GET(self):
+          url = _urlsplit(self.path)
+          request = {key: values[-1] for key, values in _parse_qs(url.query).items()}
+          request['op'] = url.path.strip('/') or 'graphs'
+          if 'roots' in request:
+               request['roots'] = request['roots'].split(',')
+          self._reply(self.server.query(request))
+
+     def log_message(self, format, *args):
+          pass # One log line per query is just noise
+
+
+class _UnixHandler(_socketserver.StreamRequestHandler):
+
+     def handle(self):
+          for line in self.rfile:
+               if not line.strip():
+                    continue
+               try:
+                    reply = self.server.query(_json.loads(line.decode('utf-8')))
+               except ValueError as e:
+                    reply = {'ok': False, 'error': 'bad JSON: {}'.format(e)}
+               self.wfile.write(_json.dumps(reply).encode('utf-8') + b'\n')
+               self.wfile.flush()
+
+
+class _UnixServer(_socketserver.ThreadingMixIn, _socketserver.UnixStreamServer):
+     daemon_threads = True
+
+
+def make_server(registry, port=None, socket_path=None, host='127.0.0.1'):
+     '''Creates (but doesn't start) a threaded server answering queries against the
+     registry, on either localhost:port or the given Unix socket path. Call its
+     serve_forever() to run it.'''
+     if (port is None) == (socket_path is None):
+          raise ValueError('exactly one of port and socket_path must be given')
+     if socket_path is not None:
+          if _os.path.exists(socket_path):
+               _os.unlink(socket_path)
+          server = _UnixServer(socket_path, _UnixHandler)
+     else:
+          server = _ThreadingHTTPServer((host, port), _HTTPHandler)
+          server.daemon_threads = True
+     server.query = Query(registry)
+     return server
+
+
+################################################################################
+# main()
+
+if __name__ == '__main__':
+     import argparse
+     parser = argparse.ArgumentParser(description='Serve queries on one or more call graphs,'
+                                      ' keeping them in memory between queries.')
+     parser.add_argument('files', nargs='*', metavar='FILE',
+                         help='source files or cache entries to serve (default: the whole cache)')
+     parser.add_argument('-c', '--cache-dir', metavar='DIR',
+                         help='the parse cache to load from and write to')
+     group = parser.add_mutually_exclusive_group(required=True)
+     group.add_argument('-p', '--port', type=int, help='serve HTTP on localhost:PORT')
+     group.add_argument('-s', '--socket', metavar='PATH', help='serve on a Unix socket')
+     parser.add_argument('--no-filter', action='store_true',
+                         help="don't apply the default filter to the graphs")
+     parser.add_argument('--poll', type=float, default=1.0, metavar='SECONDS',
+                         help='how often to check for changed files (0 to disable)')
+     args = parser.parse_args()
+
+     cache = GraphCache(args.cache_dir) if args.cache_dir else None
+     registry = GraphRegistry(cache, filtered=not args.no_filter)
+     if args.files:
+          for fname in args.files:
+               registry.add(fname)
+     elif cache is not None:
+          registry.add_cache()
+     else:
+          parser.error('nothing to serve: give some files or a --cache-dir')
+     if args.poll > 0:
+          registry.watch(args.poll)
+
+     server = make_server(registry, port=args.port, socket_path=args.socket)
+     try:
+          server.serve_forever()
+     except KeyboardInterrupt:
+          pass
+     finally:
+          server.server_close()
@@ -0,0 +1,143 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Where each call in a call graph is made: the file, line and column of every call
+site of each (caller, callee) edge, so that e.g. an editor can jump to a call without
+parsing anything again. The parsers fill in a CallSites if given one:
+
+     sites = CallSites()
+     dic, nested = cached_parse('rho.c', cache, sites=sites)
+     sites.sites('main', 'init') # [('rho.c', 12, 5), ('rho.c', 40, 9)]
+
+The sites are kept in three parallel arrays of machine integers (the edge's ID, the
+file's ID and the line and column packed into one), with the edges' and files' names
+interned, so a site takes a few dozen bytes however many there are. The arrays are
+sorted by edge when first queried, after which looking up an edge's sites is a dict
+lookup and a binary search. Lines and columns start at 1; a column of 0 means it's
+unknown.'''
+
+from array import array as _array
+from bisect import bisect_left as _bisect_left, bisect_right as _bisect_right
+
+
+_COL_BITS = 20
+_COL_MASK = (1 << _COL_BITS) - 1
+
+
+class CallSites:
+     '''The call sites of a call graph's edges'''
+
+     def __init__(self):
+          self.files = [] # File ID --> filename
+          self._file_ids = {}
+          self._edge_list = [] # Edge ID --> (caller, callee)
+          self._edge_ids = {}
+          self._edge = _array('l') # The parallel arrays, one item per site
+          self._file = _array('l')
+          self._pos = _array('q')
+          self._sorted = True
+
+     def __len__(self):
+          return len(self._edge)
+
+     def _intern_file(self, filename):
+          try:
+               return self._file_ids[filename]
+          except KeyError:
+               self._file_ids[filename] = len(self.files)
+               self.files.append(filename)
+               return len(self.files) - 1
+
+     def _intern_edge(self, edge):
+          try:
+               return self._edge_ids[edge]
+          except KeyError:
+               self._edge_ids[edge] = len(self._edge_list)
+               self._edge_list.append(edge)
+               return len(self._edge_list) - 1
+
+     def add(self, caller, callee, filename, line, col=0):
+          '''Records a call site of the caller --> callee edge'''
+          edge = self._intern_edge((caller, callee))
+          if self._edge and edge < self._edge[-1]:
+               self._sorted = False
+          self._edge.append(edge)
+          self._file.append(self._intern_file(filename))
+          self._pos.append(line << _COL_BITS | min(col or 0, _COL_MASK))
+
+     def _sort(self):
+          # Stable, so each edge's sites stay in the order they were added (source order)
+          if self._sorted:
+               return
+          edge, file, pos = self._edge, self._file, self._pos
+          order = sorted(range(len(edge)), key=edge.__getitem__)
+          self._edge = _array('l', (edge[i] for i in order))
+          self._file = _array('l', (file[i] for i in order))
+          self._pos = _array('q', (pos[i] for i in order))
+          self._sorted = True
+
+     def sites(self, caller, callee):
+          '''Returns the (filename, line, column) of each site of the caller --> callee
+          call, in source order (an empty list for an unknown edge)'''
+          edge = self._edge_ids.get((caller, callee))
+          if edge is None:
+               return []
+          self._sort()
+          start = _bisect_left(self._edge, edge)
+          end = _bisect_right(self._edge, edge, start)
+          files = self.files
+          return [(files[self._file[i]], self._pos[i] >> _COL_BITS, self._pos[i] & _COL_MASK)
+                  for i in range(start, end)]
+
+     def edges(self):
+          '''Returns the (caller, callee) edges with any sites'''
+          return list(self._edge_list)
+
+     def update(self, other):
+          '''Adds all the sites of another CallSites (e.g. another file's). Returns self.'''
+          files = [self._intern_file(filename) for filename in other.files]
+          edges = [self._intern_edge(edge) for edge in other._edge_list]
+          if other._edge:
+               self._sorted = False # The IDs are new, so sort again at the next query
+          self._edge.extend(edges[edge] for edge in other._edge)
+          self._file.extend(files[file] for file in other._file)
+          self._pos.extend(other._pos)
+          return self
+
+     def to_json(self):
+          '''Returns the sites as JSON-able data, for from_json'''
+          self._sort()
+          return {'files': list(self.files), 'edges': [list(edge) for edge in self._edge_list],
+                  'edge': self._edge.tolist(), 'file': self._file.tolist(), 'pos': self._pos.tolist()}
+
+     @classmethod
+     def from_json(cls, data):
+          sites = cls()
+          sites.files = list(data['files'])
+          sites._file_ids = {filename: i for i, filename in enumerate(sites.files)}
+          sites._edge_list = [tuple(edge) for edge in data['edges']]
+          sites._edge_ids = {edge: i for i, edge in enumerate(sites._edge_list)}
+          sites._edge = _array('l', data['edge'])
+          sites._file = _array('l', data['file'])
+          sites._pos = _array('q', data['pos'])
+          if len(sites._file) != len(sites._edge) or len(sites._pos) != len(sites._edge):
+               raise ValueError('call sites arrays of different lengths')
+          edge = sites._edge
+          sites._sorted = all(edge[i] <= edge[i+1] for i in range(len(edge) - 1))
+          return sites
@@ -0,0 +1,514 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''A call graph stored in an SQLite database, for graphs too big to hold in memory as
+a Presenter, or to share between runs and tools. The database holds a table of the
+functions and one of the calls (in order, with their weights, if any), indexed on
+both caller and callee.
+
+     with GraphStore('project.db') as store:
+          store.add_files(paths, jobs=8)
+          graph = store.graph()
+          print(graph.callers('malloc'))
+          graph.subgraph(['main'], max_depth=3).to_svg('main')
+
+store.graph() returns a StoredGraph, which has the same query and view methods as a
+Presenter but reads the database as it goes, keeping only a bounded number of
+functions' calls in memory. Its filter methods (subgraph, filter) return ordinary
+in-memory Presenters of the (presumably much smaller) result; subgraph reads only
+what's below the roots, but filter reads the whole graph first.
+
+Adding a call dict for a function that's already stored appends any new calls to the
+existing ones, so the graphs of many files merge into one.'''
+
+import sqlite3 as _sqlite3
+from collections import OrderedDict as _OrderedDict
+
+from codeschematics import dot as _dot
+from codeschematics import instrument as _instrument
+from codeschematics.algorithms import strongly_connected_components
+from codeschematics.presentation import Presenter
+
+_gv = None # Conditional graphviz import to minimize dependencies
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS functions (
+     id INTEGER PRIMARY KEY,
+     name TEXT UNIQUE NOT NULL,
+     defined INTEGER NOT NULL DEFAULT 0, -- 0, or the order functions were first defined in
+     nested INTEGER NOT NULL DEFAULT 0,
+     source TEXT,
+     cost REAL
+);
+CREATE TABLE IF NOT EXISTS calls (
+     caller INTEGER NOT NULL,
+     position INTEGER NOT NULL,
+     callee INTEGER NOT NULL,
+     count INTEGER,
+     seconds REAL,
+     PRIMARY KEY (caller, position)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS calls_edge ON calls (caller, callee);
+CREATE INDEX IF NOT EXISTS calls_callee ON calls (callee);
+'''
+
+# SQLite limits the number of parameters in one statement, 999 in older versions
+_CHUNK = 900
+
+def _chunks(items):
+     items = list(items)
+     for i in range(0, len(items), _CHUNK):
+          yield items[i:i+_CHUNK]
+
+
+class GraphStore:
+     '''An SQLite database of call graphs. Usable as a context manager, which closes
+     it at the end.'''
+
+     def __init__(self, filename):
+          self.filename = filename
+          self._db = _sqlite3.connect(filename)
+          self._db.execute('PRAGMA journal_mode=WAL')
+          self._db.execute('PRAGMA synchronous=NORMAL')
+          self._db.executescript(_SCHEMA)
+          self.version = 0 # Bumped by every change, so StoredGraphs know to drop their caches
+
+     def __enter__(self):
+          return self
+
+     def __exit__(self, *exc):
+          self.close()
+
+     def close(self):
+          self._db.close()
+
+     def _ids(self, names):
+          # Returns {name: id} for the given names, adding any that are new
+          ids = {}
+          self._db.executemany('INSERT OR IGNORE INTO functions (name) VALUES (?)', ((name,) for name in names))
+          for chunk in _chunks(names):
+               query = 'SELECT name, id FROM functions WHERE name IN ({})'.format(','.join('?' * len(chunk)))
+               ids.update(self._db.execute(query, chunk))
+          return ids
+
+     def add(self, dic, nested=(), source=None, weights=None, costs=None):
+          '''Adds a call dict (in the form any parser's make_call_dict returns, with the
+          set of nested functions), all in one transaction. source names where it came
+          from. weights and costs are as for Presenter.'''
+          with _instrument.span('GraphStore.add', functions=len(dic)):
+               if costs is None and weights is not None:
+                    costs = Presenter._derive_costs(dic, weights)
+               names = _OrderedDict.fromkeys(dic)
+               for calls in dic.values():
+                    names.update(_OrderedDict.fromkeys(calls))
+               with self._db:
+                    ids = self._ids(list(names))
+                    last = self._db.execute('SELECT max(defined) FROM functions').fetchone()[0] or 0
+                    self._db.executemany('UPDATE functions SET defined = CASE WHEN defined THEN defined ELSE ? END,'
+                                         ' nested = max(nested, ?), source = coalesce(source, ?) WHERE id = ?',
+                                         ((last + i + 1, func in nested, source, ids[func])
+                                          for i, func in enumerate(dic)))
+                    if costs:
+                         self._db.executemany('UPDATE functions SET cost = coalesce(cost, 0) + ? WHERE id = ?',
+                                              ((cost, ids[func]) for func, cost in costs.items() if func in ids))
+                    # New calls go after any already stored for the function
+                    ends = {}
+                    for chunk in _chunks([ids[func] for func in dic]):
+                         query = 'SELECT caller, max(position) FROM calls WHERE caller IN ({}) GROUP BY caller'
+                         ends.update(self._db.execute(query.format(','.join('?' * len(chunk))), chunk))
+                    weights = weights or {}
+                    rows = []
+                    for func, calls in dic.items():
+                         caller, start = ids[func], ends.get(ids[func], -1) + 1
+                         for i, call in enumerate(calls):
+                              count, seconds = weights.get((func, call), (None, None))
+                              rows.append((caller, start + i, ids[call], count, seconds))
+                    # A call already stored keeps its place, and its weight is summed, as
+                    # merge.Merger sums it in memory
+                    self._db.executemany('INSERT INTO calls VALUES (?, ?, ?, ?, ?)'
+                                         ' ON CONFLICT (caller, callee) DO UPDATE SET'
+                                         ' count = coalesce(count + excluded.count, count, excluded.count),'
+                                         ' seconds = coalesce(seconds + excluded.seconds, seconds, excluded.seconds)',
+                                         rows)
+               self.version += 1
+
+     def add_files(self, paths, cache=None, language=None, parser_args=None, jobs=1):
+          '''Parses the given files (through the GraphCache, if any) and adds each one's
+          call dict. With jobs other than 1, the files are parsed in that many worker
+          processes (None for one per CPU), while this process does all the writing.
+          Returns the number of files added.'''
+          from codeschematics.cache import cached_parse, detect_language
+          parser_args = parser_args or {}
+          cache_dir = cache.directory if cache is not None else None
+          def args(path):
+               lang = language or detect_language(path)
+               return path, cache_dir, lang, parser_args.get(lang, {})
+          if jobs == 1 or len(paths) <= 1:
+               results = (_parse(*args(path)) for path in paths)
+               pool = None
+          else:
+               from concurrent.futures import ProcessPoolExecutor
+               pool = ProcessPoolExecutor(jobs)
+               results = pool.map(_parse, *zip(*[args(path) for path in paths]))
+          try:
+               for path, (dic, nested) in zip(paths, results):
+                    self.add(dic, nested, source=path)
+          finally:
+               if pool is not None:
+                    pool.shutdown()
+          return len(paths)
+
+     def sources(self):
+          '''Returns the sources of all the stored functions'''
+          return [row[0] for row in self._db.execute('SELECT DISTINCT source FROM functions'
+                                                     ' WHERE source IS NOT NULL ORDER BY source')]
+
+     def graph(self, cache_size=10000):
+          '''Returns a StoredGraph reading this store, which keeps the calls of at most
+          cache_size functions in memory'''
+          return StoredGraph(self, cache_size)
+
+
+def _parse(path, cache_dir, language, kwargs):
+     # The worker half of GraphStore.add_files
+     from codeschematics.cache import GraphCache, cached_parse
+     cache = GraphCache(cache_dir) if cache_dir else None
+     return cached_parse(path, cache, language, **kwargs)
+
+
+################################################################################
+# The read side
+
+class _Functions:
+     # A view of the stored function names, like the keys view Presenter.functions()
+     # returns, without loading them all
+     def __init__(self, db):
+          self._db = db
+
+     def __contains__(self, func):
+          return self._db.execute('SELECT 1 FROM functions WHERE name = ?', (func,)).fetchone() is not None
+
+     def __len__(self):
+          return self._db.execute('SELECT count(*) FROM functions').fetchone()[0]
+
+     def __iter__(self):
+          return (row[0] for row in self._db.execute('SELECT name FROM functions ORDER BY id'))
+
+
+class _Weights:
+     # A read only mapping of (caller, callee) --> (calls, seconds), like Presenter's
+     # weights dict, looked up in the store as needed
+     def __init__(self, db):
+          self._db = db
+
+     def get(self, edge, default=None):
+          row = self._db.execute('SELECT c.count, c.seconds FROM calls c JOIN functions a ON c.caller = a.id'
+                                 ' JOIN functions b ON c.callee = b.id WHERE a.name = ? AND b.name = ?'
+                                 ' AND c.seconds IS NOT NULL', edge).fetchone()
+          return tuple(row) if row is not None else default
+
+     def __getitem__(self, edge):
+          value = self.get(edge)
+          if value is None:
+               raise KeyError(edge)
+          return value
+
+     def __contains__(self, edge):
+          return self.get(edge) is not None
+
+     def items(self):
+          return (((caller, callee), (count, seconds)) for caller, callee, count, seconds in self._db.execute(
+                    'SELECT a.name, b.name, c.count, c.seconds FROM calls c JOIN functions a ON c.caller = a.id'
+                    ' JOIN functions b ON c.callee = b.id WHERE c.seconds IS NOT NULL'))
+
+
+class _Costs:
+     # Likewise, function --> inclusive seconds
+     def __init__(self, db):
+          self._db = db
+
+     def get(self, func, default=None):
+          row = self._db.execute('SELECT cost FROM functions WHERE name = ? AND cost IS NOT NULL', (func,)).fetchone()
+          return row[0] if row is not None else default
+
+     def __getitem__(self, func):
+          value = self.get(func)
+          if value is None:
+               raise KeyError(func)
+          return value
+
+     def __contains__(self, func):
+          return self.get(func) is not None
+
+     def items(self):
+          return iter(self._db.execute('SELECT name, cost FROM functions WHERE cost IS NOT NULL'))
+
+
+class StoredGraph:
+     '''The query and view methods of a Presenter, over a GraphStore. Each function's
+     calls are read from the database the first time they're needed, and the most
+     recently used cache_size of them are kept.'''
+
+     def __init__(self, store, cache_size=10000):
+          self._store = store
+          self._db = store._db
+          self._cache_size = cache_size
+          self._version = None
+          has_weights = self._db.execute('SELECT 1 FROM calls WHERE seconds IS NOT NULL LIMIT 1').fetchone()
+          has_costs = self._db.execute('SELECT 1 FROM functions WHERE cost IS NOT NULL LIMIT 1').fetchone()
+          self._weights = _Weights(self._db) if has_weights else None
+          self._costs = _Costs(self._db) if has_costs or has_weights else None
+          self._check()
+
+     def _check(self):
+          if self._version != self._store.version:
+               self._version = self._store.version
+               self._nodes = _OrderedDict()
+               self._roots = None
+
+     def _node(self, func):
+          # Returns (defined, callees) for func, or raises KeyError if it isn't stored
+          self._check()
+          try:
+               node = self._nodes[func]
+          except KeyError:
+               row = self._db.execute('SELECT id, defined FROM functions WHERE name = ?', (func,)).fetchone()
+               if row is None:
+                    raise KeyError(func)
+               callees = tuple(name for name, in self._db.execute(
+                              'SELECT f.name FROM calls c JOIN functions f ON c.callee = f.id'
+                              ' WHERE c.caller = ? ORDER BY c.position', (row[0],)))
+               node = self._nodes[func] = (bool(row[1]), callees)
+               if len(self._nodes) > self._cache_size:
+                    self._nodes.popitem(last=False)
+          else:
+               self._nodes.move_to_end(func)
+          return node
+
+     ###########################################################################
+     # Simple queries on the call structure, as Presenter's
+
+     def functions(self):
+          '''Returns the names of all functions in the store, defined or not'''
+          return _Functions(self._db)
+
+     def roots(self):
+          '''Returns the names of the top level functions: those nothing calls, then one
+          function (the first stored) of each cycle that's unreachable from those and
+          called by nothing else unreachable, as Presenter's'''
+          self._check()
+          if self._roots is not None:
+               return self._roots
+          with _instrument.span('StoredGraph.roots'):
+               roots = [name for name, in self._db.execute(
+                              'SELECT name FROM functions f WHERE NOT EXISTS'
+                              ' (SELECT 1 FROM calls WHERE callee = f.id) ORDER BY id')]
+               # Everything reachable from the roots, in SQL so that it needn't fit in memory
+               reach = ('WITH RECURSIVE reach(id) AS (SELECT id FROM functions WHERE name IN ({}) UNION'
+                        ' SELECT c.callee FROM calls c JOIN reach r ON c.caller = r.id) ')
+               self._db.execute('CREATE TEMP TABLE IF NOT EXISTS reached (id INTEGER PRIMARY KEY)')
+               self._db.execute('DELETE FROM reached')
+               for chunk in _chunks(roots):
+                    self._db.execute(reach.format(','.join('?' * len(chunk))) +
+                                     'INSERT OR IGNORE INTO reached SELECT id FROM reach', chunk)
+               # What's left is cycles no root leads to, and what they call: usually little,
+               # so it's read into memory. The cycles called by none of the rest each get
+               # a root (only defined functions can be in a cycle), and they reach the rest
+               unreached = _OrderedDict(self._db.execute(
+                              'SELECT id, name FROM functions WHERE defined AND id NOT IN'
+                              ' (SELECT id FROM reached) ORDER BY id'))
+               calls = {}
+               for caller, callee in self._db.execute(
+                         'SELECT caller, callee FROM calls WHERE caller NOT IN (SELECT id FROM reached)'
+                         ' ORDER BY caller, position'):
+                    if callee in unreached:
+                         calls.setdefault(caller, []).append(callee)
+               components = strongly_connected_components(unreached, lambda id: calls.get(id, ()))
+               component = {id: i for i, members in enumerate(components) for id in members}
+               called = {component[callee] for caller, callees in calls.items() for callee in callees
+                         if component[callee] != component[caller]}
+               roots.extend(unreached[id] for id in sorted(min(members) for i, members in enumerate(components)
+                                                           if i not in called))
+               self._db.execute('DELETE FROM reached')
+          self._roots = tuple(roots)
+          return self._roots
+
+     def call_dict(self):
+          '''Returns the call structure as an OrderedDict of each defined function -->
+          tuple of the functions it calls. This does load the whole graph.'''
+          dic = _OrderedDict((name, []) for name, in self._db.execute(
+                              'SELECT name FROM functions WHERE defined ORDER BY defined'))
+          for caller, callee in self._db.execute(
+                    'SELECT a.name, b.name FROM calls c JOIN functions a ON c.caller = a.id'
+                    ' JOIN functions b ON c.callee = b.id WHERE a.defined ORDER BY c.caller, c.position'):
+               dic[caller].append(callee)
+          return _OrderedDict((func, tuple(calls)) for func, calls in dic.items())
+
+     def is_defined(self, func):
+          '''Returns whether func has a definition in the store'''
+          return self._node(func)[0]
+
+     def callees(self, func):
+          '''Returns the functions called by func, in call order'''
+          return self._node(func)[1]
+
+     def callers(self, func):
+          '''Returns the functions that call func (in no particular order)'''
+          if func not in self.functions():
+               raise KeyError(func)
+          return tuple(name for name, in self._db.execute(
+                    'SELECT a.name FROM calls c JOIN functions a ON c.caller = a.id JOIN functions b'
+                    ' ON c.callee = b.id WHERE b.name = ?', (func,)))
+
+     def weight(self, caller, callee):
+          '''Returns the (calls, seconds) weight of the given edge, or None'''
+          return self._weights.get((caller, callee)) if self._weights is not None else None
+
+     def cost(self, func):
+          '''Returns the inclusive time in seconds of the given function, or None'''
+          return self._costs.get(func) if self._costs is not None else None
+
+     ###########################################################################
+     # The views, as Presenter's
+
+     def _to_plain_text(self, func, chain=None, prefix='', indent='      '):
+          if chain is None:
+               chain = []
+          defined, callees = self._node(func)
+          if not defined:
+               return prefix + func + '()'
+          out = prefix + func + '():\n'
+          strs = []
+          for call in callees:
+               if call in chain:
+                    # Allow exactly one duplicate as the tail of the chain
+                    strs.append(prefix + indent + call + '()')
+               else:
+                    chain.append(call)
+                    s = self._to_plain_text(call, chain, prefix+indent, indent)
+                    if s:
+                         strs.append(s)
+                    chain.pop()
+          return out + '\n'.join(strs)
+
+     def to_plain_text(self, indent='      '):
+          '''The plain text tree of Presenter.to_plain_text'''
+          return '\n'.join(self._to_plain_text(func, indent=indent) for func in self.roots())
+
+     __str__ = to_plain_text
+
+     def to_graphviz(self):
+          '''Returns a graphviz Digraph of the whole graph, as Presenter.to_graphviz
+          (without the performance colouring)'''
+          global _gv
+          if _gv is None:
+               import graphviz as _gv
+          graph = _gv.Digraph(graph_attr=Presenter._graph_attr, node_attr=Presenter._node_attr)
+          self._fill_graph(graph)
+          self.graphviz = graph
+          return graph
+
+     def write_dot(self, out):
+          '''Writes the graph of to_graphviz as DOT source to the text file object out.
+          The calls are streamed from the database, so this takes little memory however
+          big the graph.'''
+          with _dot.DotWriter(out, graph_attr=Presenter._graph_attr, node_attr=Presenter._node_attr) as graph:
+               self._fill_graph(graph)
+
+     def _fill_graph(self, graph):
+          for func in self.functions():
+               graph.node(func)
+          graph.edges(self._db.execute('SELECT a.name, b.name FROM calls c JOIN functions a ON c.caller = a.id'
+                                       ' JOIN functions b ON c.callee = b.id ORDER BY c.caller, c.position'))
+
+     def graphviz_render(self, format, filename):
+          '''Renders the graph via graphviz, writing to "{filename}.{format}" (streaming
+          the source to dot, unless to_graphviz has been called)'''
+          fname = filename + '.' + format
+          graph = getattr(self, 'graphviz', None)
+          with _instrument.span('StoredGraph.graphviz_render', format=format, file=fname):
+               if graph is None:
+                    _dot.render(self._fill_graph, format, fname,
+                                graph_attr=Presenter._graph_attr, node_attr=Presenter._node_attr)
+               else:
+                    with open(fname, 'wb') as f:
+                         f.write(graph.pipe(format))
+
+     ###########################################################################
+     # Filters, which return in-memory Presenters
+
+     def subgraph(self, roots, max_depth=None):
+          '''As Presenter.subgraph, reading only the functions below the roots'''
+          depth = _OrderedDict()
+          for func in roots:
+               if func not in self.functions():
+                    raise KeyError('function {} is not in the call graph'.format(func))
+               depth.setdefault(func, 0)
+          queue = list(depth)
+          for func in queue:
+               if max_depth is not None and depth[func] >= max_depth:
+                    continue
+               for call in self.callees(func):
+                    if call not in depth:
+                         depth[call] = depth[func] + 1
+                         queue.append(call)
+          data = _OrderedDict()
+          for func, d in depth.items():
+               defined, callees = self._node(func)
+               if defined and (max_depth is None or d < max_depth):
+                    data[func] = callees
+          weights = costs = None
+          if self._weights is not None:
+               weights = {(func, call): self._weights.get((func, call)) for func, calls in data.items()
+                          for call in calls if self._weights.get((func, call)) is not None}
+          if self._costs is not None:
+               costs = {func: self._costs.get(func) for func in depth if self._costs.get(func) is not None}
+          return Presenter(data, weights, costs)
+
+     def filter(self, pipeline):
+          '''Applies a filters.FilterPipeline, returning a Presenter. Unlike subgraph,
+          this isn't done in the database: the pipeline works on the whole call_dict(),
+          so the graph must fit in memory (apply a subgraph first if it doesn't).'''
+          return pipeline.apply(self)
+
+
+################################################################################
+# main()
+
+if __name__ == '__main__':
+     import argparse
+     from codeschematics.batch import expand_paths
+     from codeschematics.cache import GraphCache
+     parser = argparse.ArgumentParser(description='Parse source files into a call graph database.')
+     parser.add_argument('database', help='the SQLite database to add to (created if need be)')
+     parser.add_argument('paths', nargs='+', metavar='PATH',
+                         help='source files, directories (searched recursively) or globs')
+     parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                         help='parse with N worker processes (0 for one per CPU)')
+     parser.add_argument('-c', '--cache-dir', metavar='DIR',
+                         help='cache parse results in DIR, and reuse them for unchanged files')
+     parser.add_argument('-l', '--language', choices=['python', 'bytecode', 'c', 'json'],
+                         help='parse every file as this language, rather than guessing from the extension')
+     args = parser.parse_args()
+
+     cache = GraphCache(args.cache_dir) if args.cache_dir else None
+     with GraphStore(args.database) as store:
+          store.add_files(expand_paths(args.paths), cache, args.language, jobs=args.jobs or None)
+          graph = store.graph()
+          print('{}: {} functions, {} top level'.format(args.database, len(graph.functions()), len(graph.roots())))
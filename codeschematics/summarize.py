@@ -0,0 +1,350 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''Level of detail summarization, for call graphs too big to lay out. Graphviz's
+layout time grows much faster than linearly in the size of the graph, so past a
+few thousand functions it's hopeless; instead we collapse groups of functions into
+"super-nodes" until the graph fits a node budget.
+
+The stages, each applied only while the graph is still over budget, are:
+
+     'scc'    - each set of mutually recursive functions becomes one node
+     'leaves' - the leaf functions called only by one function become one node
+     'chains' - each chain of functions a -> b -> ... -> z, where each is called only
+                by the previous one and calls only the next one, becomes one node
+     'groups' - the functions of each group (file, module, class...; you supply the
+                mapping) become one node
+     'depth'  - everything below some depth becomes one node per function at that
+                depth. This always meets the budget, so the layout time is bounded.
+
+Each stage is linear in the size of the graph. The result is a Summary, which keeps
+how many original calls each edge between super-nodes stands for, and which can
+expand any super-node back into its members on request.'''
+
+from collections import OrderedDict as _OrderedDict
+
+from codeschematics import dot as _dot
+from codeschematics.algorithms import strongly_connected_components
+from codeschematics.presentation import Presenter
+
+_gv = None # Conditional graphviz import to minimize dependencies
+
+STAGES = ('scc', 'leaves', 'chains', 'groups', 'depth')
+
+
+################################################################################
+# The quotient graph that the stages work on
+
+class _Quotient:
+     '''The original graph with its functions partitioned into blocks. The blocks are
+     numbered, and each has a label and its list of (original) members.'''
+
+     def __init__(self, calls, block_of, labels):
+          # calls: the original call dict; block_of: original func --> block number
+          self.labels = labels
+          self.members = [[] for _ in labels]
+          for func, block in block_of.items():
+               self.members[block].append(func)
+          self.succ = [_OrderedDict() for _ in labels] # block --> {block: multiplicity}
+          self.indegree = [0] * len(labels)
+          for func, callees in calls.items():
+               a = block_of[func]
+               for call in callees:
+                    b = block_of[call]
+                    if a != b:
+                         if b not in self.succ[a]:
+                              self.succ[a][b] = 0
+                              self.indegree[b] += 1
+                         self.succ[a][b] += 1
+
+     def __len__(self):
+          return len(self.labels)
+
+
+def _all_functions(calls):
+     funcs = _OrderedDict.fromkeys(calls)
+     for callees in calls.values():
+          funcs.update(_OrderedDict.fromkeys(callees))
+     return list(funcs)
+
+
+def _merge(quotient, block_of, groups):
+     '''Merges blocks: groups is a list of (label, [block, ...]). Returns the new
+     block_of and labels. Blocks in no group are kept as they are.'''
+     new_number = [None] * len(quotient)
+     labels = []
+     for label, blocks in groups:
+          for block in blocks:
+               new_number[block] = len(labels)
+          labels.append(label)
+     for block, label in enumerate(quotient.labels):
+          if new_number[block] is None:
+               new_number[block] = len(labels)
+               labels.append(label)
+     return {func: new_number[block] for func, block in block_of.items()}, labels
+
+
+def _describe(quotient, blocks):
+     members = sum(len(quotient.members[block]) for block in blocks)
+     return quotient.labels[blocks[0]], members
+
+
+################################################################################
+# The stages. Each takes the quotient and returns a list of (label, [blocks]) to merge
+
+def _stage_scc(quotient, budget, groups):
+     out = []
+     for component in strongly_connected_components(range(len(quotient)), quotient.succ.__getitem__):
+          if len(component) > 1:
+               component.sort()
+               first, members = _describe(quotient, component)
+               out.append(('[cycle: {} +{} more]'.format(first, members - 1), component))
+     return out
+
+
+def _stage_leaves(quotient, budget, groups):
+     fans = _OrderedDict()
+     for block in range(len(quotient)):
+          for child in quotient.succ[block]:
+               if not quotient.succ[child] and quotient.indegree[child] == 1:
+                    fans.setdefault(block, []).append(child)
+     return [('[{} leaves of {}]'.format(sum(len(quotient.members[leaf]) for leaf in leaves),
+                                          quotient.labels[parent]), leaves)
+             for parent, leaves in fans.items() if len(leaves) > 1]
+
+
+def _stage_chains(quotient, budget, groups):
+     nxt = {}
+     for block in range(len(quotient)):
+          if len(quotient.succ[block]) == 1:
+               child = next(iter(quotient.succ[block]))
+               if quotient.indegree[child] == 1 and child != block:
+                    nxt[block] = child
+     starts = set(nxt) - set(nxt.values())
+     out = []
+     for start in sorted(starts):
+          chain = [start]
+          while chain[-1] in nxt:
+               chain.append(nxt[chain[-1]])
+          members = sum(len(quotient.members[block]) for block in chain)
+          out.append(('[chain: {} -> {} ({})]'.format(quotient.labels[chain[0]], quotient.labels[chain[-1]],
+                                                       members), chain))
+     return out
+
+
+def _stage_groups(quotient, budget, groups):
+     if groups is None:
+          return []
+     group_of = groups if callable(groups) else groups.get
+     by_group = _OrderedDict()
+     for block in range(len(quotient)):
+          # A block goes with the group of its first member that has one
+          for func in quotient.members[block]:
+               group = group_of(func)
+               if group is not None:
+                    by_group.setdefault(group, []).append(block)
+                    break
+     return [('[group: {} ({})]'.format(group, sum(len(quotient.members[block]) for block in blocks)), blocks)
+             for group, blocks in by_group.items() if len(blocks) > 1]
+
+
+def _stage_depth(quotient, budget, groups):
+     # Breadth first from the blocks nobody calls (and then from whatever's left, i.e.
+     # cycles without an entry, if the scc stage was skipped), recording each block's
+     # parent in the BFS tree
+     n = len(quotient)
+     depth = [None] * n
+     parent = [None] * n
+     order = []
+     roots = [block for block in range(n) if quotient.indegree[block] == 0]
+     roots += range(n) # Stragglers; the depth check skips those already reached
+     for root in roots:
+          if depth[root] is not None:
+               continue
+          depth[root] = 0
+          queue = [root]
+          for block in queue:
+               order.append(block)
+               for child in quotient.succ[block]:
+                    if depth[child] is None:
+                         depth[child] = depth[block] + 1
+                         parent[child] = block
+                         queue.append(child)
+
+     # Find the deepest cutoff where the blocks down to the cutoff, plus one "below"
+     # block per block at the cutoff, fit the budget
+     at_depth = {}
+     for block in range(n):
+          at_depth[depth[block]] = at_depth.get(depth[block], 0) + 1
+     cutoff, shown = None, 0
+     for d in range(max(at_depth) + 1):
+          shown += at_depth[d]
+          if shown + at_depth[d] > budget:
+               break
+          cutoff = d
+
+     out = _OrderedDict()
+     if cutoff is None:
+          # Too many top level blocks: keep whole trees for the first few, lump the rest
+          keep = [block for block in order if depth[block] == 0][:max(budget - 1, 0)]
+          tree_of = {}
+          for block in order:
+               tree_of[block] = block if depth[block] == 0 else tree_of[parent[block]]
+          for block in order:
+               root = tree_of[block] if tree_of[block] in keep else None
+               out.setdefault(root, []).append(block)
+          return [('[tree of {} ({})]'.format(quotient.labels[root], sum(len(quotient.members[block]) for block in blocks))
+                   if root is not None else '[{} other trees]'.format(len(set(tree_of[block] for block in blocks))),
+                   blocks)
+                  for root, blocks in out.items() if len(blocks) > 1]
+
+     ancestor = {}
+     for block in order:
+          if depth[block] > cutoff:
+               ancestor[block] = parent[block] if depth[block] == cutoff + 1 else ancestor[parent[block]]
+               out.setdefault(ancestor[block], []).append(block)
+     return [('[{} below {}]'.format(sum(len(quotient.members[block]) for block in blocks),
+                                       quotient.labels[top]), blocks)
+             for top, blocks in out.items()]
+
+_STAGE_FUNCS = {'scc': _stage_scc, 'leaves': _stage_leaves, 'chains': _stage_chains,
+                'groups': _stage_groups, 'depth': _stage_depth}
+
+
+################################################################################
+# The public interface
+
+class Summary:
+     '''A summarized call graph: the original call dict, partitioned into super-nodes.
+     Super-nodes are named in [brackets]; functions left on their own keep their names.
+     It has the same basic views as a Presenter (to_plain_text, call_dict, to_graphviz,
+     graphviz_render), and the Presenter of the summarized graph is its presenter
+     attribute.'''
+
+     def __init__(self, calls, partition):
+          # partition: original func --> super-node name (its own name if not collapsed)
+          self._calls = calls
+          self._partition = partition
+          names = list(_OrderedDict.fromkeys(partition[func] for func in _all_functions(calls)))
+          number = {name: i for i, name in enumerate(names)}
+          self._quotient = _Quotient(calls, {func: number[name] for func, name in partition.items()}, names)
+          self._members = {name: tuple(self._quotient.members[number[name]]) for name in names}
+          self._number = number
+
+          # A super-node is "defined" if any of its members is
+          data = _OrderedDict()
+          for block, name in enumerate(names):
+               if any(func in calls for func in self._quotient.members[block]):
+                    data[name] = tuple(names[child] for child in self._quotient.succ[block])
+          self.presenter = Presenter(data)
+
+     def nodes(self):
+          '''Returns the names of the nodes of the summarized graph'''
+          return tuple(self._members)
+
+     def members(self, node):
+          '''Returns the original functions a node of the summarized graph stands for'''
+          return self._members[node]
+
+     def is_super_node(self, node):
+          return self._members[node] != (node,)
+
+     def multiplicity(self, caller, callee):
+          '''Returns how many original calls the given summarized edge stands for'''
+          return self._quotient.succ[self._number[caller]].get(self._number[callee], 0)
+
+     def expand(self, node):
+          '''Returns a new Summary with the given super-node split back into its members
+          (which may well put it over the budget again)'''
+          partition = dict(self._partition)
+          for func in self._members[node]:
+               partition[func] = func
+          return self.__class__(self._calls, partition)
+
+     def call_dict(self):
+          return self.presenter.call_dict()
+
+     def to_plain_text(self, indent='      '):
+          return self.presenter.to_plain_text(indent)
+
+     __str__ = to_plain_text
+
+     def to_graphviz(self):
+          '''Like Presenter.to_graphviz, except super-nodes are boxes labeled with their
+          member count, and edges are labeled with how many calls they stand for'''
+          global _gv
+          if _gv is None:
+               import graphviz as _gv
+          graph = _gv.Digraph(graph_attr=Presenter._graph_attr, node_attr=Presenter._node_attr)
+          self._fill_graph(graph)
+          self.graphviz = graph
+          return graph
+
+     def write_dot(self, out):
+          '''Writes the graph of to_graphviz as DOT source to the text file object out,
+          as Presenter.write_dot'''
+          with _dot.DotWriter(out, graph_attr=Presenter._graph_attr, node_attr=Presenter._node_attr) as graph:
+               self._fill_graph(graph)
+
+     def _fill_graph(self, graph):
+          quotient = self._quotient
+          for block, name in enumerate(quotient.labels):
+               if self.is_super_node(name):
+                    graph.node(name, shape='box', color='darkgreen')
+               else:
+                    graph.node(name)
+               for child, multiplicity in quotient.succ[block].items():
+                    if multiplicity > 1:
+                         graph.edge(name, quotient.labels[child], label=str(multiplicity),
+                                    penwidth=str(min(1 + multiplicity ** 0.5, 8)))
+                    else:
+                         graph.edge(name, quotient.labels[child])
+
+     def graphviz_render(self, format, filename):
+          '''Renders the summary via graphviz, writing to "{filename}.{format}" (streaming
+          the source to dot, unless to_graphviz has been called)'''
+          graph = getattr(self, 'graphviz', None)
+          if graph is None:
+               _dot.render(self._fill_graph, format, filename + '.' + format,
+                           graph_attr=Presenter._graph_attr, node_attr=Presenter._node_attr)
+               return
+          with open(filename + '.' + format, 'wb') as f:
+               f.write(graph.pipe(format))
+
+
+def summarize(graph, budget=500, groups=None, stages=STAGES):
+     '''Summarizes a Presenter (or a call dict) down to at most budget nodes (at most,
+     that is, if the 'depth' stage is included). groups optionally maps function names to
+     group names (or is a function doing so), for the 'groups' stage. Returns a Summary.'''
+     calls = graph.call_dict() if isinstance(graph, Presenter) else graph
+     for stage in stages:
+          if stage not in _STAGE_FUNCS:
+               raise ValueError('unknown summarization stage {!r}'.format(stage))
+
+     funcs = _all_functions(calls)
+     block_of = {func: i for i, func in enumerate(funcs)}
+     labels = list(funcs)
+     for stage in stages:
+          if len(labels) <= budget:
+               break
+          quotient = _Quotient(calls, block_of, labels)
+          merges = _STAGE_FUNCS[stage](quotient, budget, groups)
+          if merges:
+               block_of, labels = _merge(quotient, block_of, merges)
+     return Summary(calls, {func: labels[block] for func, block in block_of.items()})
@@ -0,0 +1,310 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+'''A runtime alternative to the parsers: rather than guessing the call graph from the
+source, record the calls a running program actually makes. This catches dynamic
+dispatch, callbacks and the like, and doesn't over approximate attribute calls.
+
+     tracer = CallTracer()
+     with tracer:
+          run_the_program()
+     dic, weights = tracer.result()
+     presenter = Presenter(dic)
+
+The call dict is in the same form the parsers produce (caller name --> tuple of
+callee names, in order of first call). The weights map each (caller, callee) edge
+to a (calls, seconds) pair, where seconds is the cumulative time spent in the callee
+when called from the caller.
+
+There are two modes. The default "exact" mode sees every call of Python code, via
+sys.monitoring on Python 3.12+ or else sys.setprofile. The "sample" mode instead has
+a background thread inspect every thread's stack each interval; it costs next to
+nothing, but only sees the calls that were on some stack at a sampling instant, and
+its counts are the number of samples an edge was seen in (so seconds = samples *
+interval is an estimate of the inclusive time).
+
+Exact mode is cheap enough on 3.12+, but sys.setprofile calls back into Python on
+every call and return, and a call-heavy loop runs some 25-30 times slower under it,
+far beyond the 10-20% overhead a tracer should add. Before 3.12, use sample mode for
+anything but small runs.
+
+Only Python functions are seen, not builtins or C extension functions.'''
+
+import sys as _sys
+import threading as _threading
+import time as _time
+from array import array as _array
+from collections import OrderedDict as _OrderedDict
+
+_perf_counter = _time.perf_counter
+_get_ident = _threading.get_ident
+
+
+class CallTracer:
+     '''Records caller --> callee edges with call counts and cumulative times. Use it as
+     a context manager, or call start() and stop(). It can be started and stopped
+     repeatedly; the counts accumulate until reset().
+
+     names selects how functions are named: 'qualname' (the default, e.g. Class.method),
+     'name' (the bare name, as the static parsers do it) or 'full' (module:qualname).'''
+
+     top_level = '__traced__' # The fake caller of calls made from outside any traced function
+
+     def __init__(self, mode='exact', interval=0.005, names='qualname'):
+          if mode not in ('exact', 'sample'):
+               raise ValueError('mode must be "exact" or "sample" (got {!r})'.format(mode))
+          if names not in ('qualname', 'name', 'full'):
+               raise ValueError('names must be "qualname", "name" or "full" (got {!r})'.format(names))
+          self.mode = mode
+          self.interval = interval
+          self.names = names
+          self._running = False
+          self.reset()
+
+     def reset(self):
+          '''Forgets everything recorded so far'''
+          # Functions are interned to small ints, and each edge (a pair of those packed
+          # into one int) to an index into the flat, preallocated counter arrays, so that
+          # the hot path is two dict lookups and two array updates
+          self._code_ids = {None: 0} # code object --> id
+          self._codes = [None]       # id --> code object (None for the top level)
+          self._edge_ids = {}   # caller id << 32 | callee id --> edge index
+          self._edges = []      # edge index --> (caller id, callee id)
+          self._counts = _array('Q', bytes(8 * 1024))
+          self._times = _array('d', bytes(8 * 1024))
+          self._stacks = {}     # thread ident --> list of (edge index, start time)
+          self._lock = _threading.Lock() # Only taken for new functions and edges
+
+     def _intern(self, code):
+          with self._lock:
+               ident = self._code_ids.get(code)
+               if ident is None:
+                    ident = self._code_ids[code] = len(self._codes)
+                    self._codes.append(code)
+               return ident
+
+     def _edge(self, caller, callee):
+          key = caller << 32 | callee
+          index = self._edge_ids.get(key)
+          if index is None:
+               with self._lock:
+                    index = self._edge_ids.get(key)
+                    if index is None:
+                         if len(self._edges) >= len(self._counts): # Double the preallocation
+                              self._counts.extend(_array('Q', bytes(8 * len(self._counts))))
+                              self._times.extend(_array('d', bytes(8 * len(self._times))))
+                         index = len(self._edges)
+                         self._edges.append((caller, callee))
+                         self._edge_ids[key] = index
+          return index
+
+     ###########################################################################
+     # Starting and stopping
+
+     def start(self):
+          if self._running:
+               raise RuntimeError('tracer is already running')
+          self._running = True
+          if self.mode == 'sample':
+               self._stop_sampling = _threading.Event()
+               self._sampler = _threading.Thread(target=self._sample_loop, name='call-sampler', daemon=True)
+               self._sampler.start()
+          elif hasattr(_sys, 'monitoring'):
+               self._start_monitoring()
+          else:
+               _threading.setprofile(self._profile)
+               _sys.setprofile(self._profile)
+
+     def stop(self):
+          if not self._running:
+               return
+          if self.mode == 'sample':
+               self._stop_sampling.set()
+               self._sampler.join()
+          elif hasattr(_sys, 'monitoring'):
+               self._stop_monitoring()
+          else:
+               _sys.setprofile(None)
+               _threading.setprofile(None)
+          self._stacks.clear() # Calls in progress when stopped never finish, as far as we know
+          self._running = False
+
+     def __enter__(self):
+          self.start()
+          return self
+
+     def __exit__(self, *exc):
+          self.stop()
+          return False
+
+     ###########################################################################
+     # The exact mode. Each thread has a shadow stack of the edges it's currently in.
+
+     def _enter(self, code, frame=None):
+          # frame is the new call's frame; it's only needed (to find the caller) for the
+          # first call seen on each thread, and if not given we dig it out ourselves
+          stack = self._stacks.get(_get_ident())
+          if stack is None:
+               stack = self._stacks[_get_ident()] = []
+          try:
+               callee = self._code_ids[code]
+          except KeyError:
+               callee = self._intern(code)
+          if stack:
+               caller = self._edges[stack[-1][0]][1]
+          else:
+               if frame is None:
+                    frame = _sys._getframe(2) # Above us and the monitoring callback
+               caller = self._code_ids.get(frame.f_back.f_code if frame.f_back is not None else None)
+               if caller is None:
+                    caller = 0 # The top level
+          index = self._edge(caller, callee)
+          self._counts[index] += 1
+          stack.append((index, _perf_counter()))
+
+     def _leave(self):
+          stack = self._stacks.get(_get_ident())
+          if stack: # Empty for returns from functions already running when we started
+               index, start = stack.pop()
+               self._times[index] += _perf_counter() - start
+
+     def _start_monitoring(self):
+          monitoring = _sys.monitoring
+          events = monitoring.events
+          self._tool = monitoring.PROFILER_ID
+          monitoring.use_tool_id(self._tool, 'codeschematics')
+          enter, leave = self._enter, self._leave
+          def on_start(code, offset):
+               enter(code)
+          def on_return(code, offset, retval):
+               leave()
+          def on_unwind(code, offset, exc):
+               leave()
+          # A resumed generator continues the same call, so it isn't counted again
+          def on_resume(code, offset):
+               enter(code)
+               self._counts[self._stacks[_get_ident()][-1][0]] -= 1
+          monitoring.register_callback(self._tool, events.PY_START, on_start)
+          monitoring.register_callback(self._tool, events.PY_RESUME, on_resume)
+          monitoring.register_callback(self._tool, events.PY_RETURN, on_return)
+          monitoring.register_callback(self._tool, events.PY_YIELD, on_return)
+          monitoring.register_callback(self._tool, events.PY_UNWIND, on_unwind)
+          monitoring.set_events(self._tool, events.PY_START | events.PY_RESUME | events.PY_RETURN
+                                          | events.PY_YIELD | events.PY_UNWIND)
+
+     def _stop_monitoring(self):
+          monitoring = _sys.monitoring
+          monitoring.set_events(self._tool, 0)
+          for event in (monitoring.events.PY_START, monitoring.events.PY_RESUME, monitoring.events.PY_RETURN,
+                        monitoring.events.PY_YIELD, monitoring.events.PY_UNWIND):
+               monitoring.register_callback(self._tool, event, None)
+          monitoring.free_tool_id(self._tool)
+
+     def _profile(self, frame, event, arg):
+          # sys.setprofile sees a generator's every resumption as a new call, so
+          # generators' counts are inflated in this fallback
+          if event == 'call':
+               self._enter(frame.f_code, frame)
+          elif event == 'return':
+               self._leave()
+
+     ###########################################################################
+     # The sampling mode
+
+     def _sample_loop(self):
+          me = _get_ident()
+          interval = self.interval
+          while not self._stop_sampling.wait(interval):
+               for ident, frame in _sys._current_frames().items():
+                    if ident == me:
+                         continue
+                    # Walk from the innermost frame outwards; each edge on the stack is
+                    # counted once per sample, however deep the recursion
+                    edges = []
+                    callee = None
+                    while frame is not None:
+                         code = frame.f_code
+                         if code.co_filename == __file__:
+                              # Our own stop(), and whatever it's waiting in (Thread.join and
+                              # so on), aren't the program's calls
+                              edges.clear()
+                              callee = None
+                              frame = frame.f_back
+                              continue
+                         try:
+                              caller = self._code_ids[code]
+                         except KeyError:
+                              caller = self._intern(code)
+                         if callee is not None:
+                              edges.append((caller, callee))
+                         callee = caller
+                         frame = frame.f_back
+                    for index in set(self._edge(caller, callee) for caller, callee in edges):
+                         self._counts[index] += 1
+                         self._times[index] += interval
+
+     ###########################################################################
+     # The results
+
+     def _name(self, code):
+          if code is None:
+               return self.top_level
+          if code.co_name == '<module>':
+               return '__module__' if self.names != 'full' else code.co_filename + ':__module__'
+          if self.names == 'name':
+               return code.co_name
+          qualname = getattr(code, 'co_qualname', code.co_name) # 3.11+
+          if self.names == 'full':
+               return '{}:{}'.format(code.co_filename, qualname)
+          return qualname
+
+     def result(self):
+          '''Returns a tuple of (call dict, weights), where the call dict is an OrderedDict
+          of caller name --> tuple of callee names, and weights is a dict of
+          (caller name, callee name) --> (calls, seconds). If several code objects share a
+          name (which depends on the names setting), their edges are combined.'''
+          names = [self._name(code) for code in self._codes]
+          dic = _OrderedDict()
+          weights = {}
+          codes = self._codes
+          for index, (caller, callee) in enumerate(self._edges):
+               if codes[callee].co_filename == __file__ or (caller and codes[caller].co_filename == __file__):
+                    continue # Our own stop() and the like
+               caller, callee = names[caller], names[callee]
+               # Every function seen is "defined", even if it calls nothing
+               dic.setdefault(callee, [])
+               calls = dic.setdefault(caller, [])
+               key = (caller, callee)
+               if key in weights:
+                    count, seconds = weights[key]
+                    weights[key] = (count + self._counts[index], seconds + self._times[index])
+               else:
+                    calls.append(callee)
+                    weights[key] = (self._counts[index], self._times[index])
+          return _OrderedDict((func, tuple(calls)) for func, calls in dic.items()), weights
+
+
+def trace(func, *args, **kwargs):
+     '''Convenience function: runs func(*args, **kwargs) under an exact CallTracer, and
+     returns (func's return value, call dict, weights)'''
+     tracer = CallTracer()
+     with tracer:
+          ret = func(*args, **kwargs)
+     dic, weights = tracer.result()
+     return ret, dic, weights
@@ -0,0 +1,59 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Many roots and loops (some with children), so that both the parentless functions
+# and the loop roots have to be settled
+_RENDER = '''
+import random
+import sys
+from collections import OrderedDict
+from codeschematics.presentation import Presenter
+rand = random.Random(7)
+data = OrderedDict()
+for i in range(400):
+     data['f{}'.format(i)] = tuple(OrderedDict.fromkeys('f{}'.format(rand.randrange(420))
+                                                         for _ in range(rand.randrange(4))))
+presenter = Presenter(data)
+presenter.write_dot(sys.stdout)
+presenter.write_dot(sys.stdout, ranks='longest')
+'''
+
+
+def _render(seed):
+     env = dict(os.environ, PYTHONHASHSEED=str(seed), PYTHONPATH=ROOT)
+     return subprocess.run([sys.executable, '-c', _RENDER], env=env, stdout=subprocess.PIPE, check=True).stdout
+
+
+class TestDeterminism(unittest.TestCase):
+
+     def test_dot_independent_of_hash_seed(self):
+          first = _render(1)
+          self.assertIn(b'digraph {', first)
+          self.assertEqual(first, _render(2))
+
+
+if __name__ == '__main__':
+     unittest.main()
@@ -0,0 +1,49 @@
+# Note: tab depth is 5, as a personal preference
+
+
+#    Copyright (C) 2014-2015 Bill Winslow
+#
+#    This module is a part of the CodeSchematics package.
+#
+#    This program is libre software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#    See the LICENSE file for more details.
+
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codeschematics.profiles import collapsed_call_dict
+
+
+class TestCollapsed(unittest.TestCase):
+
+     def test_stacks(self):
+          dic, weights, costs = collapsed_call_dict(['main;a;b 3\n', '\n', 'main;a 1.5\n'])
+          self.assertEqual(dic['main'], ('a',))
+          self.assertEqual(dic['a'], ('b',))
+          self.assertEqual(weights['main', 'a'], (4.5, 4.5))
+          self.assertEqual(costs['b'], 3)
+
+     def test_malformed_line(self):
+          for bad in ('main;a;b three\n', 'main;a;b\n'):
+               lines = io.StringIO('main;a 1\n\n' + bad)
+               lines.name = 'stacks.txt'
+               with self.assertRaises(ValueError) as caught:
+                    collapsed_call_dict(lines)
+               self.assertIn('stacks.txt, line 3', str(caught.exception))
+
+
+if __name__ == '__main__':
+     unittest.main()
@@ -1,9 +1,8 @@
 #! /usr/bin/env python3
 
-from codeschematics.parsers.c_parser import CTraverser
-from codeschematics.parsers.fake_libc_include import find_fake_libc_include
+from codeschematics.merge import merge
+from codeschematics.parsers.c_parser import make_call_dict
 from codeschematics.presentation import Presenter
-from pycparser import c_ast, c_parser, preprocess_file, parse_file
 
 from sys import argv
 from os.path import basename, join
@@ -29,28 +28,16 @@ files = [join(main_dir, f) for f in files.split()]
 
 #dic, nested = make_call_dict(filepath, include_dirs=includes) # Ignore the nested funcs retval
 
-cpp_args = []
-dname = find_fake_libc_include()
-cpp_args += ['-nostdinc', "-I{}".format(dname)]
-cpp_args += ["-I{}".format(idir) for idir in includes]
-cpp_args += ['-D__attribute__(x)=', '-D__inline__=', '-D__inline=', '-Dvolatile=', '-D__asm__(x,y)=']
-from subprocess import Popen, PIPE
+defines = ['__attribute__(x)=', '__inline__=', '__inline=', 'volatile=', '__asm__(x,y)=']
 
-ast = parse_file(files[0], use_cpp=True, cpp_args=cpp_args)
+# Parse each file on its own and merge the call graphs, rather than concatenating the ASTs
+results = []
+for f in files:
+     print(f)
+     results.append(make_call_dict(f, include_dirs=includes, defines=defines, header_cache=True))
 
-for f in files[1:]:
-     path_list = ['cpp'] + cpp_args + [f]
-     print(' '.join(path_list))
-     pipe = Popen(path_list, stdout=PIPE, universal_newlines=True)
-     text = pipe.communicate()[0]
-     with open('tmpyafu.c', 'w') as fasdf:
-          fasdf.write(text)
-     ast.ext += parse_file(f, use_cpp=True, cpp_args=cpp_args).ext
-
-visitor = CTraverser()
-visitor.visit(ast)
-
-tree = Presenter(visitor.result())
+dic, nested = merge(results)
+tree = Presenter(dic)
 
 fname = 'libyafu'
 tree = tree.default_filter()